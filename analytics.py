@@ -0,0 +1,159 @@
+"""
+과거 시프트 분석 (컬럼형 Parquet)
+- 공개된 시프트를 1행 = (property, 날짜, 스태프) long 포맷으로 Parquet 적재
+  root/property=<prop>/year=<yyyy>/<mm>.parquet (hive 파티션 -> 시설/연도 필터가 파일 단위로 끝남)
+- category 는 build_summary 와 같은 구분: night(야근코드) / L1 / day(그 외 주간) / 日 / 明 / 公
+- fairness_report(): 전부 벡터화 groupby (연간 야근 코드별 횟수, 주말 公, 明 연속, 公 목표 편차, 희망 반영률)
+- night_history(): 직전 N개월 야근 횟수 -> solver 의 야근 공평성(fairness) history
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import store
+from shift_solver import OFF_CODE, MYONG_CODE, WEEKEND_KEY
+
+DEFAULT_ANALYTICS_DIR = os.environ.get("SHIFT_ANALYTICS_DIR", "analytics")
+CATEGORIES = ["night", "L1", "day", "日", MYONG_CODE, OFF_CODE, "other"]
+
+def categorize(codes, shifts_day, shifts_night):
+    """코드 Series -> category Series (build_summary 와 같은 분류)"""
+    mapping = {c: "day" for c in shifts_day}
+    mapping.update({c: "night" for c in shifts_night})
+    mapping.update({"L1": "L1", "日": "日", MYONG_CODE: MYONG_CODE, OFF_CODE: OFF_CODE})
+    return pd.Categorical(codes.map(mapping).fillna("other"), categories=CATEGORIES)
+
+def month_frame(conn, year, month, shifts_day, shifts_night, prop=store.DEFAULT_PROPERTY):
+    """store 의 공개 시프트 1개월 -> long DataFrame (희망 / target_off 포함)"""
+    sched = pd.read_sql_query(
+        "SELECT day, name, code FROM schedules WHERE property = ? AND year = ? AND month = ?",
+        conn, params=(prop, year, month))
+    reqs = pd.read_sql_query(
+        "SELECT day, name, code AS requested FROM requests WHERE property = ? AND year = ? AND month = ?",
+        conn, params=(prop, year, month))
+    staff = pd.read_sql_query("SELECT name, target_off FROM staff WHERE property = ?", conn, params=(prop,))
+
+    df = sched.merge(reqs, on=["day", "name"], how="left").merge(staff, on="name", how="left")
+    dates = pd.to_datetime(dict(year=year, month=month, day=df["day"]))
+    return pd.DataFrame({
+        "property": pd.Categorical([prop] * len(df)),
+        "year": np.int16(year),
+        "month": np.int8(month),
+        "day": df["day"].astype("int8"),
+        "date": dates,
+        "weekday": dates.dt.weekday.astype("int8"),
+        "name": pd.Categorical(df["name"]),
+        "code": pd.Categorical(df["code"]),
+        "category": categorize(df["code"], shifts_day, shifts_night),
+        "requested": df["requested"].astype("string"),
+        "target_off": df["target_off"].astype("Int8"),
+    })
+
+def export_month(conn, year, month, shifts_day, shifts_night, prop=store.DEFAULT_PROPERTY,
+                 root=DEFAULT_ANALYTICS_DIR):
+    df = month_frame(conn, year, month, shifts_day, shifts_night, prop)
+    folder = os.path.join(root, f"property={prop}", f"year={year}")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{month:02d}.parquet")
+    # 파티션 키(property/year)는 경로에 있으므로 파일에서는 제외
+    df.drop(columns=["property", "year"]).to_parquet(path, index=False, compression="zstd")
+    return path
+
+def export_all(conn, shifts_day, shifts_night, root=DEFAULT_ANALYTICS_DIR):
+    """store 에 공개된 모든 달을 Parquet 로 (재)적재"""
+    return [export_month(conn, y, m, shifts_day, shifts_night, p, root) for p, y, m, _ in store.list_published(conn)]
+
+def load_history(root=DEFAULT_ANALYTICS_DIR, properties=None, years=None):
+    if not os.path.isdir(root):
+        return pd.DataFrame()
+    filters = []
+    if properties:
+        filters.append(("property", "in", list(properties)))
+    if years:
+        filters.append(("year", "in", [int(y) for y in years]))
+    df = pd.read_parquet(root, filters=filters or None)
+    df["year"] = df["year"].astype("int16")
+    return df
+
+def fairness_report(df):
+    """
+    long DataFrame -> {표 이름: DataFrame}, 인덱스 = (property, year, name)
+    - night_by_code: 야근 코드별 횟수
+    - weekend_off  : 토/일 公 횟수
+    - myong        : 明 횟수 / 최장 야근→明 반복 / 2회 이상 반복 횟수
+    - off_target   : 월별 公 - target_off 의 평균 / 평균 절대 편차
+    - requests     : 희망 수 / 반영 수 / 반영률
+    """
+    if df.empty:
+        return {}
+    keys = ["property", "year", "name"]
+    g = dict(observed=True, sort=True)
+
+    night = df[df["category"] == "night"]
+    night_by_code = night.groupby(keys + ["code"], **g).size().unstack("code", fill_value=0)
+    night_by_code = night_by_code.loc[:, night_by_code.sum() > 0]
+    night_by_code["合計"] = night_by_code.sum(axis=1)
+
+    weekend_off = (df[(df["weekday"] >= 5) & (df["code"] == OFF_CODE)]
+                   .groupby(keys, **g).size().rename("週末公").to_frame())
+
+    # 明 연속: 明 다음날 明 은 불가하므로 "야근→明" 이 이틀 간격으로 반복된 구간을 1 run 으로 봄
+    m = df[df["code"] == MYONG_CODE].sort_values(["property", "name", "date"])
+    prop_arr, name_arr = m["property"].to_numpy(), m["name"].to_numpy()
+    cont = np.zeros(len(m), dtype=bool)
+    cont[1:] = ((prop_arr[1:] == prop_arr[:-1]) & (name_arr[1:] == name_arr[:-1])
+                & (np.diff(m["date"].to_numpy()) == np.timedelta64(2, "D")))
+    run_len = m[keys].assign(run=np.cumsum(~cont)).groupby(keys + ["run"], **g).size()
+    myong = pd.DataFrame({
+        "明回数": run_len.groupby(level=keys, **g).sum(),
+        "明最長連続": run_len.groupby(level=keys, **g).max(),
+        "明連続(2回以上)": (run_len >= 2).groupby(level=keys, **g).sum(),
+    })
+
+    monthly = df.assign(is_off=df["code"] == OFF_CODE).groupby(keys + ["month"], **g).agg(
+        off=("is_off", "sum"), target=("target_off", "first"))
+    dev = monthly["off"] - monthly["target"].astype("float")
+    off_target = pd.DataFrame({"dev": dev, "absdev": dev.abs()}).groupby(level=keys, **g).mean()
+    off_target.columns = ["公偏差平均", "公偏差絶対平均"]
+
+    req = df[df["requested"].notna()]
+    hit = (req["requested"] == req["code"].astype("string")).rename("hit")
+    requests = req.assign(hit=hit).groupby(keys, **g)["hit"].agg(希望数="size", 反映数="sum")
+    requests["反映率"] = requests["反映数"] / requests["希望数"]
+
+    return {
+        "night_by_code": night_by_code,
+        "weekend_off": weekend_off,
+        "myong": myong,
+        "off_target": off_target,
+        "requests": requests,
+    }
+
+def night_history(df, shifts_night, year, month, months):
+    """
+    long DataFrame -> year/month 직전 months 개월의 야근 횟수 {name: {code: n, ..., "weekend": n}}
+    - 코드는 현재 shifts_night 기준 (category 는 적재 당시 분류라서 안 씀)
+    """
+    if df.empty or months <= 0:
+        return {}
+    ym = df["year"].astype(int) * 12 + df["month"].astype(int)
+    end = year * 12 + month
+    df = df[(ym >= end - months) & (ym < end) & df["code"].astype(str).isin(list(shifts_night))]
+    if df.empty:
+        return {}
+    by_code = df.groupby(["name", "code"], observed=True).size().unstack("code", fill_value=0)
+    by_code[WEEKEND_KEY] = df[df["weekday"] >= 5].groupby("name", observed=True).size()
+    by_code = by_code.fillna(0).astype(int)
+    return {str(name): {str(c): int(n) for c, n in row.items() if n} for name, row in by_code.iterrows()}
+
+def store_night_history(conn, year, month, months, shifts_night, prop=store.DEFAULT_PROPERTY):
+    """store 의 공개 시프트로 night_history (Parquet 적재 없이 앱/배치에서 사용)"""
+    frames = []
+    y, m = year, month
+    for _ in range(max(0, months)):
+        y, m = store.prev_month(y, m)
+        frames.append(month_frame(conn, y, m, [], shifts_night, prop))
+    frames = [f for f in frames if not f.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return night_history(df, shifts_night, year, month, months)
@@ -1,16 +1,27 @@
 import streamlit as st
 import pandas as pd
-from ortools.sat.python import cp_model
-import io
-import datetime
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+import json
+
+import shift_solver
+import snapshot
+import store
+import analytics
+import excel_export
+import personal_export
+import result_cache
+from shift_solver import (
+    OFF_CODE, MYONG_CODE, norm_code, build_day_headers, validate_mandatory_coverage,
+    fixed_cells_from_table, FeasibleOptionsIndex, base_assignment_diff, stage1_base_codes,
+    COVERAGE_RULE_COLUMNS, coverage_rule_error, default_coverage_rules, normalize_coverage_rules,
+    unknown_coverage_codes,
+    REQUEST_RULE_COLUMNS, default_request_rules, normalize_request_rules, requests_to_cells, request_weights,
+    denied_requests, FAIRNESS_DEFAULTS, WEEKEND_KEY, night_spread,
+)
 
 # =========================================================
 # ✅ 0) VERSION (key busting)
 # =========================================================
-APP_VERSION = "2026.01.28.v3"   # <- 형이 수정할 때마다 문자열 바꾸면 100% 새로 반영됨
+APP_VERSION = "2026.10.19.v1"   # <- 형이 수정할 때마다 문자열 바꾸면 100% 새로 반영됨
 
 def versioned(key: str) -> str:
     return f"{key}__{APP_VERSION}"
@@ -20,6 +31,7 @@ def reset_all_except_password():
     if st.session_state.get("password_correct") is True:
         keep["password_correct"] = True
     st.cache_data.clear()
+    get_result_cache().clear()
     st.session_state.clear()
     for k, v in keep.items():
         st.session_state[k] = v
@@ -70,28 +82,20 @@ if not check_password():
 ensure_version_fresh()
 
 # =========================================================
-# 1) Base Config
+# 1) Base Config (코드 상수/솔버는 shift_solver.py)
 # =========================================================
-OFF_CODE = "公"
-MYONG_CODE = "-"     # 明け
-UNASSIGNED_CODE = "未"  # Stage1 내부용(표시는 빈칸)
-WEEKDAY_CHARS = ["月", "火", "水", "木", "金", "土", "日"]
-
 def remove_D_from_shift_lists():
     st.session_state["shifts_day"] = [c for c in st.session_state["shifts_day"] if c != "D"]
     st.session_state["shifts_night"] = [c for c in st.session_state["shifts_night"] if c != "D"]
 
 # 최초 진입(또는 강제리셋) 시에만 기본값 세팅
 if "init_done" not in st.session_state:
-    st.session_state["shifts_day"] = ["E1", "E2", "G1", "G1U", "H1", "H2", "I1", "I2", "L1"]
-    st.session_state["shifts_night"] = ["Q1", "X1", "R1"]  # ✅ 야근 3코드 (각 1명/일)
+    st.session_state["shifts_day"] = list(shift_solver.DEFAULT_SHIFTS_DAY)
+    st.session_state["shifts_night"] = list(shift_solver.DEFAULT_SHIFTS_NIGHT)  # ✅ 야근 3코드 (각 1명/일)
     st.session_state["init_done"] = True
 
 remove_D_from_shift_lists()
 
-SPECIAL_CODES = ["日", MYONG_CODE, OFF_CODE]
-SPECIAL_CODES_STAGE1 = ["日", MYONG_CODE, OFF_CODE, UNASSIGNED_CODE]
-
 # =========================================================
 # Staff DB (야근 가능코드 반영)
 # =========================================================
@@ -122,46 +126,6 @@ INITIAL_STAFF_DB = [
 # =========================================================
 # Helpers
 # =========================================================
-def norm_code(x):
-    if pd.isna(x):
-        return ""
-    s = str(x).strip()
-    if s == "":
-        return ""
-    if s.upper() == "OFF" or s in ["休", "公休"]:
-        return OFF_CODE
-    if s == "明":
-        return MYONG_CODE
-    if s == "D":
-        return ""   # ✅ D 제거
-    return s
-
-def build_day_headers(year, month, num_days):
-    headers = []
-    for d in range(num_days):
-        cur_date = datetime.date(year, month, d + 1)
-        w_str = WEEKDAY_CHARS[cur_date.weekday()]
-        headers.append(f"{d + 1}日({w_str})")
-    return headers
-
-def parse_skills(skill_str: str):
-    if skill_str is None:
-        return set()
-    s = str(skill_str).replace("明", MYONG_CODE).replace("OFF", OFF_CODE)
-    items = [x.strip() for x in s.split(",") if x.strip()]
-    items = [x for x in items if x != "D"]
-    return set(items)
-
-def validate_mandatory_coverage(staff_data, shifts_day, shifts_night):
-    required = list(shifts_night) + (["L1"] if "L1" in shifts_day else [])
-    skill_map = {s["name"]: parse_skills(s.get("skills", "")) for s in staff_data}
-    missing = []
-    for code in required:
-        eligible = [name for name, sk in skill_map.items() if code in sk]
-        if len(eligible) == 0:
-            missing.append(code)
-    return missing
-
 def summarize_requests(requests, shifts_day, shifts_night):
     cnt_off = cnt_night = cnt_l1 = cnt_daywish = cnt_nichi = 0
     for _, mp in requests.items():
@@ -184,96 +148,60 @@ def summarize_requests(requests, shifts_day, shifts_night):
         "日希望": cnt_nichi,
     }
 
+def prev_history_from_editor(prev_editor, prev_cols):
+    prev_history = {}
+    if not prev_editor.empty:
+        for staff_name in prev_editor.index:
+            prev_history[staff_name] = {}
+            for col in prev_cols:
+                prev_history[staff_name][col] = norm_code(prev_editor.loc[staff_name, col]) or OFF_CODE
+    return prev_history
+
+def requests_from_editor(edited_stage1):
+    requests = {}
+    if not edited_stage1.empty:
+        for staff_name in edited_stage1.index:
+            requests[staff_name] = {}
+            for day_col in edited_stage1.columns:
+                v = norm_code(edited_stage1.loc[staff_name, day_col])
+                if v == "":
+                    continue
+                day_num = int(day_col.replace("日", ""))
+                requests[staff_name][day_num] = v
+    return requests
+
+def memo(name, builder, *inputs):
+    """
+    입력 해시가 같으면 세션에 저장해 둔 파생 객체 재사용 (name 당 1칸이라 쌓이지 않음)
+    - 셀 1개 수정해도 그 입력에 걸린 것만 다시 만듦 (초기 표 / 결과 HTML / 가능코드 표 등)
+    """
+    key = result_cache.make_key(*inputs)
+    slots = st.session_state.setdefault("_memo", {})
+    slot = slots.get(name)
+    if slot is not None and slot[0] == key:
+        return slot[1]
+    value = builder()
+    slots[name] = (key, value)
+    return value
+
+def upload_id(uploaded):
+    return None if uploaded is None else uploaded.file_id
+
 # =========================================================
-# Excel Styling
+# Store (SQLite)
 # =========================================================
-def create_styled_excel(df_shift, df_summary, requests, year, month):
-    wb = Workbook()
-    ws_shift = wb.active
-    ws_shift.title = "Shift"
-
-    for r in dataframe_to_rows(df_shift, index=False, header=True):
-        ws_shift.append(r)
-
-    fill_off = PatternFill(start_color="F0F2F6", end_color="F0F2F6", fill_type="solid")
-    fill_night = PatternFill(start_color="FFCDD2", end_color="FFCDD2", fill_type="solid")
-    fill_myong = PatternFill(start_color="FFF9C4", end_color="FFF9C4", fill_type="solid")
-    fill_l1 = PatternFill(start_color="E1BEE7", end_color="E1BEE7", fill_type="solid")
-    fill_nichi = PatternFill(start_color="C8E6C9", end_color="C8E6C9", fill_type="solid")
-
-    fill_sat_bg = PatternFill(start_color="D6EAF8", end_color="D6EAF8", fill_type="solid")
-    fill_sun_bg = PatternFill(start_color="FADBD8", end_color="FADBD8", fill_type="solid")
-
-    thin_border = Border(
-        left=Side(style="thin"), right=Side(style="thin"),
-        top=Side(style="thin"), bottom=Side(style="thin")
-    )
-    center_align = Alignment(horizontal="center", vertical="center")
-
-    font_req = Font(bold=True, color="0000FF")
-    font_sat = Font(bold=True, color="0000FF")
-    font_sun = Font(bold=True, color="FF0000")
-
-    night_codes = st.session_state["shifts_night"]
-
-    header_row = ws_shift[1]
-    for cell in header_row:
-        cell.alignment = center_align
-        cell.border = thin_border
-        val = str(cell.value)
-        if "(" in val:
-            if "(土)" in val:
-                cell.font = font_sat
-                cell.fill = fill_sat_bg
-            elif "(日)" in val:
-                cell.font = font_sun
-                cell.fill = fill_sun_bg
-
-    for row in ws_shift.iter_rows(min_row=2, max_row=ws_shift.max_row, min_col=1, max_col=ws_shift.max_column):
-        staff_name = str(row[0].value)
-        for cell in row:
-            cell.alignment = center_align
-            cell.border = thin_border
-            val = str(cell.value)
-            col_idx = cell.column
-
-            if val == OFF_CODE:
-                cell.fill = fill_off
-                cell.font = Font(color="BDC3C7")
-            elif val in night_codes:
-                cell.fill = fill_night
-                cell.font = Font(color="B71C1C")
-            elif val == MYONG_CODE:
-                cell.fill = fill_myong
-                cell.font = Font(color="F57F17")
-            elif val == "L1":
-                cell.fill = fill_l1
-            elif val == "日":
-                cell.fill = fill_nichi
-                cell.font = Font(bold=True)
-
-            if col_idx > 2:
-                day_num = col_idx - 2
-                if staff_name in requests and day_num in requests[staff_name]:
-                    if requests[staff_name][day_num] == val:
-                        cell.font = font_req
-
-    ws_summary = wb.create_sheet("Summary")
-    for r in dataframe_to_rows(df_summary, index=False, header=True):
-        ws_summary.append(r)
-
-    fill_alert = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-    for row in ws_summary.iter_rows(min_row=2, max_row=ws_summary.max_row, min_col=2, max_col=ws_summary.max_column):
-        for cell in row:
-            cell.alignment = center_align
-            cell.border = thin_border
-            if cell.value == 0:
-                cell.fill = fill_alert
-                cell.font = Font(color="FF0000", bold=True)
-
-    output = io.BytesIO()
-    wb.save(output)
-    return output.getvalue()
+def get_store():
+    # 세션마다 연결 1개 (cache_resource 로 공유하면 세션끼리 with conn: 트랜잭션이 한 연결 위에서 섞임)
+    conn = st.session_state.get("_store_conn")
+    if conn is None:
+        conn = st.session_state["_store_conn"] = store.connect()
+    return conn
+
+def publish_to_store(prop, year, month, df_result, day_headers, run_info):
+    # on_click 콜백: 버튼 클릭 rerun 에서는 Stage2 결과 블록이 다시 안 그려지므로
+    n = store.publish_schedule(get_store(), year, month, df_result, day_headers, run_info, prop)
+    analytics.export_month(get_store(), year, month, st.session_state["shifts_day"], st.session_state["shifts_night"], prop)
+    st.session_state["published_msg"] = f"✅ {prop} {year}/{month} を公開しました（{n}セル）。翌月の前月履歴に自動反映されます。"
 
 # =========================================================
 # HTML Table
@@ -335,436 +263,112 @@ def generate_colored_table_html(df, requests):
     return html
 
 # =========================================================
-# Solver (2-Stage)
+# Solver (2-Stage) — 본체는 shift_solver.py, 여기는 캐시 래퍼
 # =========================================================
-@st.cache_data(show_spinner=False)
-def solve_stage1(num_days, year, month, prev_history, requests, staff_data,
-                shifts_day, shifts_night, closed_days, _version_stamp: str):
-    """
-    Stage1:
-    - 입력된 (公/희망근무/야근/L1/日) 하드 고정
-    - ✅ 야근(Q1,X1,R1) 매일 각각 1명 하드
-    - ✅ L1 매일 1명 하드
-    - 나머지 주간은 未로 남기고 표시상 빈칸
-    """
-    model = cp_model.CpModel()
-    ALL_SHIFTS = shifts_day + shifts_night + SPECIAL_CODES_STAGE1
-    staff_indices = range(len(staff_data))
-    days_indices = range(num_days)
-    closed_idx = set([d - 1 for d in closed_days if 1 <= d <= num_days])
-
-    shifts = {}
-    for s in staff_indices:
-        for d in days_indices:
-            for code in ALL_SHIFTS:
-                shifts[(s, d, code)] = model.NewBoolVar(f"s{s}_d{d}_{code}")
-
-    for s in staff_indices:
-        for d in days_indices:
-            model.Add(sum(shifts[(s, d, c)] for c in ALL_SHIFTS) == 1)
-
-    for s in staff_indices:
-        allowed = parse_skills(staff_data[s].get("skills", "")) | {UNASSIGNED_CODE}
-        for d in days_indices:
-            for code in ALL_SHIFTS:
-                if code not in allowed:
-                    model.Add(shifts[(s, d, code)] == 0)
-
-    # prev month carry
-    for s_idx, staff in enumerate(staff_data):
-        name = staff["name"]
-        h_d1 = norm_code(prev_history.get(name, {}).get("d-1", OFF_CODE))
-        h_d2 = norm_code(prev_history.get(name, {}).get("d-2", OFF_CODE))
-        h_d3 = norm_code(prev_history.get(name, {}).get("d-3", OFF_CODE))
-
-        if h_d1 in shifts_night:
-            model.Add(shifts[(s_idx, 0, MYONG_CODE)] == 1)
-
-        if h_d1 == MYONG_CODE:
-            for day_code in shifts_day + ["日", MYONG_CODE]:
-                if day_code in ALL_SHIFTS:
-                    model.Add(shifts[(s_idx, 0, day_code)] == 0)
-
-        w_d3 = 1 if h_d3 != OFF_CODE else 0
-        w_d2 = 1 if h_d2 != OFF_CODE else 0
-        w_d1 = 1 if h_d1 != OFF_CODE else 0
-        c0 = 1 - shifts[(s_idx, 0, OFF_CODE)] if 0 < num_days else 0
-        c1 = 1 - shifts[(s_idx, 1, OFF_CODE)] if 1 < num_days else 0
-
-        model.Add(w_d3 + w_d2 + w_d1 + c0 + c1 <= 4)
-        if num_days >= 3:
-            c2 = 1 - shifts[(s_idx, 2, OFF_CODE)]
-            model.Add(w_d2 + w_d1 + c0 + c1 + c2 <= 4)
-        if num_days >= 4:
-            c2 = 1 - shifts[(s_idx, 2, OFF_CODE)]
-            c3 = 1 - shifts[(s_idx, 3, OFF_CODE)]
-            model.Add(w_d1 + c0 + c1 + c2 + c3 <= 4)
-
-    # night -> next day is 明(-)
-    for s in staff_indices:
-        for d in range(num_days - 1):
-            is_night = sum(shifts[(s, d, c)] for c in shifts_night if c in ALL_SHIFTS)
-            model.Add(shifts[(s, d + 1, MYONG_CODE)] == is_night)
-
-    # 明(-) -> next day cannot be day shift / 日 / 明
-    for s in staff_indices:
-        for d in range(num_days - 1):
-            for day_code in shifts_day + ["日", MYONG_CODE]:
-                if day_code in ALL_SHIFTS:
-                    model.AddImplication(shifts[(s, d, MYONG_CODE)], shifts[(s, d + 1, day_code)].Not())
-
-    # spacing night: d, d+2, d+4 <= 2
-    for s in staff_indices:
-        for d in range(num_days - 4):
-            n1 = sum(shifts[(s, d, c)] for c in shifts_night if c in ALL_SHIFTS)
-            n2 = sum(shifts[(s, d + 2, c)] for c in shifts_night if c in ALL_SHIFTS)
-            n3 = sum(shifts[(s, d + 4, c)] for c in shifts_night if c in ALL_SHIFTS)
-            model.Add(n1 + n2 + n3 <= 2)
-
-    # 5 days window work <= 4
-    for s in staff_indices:
-        for d in range(num_days - 4):
-            works = [1 - shifts[(s, d + k, OFF_CODE)] for k in range(5)]
-            model.Add(sum(works) <= 4)
-
-    # closed day: no night and no L1
-    for d in closed_idx:
-        for s in staff_indices:
-            for c in shifts_night:
-                model.Add(shifts[(s, d, c)] == 0)
-            if "L1" in ALL_SHIFTS:
-                model.Add(shifts[(s, d, "L1")] == 0)
-
-    # HARD: user requests
-    for s_idx, staff in enumerate(staff_data):
-        name = staff["name"]
-        if name not in requests:
-            continue
-        for day, req_code in requests[name].items():
-            if 1 <= day <= num_days:
-                d = day - 1
-                if req_code in ALL_SHIFTS:
-                    model.Add(shifts[(s_idx, d, req_code)] == 1)
-
-    # ✅ HARD: night each code exactly 1 (non-closed)
-    for d in days_indices:
-        if d in closed_idx:
-            continue
-        for code in shifts_night:
-            cnt = sum(shifts[(s, d, code)] for s in staff_indices)
-            model.Add(cnt == 1)
-
-    # ✅ HARD: L1 exactly 1 (non-closed)
-    if "L1" in ALL_SHIFTS:
-        for d in days_indices:
-            if d in closed_idx:
-                continue
-            l1_cnt = sum(shifts[(s, d, "L1")] for s in staff_indices)
-            model.Add(l1_cnt == 1)
-
-    # Objective: prefer leaving unspecified day shifts as UNASSIGNED
-    penalties = []
-    requested_day_cells = set()
-    for name, mp in requests.items():
-        for day, code in mp.items():
-            if code in shifts_day or code == "日":
-                requested_day_cells.add((name, day))
-
-    for s_idx, staff in enumerate(staff_data):
-        name = staff["name"]
-        for d in days_indices:
-            day_num = d + 1
-            if (name, day_num) in requested_day_cells:
-                continue
-            for code in shifts_day:
-                if code in ALL_SHIFTS:
-                    penalties.append(shifts[(s_idx, d, code)] * 2000)
-            penalties.append(-50 * shifts[(s_idx, d, UNASSIGNED_CODE)])
-
-    model.Minimize(sum(penalties))
-
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 10.0
-    solver.parameters.num_search_workers = 8
-    status = solver.Solve(model)
-    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-        return None, None
-
-    day_headers = build_day_headers(year, month, num_days)
-
-    schedule_data = []
-    for s in staff_indices:
-        row = {"Staff": staff_data[s]["name"]}
-        work_days = 0
-        off_days = 0
-        for d in days_indices:
-            val = None
-            for code in ALL_SHIFTS:
-                if solver.Value(shifts[(s, d, code)]):
-                    val = code
-                    break
-            if val == OFF_CODE:
-                off_days += 1
-            else:
-                work_days += 1
-        row["公休数"] = off_days
-        row["勤務日数(公以外)"] = work_days
-
-        for d in days_indices:
-            col = day_headers[d]
-            val = "ERR"
-            for code in ALL_SHIFTS:
-                if solver.Value(shifts[(s, d, code)]):
-                    val = code
-                    break
-            row[col] = "" if val == UNASSIGNED_CODE else val
-
-        schedule_data.append(row)
-
-    df_result = pd.DataFrame(schedule_data)
-    df_summary = build_summary(df_result, staff_data, shifts_day, shifts_night, num_days, year, month, closed_idx)
-    return df_result, df_summary
-
-@st.cache_data(show_spinner=False)
-def solve_stage2(num_days, year, month, prev_history, fixed_table, staff_data,
-                shifts_day, shifts_night, closed_days, _version_stamp: str):
-    """
-    Stage2:
-    - Stage1/수정본 고정값 하드
-    - 빈칸 채워 완성
-    - ✅ 야근(Q1,X1,R1) 각 1명 하드
-    - ✅ L1 1명 하드
-    """
-    model = cp_model.CpModel()
-    ALL_SHIFTS = shifts_day + shifts_night + SPECIAL_CODES
-    staff_indices = range(len(staff_data))
-    days_indices = range(num_days)
-    closed_idx = set([d - 1 for d in closed_days if 1 <= d <= num_days])
-
-    shifts = {}
-    for s in staff_indices:
-        for d in days_indices:
-            for code in ALL_SHIFTS:
-                shifts[(s, d, code)] = model.NewBoolVar(f"s2_s{s}_d{d}_{code}")
-
-    for s in staff_indices:
-        for d in days_indices:
-            model.Add(sum(shifts[(s, d, c)] for c in ALL_SHIFTS) == 1)
-
-    for s in staff_indices:
-        allowed = parse_skills(staff_data[s].get("skills", ""))
-        for d in days_indices:
-            for code in ALL_SHIFTS:
-                if code not in allowed:
-                    model.Add(shifts[(s, d, code)] == 0)
-
-    # prev month carry
-    for s_idx, staff in enumerate(staff_data):
-        name = staff["name"]
-        h_d1 = norm_code(prev_history.get(name, {}).get("d-1", OFF_CODE))
-        h_d2 = norm_code(prev_history.get(name, {}).get("d-2", OFF_CODE))
-        h_d3 = norm_code(prev_history.get(name, {}).get("d-3", OFF_CODE))
-
-        if h_d1 in shifts_night:
-            model.Add(shifts[(s_idx, 0, MYONG_CODE)] == 1)
-
-        if h_d1 == MYONG_CODE:
-            for day_code in shifts_day + ["日", MYONG_CODE]:
-                if day_code in ALL_SHIFTS:
-                    model.Add(shifts[(s_idx, 0, day_code)] == 0)
-
-        w_d3 = 1 if h_d3 != OFF_CODE else 0
-        w_d2 = 1 if h_d2 != OFF_CODE else 0
-        w_d1 = 1 if h_d1 != OFF_CODE else 0
-        c0 = 1 - shifts[(s_idx, 0, OFF_CODE)] if 0 < num_days else 0
-        c1 = 1 - shifts[(s_idx, 1, OFF_CODE)] if 1 < num_days else 0
-
-        model.Add(w_d3 + w_d2 + w_d1 + c0 + c1 <= 4)
-        if num_days >= 3:
-            c2 = 1 - shifts[(s_idx, 2, OFF_CODE)]
-            model.Add(w_d2 + w_d1 + c0 + c1 + c2 <= 4)
-        if num_days >= 4:
-            c2 = 1 - shifts[(s_idx, 2, OFF_CODE)]
-            c3 = 1 - shifts[(s_idx, 3, OFF_CODE)]
-            model.Add(w_d1 + c0 + c1 + c2 + c3 <= 4)
-
-    # night -> next day is 明(-)
-    for s in staff_indices:
-        for d in range(num_days - 1):
-            is_night = sum(shifts[(s, d, c)] for c in shifts_night if c in ALL_SHIFTS)
-            model.Add(shifts[(s, d + 1, MYONG_CODE)] == is_night)
-
-    # 明(-) -> next day cannot be day shift / 日 / 明
-    for s in staff_indices:
-        for d in range(num_days - 1):
-            for day_code in shifts_day + ["日", MYONG_CODE]:
-                if day_code in ALL_SHIFTS:
-                    model.AddImplication(shifts[(s, d, MYONG_CODE)], shifts[(s, d + 1, day_code)].Not())
-
-    # spacing night
-    for s in staff_indices:
-        for d in range(num_days - 4):
-            n1 = sum(shifts[(s, d, c)] for c in shifts_night)
-            n2 = sum(shifts[(s, d + 2, c)] for c in shifts_night)
-            n3 = sum(shifts[(s, d + 4, c)] for c in shifts_night)
-            model.Add(n1 + n2 + n3 <= 2)
-
-    # 5 days window work<=4
-    for s in staff_indices:
-        for d in range(num_days - 4):
-            works = [1 - shifts[(s, d + k, OFF_CODE)] for k in range(5)]
-            model.Add(sum(works) <= 4)
-
-    # closed day: no night and no L1
-    for d in closed_idx:
-        for s in staff_indices:
-            for c in shifts_night:
-                model.Add(shifts[(s, d, c)] == 0)
-            if "L1" in ALL_SHIFTS:
-                model.Add(shifts[(s, d, "L1")] == 0)
-
-    # HARD: fixed_table (non-empty)
-    day_headers = build_day_headers(year, month, num_days)
-    name_to_idx = {s["name"]: i for i, s in enumerate(staff_data)}
-
-    for _, r in fixed_table.iterrows():
-        name = r["Staff"]
-        if name not in name_to_idx:
-            continue
-        s_idx = name_to_idx[name]
-        for d in days_indices:
-            col = day_headers[d]
-            v = norm_code(r.get(col, ""))
-            if v == "":
-                continue
-            if v in ALL_SHIFTS:
-                model.Add(shifts[(s_idx, d, v)] == 1)
-
-    # ✅ HARD: night each code exactly 1 (non-closed)
-    for d in days_indices:
-        if d in closed_idx:
-            continue
-        for code in shifts_night:
-            cnt = sum(shifts[(s, d, code)] for s in staff_indices)
-            model.Add(cnt == 1)
-
-    # ✅ HARD: L1 exactly 1 (non-closed)
-    if "L1" in ALL_SHIFTS:
-        for d in days_indices:
-            if d in closed_idx:
-                continue
-            l1_cnt = sum(shifts[(s, d, "L1")] for s in staff_indices)
-            model.Add(l1_cnt == 1)
-
-    # Soft goals
-    penalties = []
-
-    # (E1+E2)+(G1+G1U) >= 2 (가능하면)
-    e_codes = ["E1", "E2"]
-    g_codes = ["G1", "G1U"]
-    for d in days_indices:
-        total_e = sum(shifts[(s, d, c)] for s in staff_indices for c in e_codes if c in ALL_SHIFTS)
-        total_g = sum(shifts[(s, d, c)] for s in staff_indices for c in g_codes if c in ALL_SHIFTS)
-        total_power = total_e + total_g
-        is_short = model.NewBoolVar(f"s2_short_power_{d}")
-        model.Add(total_power < 2).OnlyEnforceIf(is_short)
-        model.Add(total_power >= 2).OnlyEnforceIf(is_short.Not())
-        penalties.append(is_short * 50000)
-
-    # Manager day >= 1 (가능하면)
-    manager_indices = [i for i, s in enumerate(staff_data) if s["role"] == "Manager"]
-    for d in days_indices:
-        mgr_day = sum(shifts[(s, d, c)] for s in manager_indices for c in shifts_day if c in ALL_SHIFTS)
-        is_zero = model.NewBoolVar(f"s2_mgr_zero_{d}")
-        model.Add(mgr_day == 0).OnlyEnforceIf(is_zero)
-        model.Add(mgr_day > 0).OnlyEnforceIf(is_zero.Not())
-        penalties.append(is_zero * 50000)
-
-    # OFF target (가능하면)
-    for s in staff_indices:
-        target_off = staff_data[s].get("target_off", 8)
-        if pd.isna(target_off):
-            target_off = 8
-        target_off = int(target_off)
-
-        actual_offs = model.NewIntVar(0, num_days, f"s2_off_{s}")
-        model.Add(actual_offs == sum(shifts[(s, d, OFF_CODE)] for d in days_indices))
-
-        diff = model.NewIntVar(0, num_days, f"s2_offdiff_{s}")
-        model.AddAbsEquality(diff, actual_offs - target_off)
-        penalties.append(diff * 100000)
-
-    model.Minimize(sum(penalties))
-
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 10.0
-    solver.parameters.num_search_workers = 8
-    status = solver.Solve(model)
-    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-        return None, None
-
-    schedule_data = []
-    for s in staff_indices:
-        row = {"Staff": staff_data[s]["name"]}
-        off_days = 0
-        work_days = 0
-
-        for d in days_indices:
-            val = "ERR"
-            for code in ALL_SHIFTS:
-                if solver.Value(shifts[(s, d, code)]):
-                    val = code
-                    break
-            if val == OFF_CODE:
-                off_days += 1
-            else:
-                work_days += 1
-
-        row["公休数"] = off_days
-        row["勤務日数(公以外)"] = work_days
-
-        for d in days_indices:
-            col = day_headers[d]
-            val = "ERR"
-            for code in ALL_SHIFTS:
-                if solver.Value(shifts[(s, d, code)]):
-                    val = code
-                    break
-            row[col] = val
-
-        schedule_data.append(row)
-
-    df_result = pd.DataFrame(schedule_data)
-    df_summary = build_summary(df_result, staff_data, shifts_day, shifts_night, num_days, year, month, closed_idx)
-    return df_result, df_summary
-
-def build_summary(df_result, staff_data, shifts_day, shifts_night, num_days, year, month, closed_idx):
-    day_headers = build_day_headers(year, month, num_days)
-    daily_summary_list = []
-
-    for d in range(num_days):
-        col_name = day_headers[d]
-        day_stats = {"日付": col_name}
-
-        mgr_day = 0
-        mgr_night = 0
-        for s_idx, stf in enumerate(staff_data):
-            v = df_result.iloc[s_idx][col_name]
-            if stf["role"] == "Manager":
-                if v in shifts_day: mgr_day += 1
-                if v in shifts_night: mgr_night += 1
-
-        day_stats["Manager(昼)"] = mgr_day
-        day_stats["Manager(夜)"] = mgr_night
-
-        all_codes = shifts_night + shifts_day + [OFF_CODE, MYONG_CODE, "日"]
-        for code in all_codes:
-            day_stats[code] = sum(1 for s_idx in range(len(staff_data)) if df_result.iloc[s_idx][col_name] == code)
+# ✅ st.cache_data 대신 상한 있는 LRU (엔트리 수 / 바이트 / TTL) + 시프트표는 int 코드 배열로 보관
+RESULT_CACHE_MAX_ENTRIES = 32
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+@st.cache_resource
+def get_result_cache():
+    return result_cache.BoundedCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS)
+
+def cached_solve(name, fn, *key_parts):
+    """key_parts(+APP_VERSION) 로 캐시 조회 -> 없으면 fn() 실행 후 compact 해서 저장. 반환은 항상 새 DataFrame"""
+    cache = get_result_cache()
+    key = result_cache.make_key(name, APP_VERSION, *key_parts)
+    hit, value = cache.get(key)
+    if not hit:
+        value = result_cache.compact(fn())
+        cache.put(key, value)
+    return result_cache.expand(value)
 
-        day_stats["休館"] = 1 if d in closed_idx else 0
-        daily_summary_list.append(day_stats)
+def solve_stage1(num_days, year, month, prev_history, requests, staff_data,
+                shifts_day, shifts_night, closed_days, coverage_rules, encoding, request_rules, fairness,
+                portfolio_size=0, params=None):
+    args = (num_days, year, month, prev_history, requests, staff_data, shifts_day, shifts_night, closed_days,
+            coverage_rules, encoding, request_rules, fairness)
+    if portfolio_size > 1:
+        fn = lambda: shift_solver.solve_portfolio("stage1", args, n_members=portfolio_size, params=params)
+    else:
+        fn = lambda: shift_solver.solve_stage1(*args, params=params)
+    return cached_solve("stage1", fn, args, portfolio_size, params)
+
+def solve_stage1_alternatives(num_days, year, month, prev_history, requests, staff_data,
+                              shifts_day, shifts_night, closed_days, coverage_rules, encoding, request_rules, fairness,
+                              k, min_diff, params=None):
+    args = (num_days, year, month, prev_history, requests, staff_data, shifts_day, shifts_night, closed_days)
+    fn = lambda: shift_solver.solve_stage1_alternatives(*args, k, min_diff, coverage_rules=coverage_rules,
+                                                        encoding=encoding, request_rules=request_rules,
+                                                        fairness=fairness, params=params)
+    return cached_solve("stage1_alternatives", fn, args, coverage_rules, encoding, request_rules, fairness, k, min_diff,
+                        params)
 
-    return pd.DataFrame(daily_summary_list)
+def solve_stage2(num_days, year, month, prev_history, fixed_table, staff_data,
+                shifts_day, shifts_night, closed_days, coverage_rules, encoding, request_rules, fairness,
+                portfolio_size=0, params=None):
+    args = (num_days, year, month, prev_history, fixed_table, staff_data, shifts_day, shifts_night, closed_days,
+            coverage_rules, encoding, request_rules, fairness)
+    if portfolio_size > 1:
+        fn = lambda: shift_solver.solve_portfolio("stage2", args, n_members=portfolio_size, params=params)
+    else:
+        fn = lambda: shift_solver.solve_stage2(*args, params=params)
+    return cached_solve("stage2", fn, args, portfolio_size, params)
+
+def memory_readout():
+    """사이드바: 결과 캐시 사용량 + 이 세션의 session_state 키별 크기"""
+    stats = get_result_cache().stats()
+    with st.expander("🧠 メモリ（キャッシュ / セッション）"):
+        st.caption(f"結果キャッシュ（全ユーザー共有）: {stats['entries']}/{stats['max_entries']}件・"
+                   f"{result_cache.format_bytes(stats['bytes'])}/{result_cache.format_bytes(stats['max_bytes'])}")
+        st.caption(f"ヒット {stats['hits']} / ミス {stats['misses']} / 追い出し {stats['evictions']}")
+        sizes = sorted(((k, result_cache.estimate_bytes(v)) for k, v in st.session_state.items()),
+                       key=lambda x: -x[1])
+        st.caption(f"このセッション: {result_cache.format_bytes(sum(n for _, n in sizes))}")
+        st.dataframe(pd.DataFrame([{"key": k, "size": result_cache.format_bytes(n)} for k, n in sizes[:15]]),
+                     use_container_width=True, hide_index=True)
+
+def solver_settings_ui(stage):
+    """사이드바: stage 별 CP-SAT 설정 -> params dict"""
+    with st.expander(f"{stage} ソルバー設定"):
+        preview = st.checkbox("最初の解で停止（クイックプレビュー）", value=False, key=versioned(f"{stage}_preview"))
+        time_limit = st.number_input("制限時間（秒）", 1.0, 600.0, 10.0, step=1.0, key=versioned(f"{stage}_time_limit"))
+        rel_gap = st.number_input("相対gapで停止（0=無効）", 0.0, 1.0, 0.0, step=0.01, format="%.3f",
+                                  key=versioned(f"{stage}_rel_gap"))
+        abs_gap = st.number_input("絶対gapで停止（0=無効）", 0.0, 1e8, 0.0, step=1000.0, key=versioned(f"{stage}_abs_gap"))
+        workers = st.number_input("ワーカー数", 1, 32, 8, key=versioned(f"{stage}_workers"))
+    params = {"max_time_in_seconds": float(time_limit), "num_workers": int(workers)}
+    if rel_gap > 0:
+        params["relative_gap_limit"] = float(rel_gap)
+    if abs_gap > 0:
+        params["absolute_gap_limit"] = float(abs_gap)
+    if preview:
+        params["stop_after_first_solution"] = True
+    return params
+
+def show_solve_metrics(run_info):
+    fmt = lambda v: "-" if v is None else f"{v:,.0f}"
+    c = st.columns(6)
+    c[0].metric("状態", run_info["status"])
+    c[1].metric("目的値", fmt(run_info["objective"]))
+    c[2].metric("下界 (best bound)", fmt(run_info["best_bound"]))
+    c[3].metric("gap", "-" if run_info["gap"] is None else f"{run_info['gap'] * 100:.2f}%")
+    c[4].metric("初回解まで", "-" if run_info["first_solution_seconds"] is None else f"{run_info['first_solution_seconds']}s")
+    c[5].metric("計算時間", f"{run_info['wall_time']}s",
+                "制限時間で打ち切り" if run_info["hit_time_limit"] else None, delta_color="inverse")
+
+def snapshot_button(stage, args, run_info=None):
+    # 실패/느린 달을 오프라인에서 재현하기 위한 입력+모델 저장 (python snapshot.py replay <file>)
+    st.download_button("📦 スナップショット保存（入力＋モデル / 再現・回帰テスト用）",
+                       lambda: snapshot.save_snapshot(stage, args, run_info),   # 클릭할 때만 모델 구성/직렬화
+                       f"{args[1]}_{args[2]}_{stage}{snapshot.SNAPSHOT_EXT}", key=versioned(f"dl_snapshot_{stage}"))
+
+def show_run_info(run_info, label):
+    with st.expander(f"🔁 {label} 再現情報（seed / パラメータ）"):
+        st.json(run_info)
+        st.download_button("📥 再現情報をダウンロード (JSON)", json.dumps(run_info, ensure_ascii=False, indent=2).encode("utf-8"),
+                           f"{label}_run_info.json", key=versioned(f"dl_run_info_{label}"))
 
 # =========================================================
 # UI
@@ -789,22 +393,32 @@ with st.sidebar:
     days_in_month = pd.Period(f"{year}-{month}").days_in_month
     st.info(f"計 {days_in_month}日")
 
+    st.header("🧪 ソルバー設定")
+    use_portfolio = st.checkbox("ポートフォリオ並列探索（複数seedを別プロセスで同時実行）", value=False,
+                                key=versioned("use_portfolio"))
+    portfolio_size = st.number_input("並列seed数", 2, 16, 4, key=versioned("portfolio_size")) if use_portfolio else 0
+    if use_portfolio:
+        # ✅ 풀 기동·모델 구성은 예산에 포함, 결과 추출/수집은 밖 (1 CPU 4멤버 6초 예산 -> 실측 6.1~7.0초)
+        st.caption("制限時間はプロセス起動・モデル作成を含む全体の目安です。"
+                   "結果の取り出しに数百ミリ秒〜1秒ほど超えることがあり、"
+                   "起動だけで時間を使い切る短い設定では各seedに最低1秒を確保するため、さらに超えます。")
+    encoding = st.selectbox("変数エンコーディング", shift_solver.ENCODINGS, key=versioned("encoding"),
+                            format_func={"onehot": "one-hot（標準）", "int": "整数/セル（大人数・コード多数向け）"}.get)
+    stage1_params = solver_settings_ui("Stage1")
+    stage2_params = solver_settings_ui("Stage2")
+    memory_readout()
+
 with st.expander("⚙️ 勤務コード設定（新しい時間帯の追加・削除）"):
-    st.caption("※ ✅ 夜勤は Q1/X1/R1 を毎日各1名固定。✅ L1も毎日1名固定。Dコードは廃止(空欄扱い)。")
+    st.caption("※ 毎日の必要人数は「📏 人数ルール」で設定（既定: 夜勤コード各1名・L1 1名）。Dコードは廃止(空欄扱い)。")
     c1, c2 = st.columns(2)
 
     day_shifts_str = c1.text_area("日勤コード", ", ".join(st.session_state["shifts_day"]), key=versioned("day_shifts"))
-    night_shifts_str = c2.text_area("夜勤コード（Q1,X1,R1の3つ推奨）", ", ".join(st.session_state["shifts_night"]), key=versioned("night_shifts"))
+    night_shifts_str = c2.text_area("夜勤コード（例: Q1, X1, R1）", ", ".join(st.session_state["shifts_night"]), key=versioned("night_shifts"))
 
     st.session_state["shifts_day"] = [x.strip() for x in day_shifts_str.split(",") if x.strip()]
     st.session_state["shifts_night"] = [x.strip() for x in night_shifts_str.split(",") if x.strip()]
     remove_D_from_shift_lists()
 
-    if len(st.session_state["shifts_night"]) != 3:
-        st.warning("要求仕様: 夜勤は3名枠(Q1,X1,R1)固定。夜勤コードを3つにして。")
-    if "L1" not in st.session_state["shifts_day"]:
-        st.warning("L1が日勤コードにありません。L1は毎日1名必須です。")
-
     # Stage1 드롭다운 (희망휴일/희망근무/야근/L1/日 노출)
     DROPDOWN_STAGE1 = [""] + [OFF_CODE, "日"] + st.session_state["shifts_night"] + (["L1"] if "L1" in st.session_state["shifts_day"] else []) + st.session_state["shifts_day"]
     DROPDOWN_STAGE2 = [""] + [OFF_CODE, "日", MYONG_CODE] + st.session_state["shifts_night"] + st.session_state["shifts_day"]
@@ -819,153 +433,435 @@ with st.sidebar:
         key=versioned("closed_days")
     )
 
-with st.expander("👥 スタッフ管理（目標公休数＆可能勤務の編集）", expanded=True):
-    df_staff = pd.DataFrame(INITIAL_STAFF_DB)
-    edited_staff_df = st.data_editor(
-        df_staff,
-        num_rows="dynamic",
-        column_config={
-            "target_off": st.column_config.NumberColumn("目標公休数", min_value=0, max_value=31, step=1),
-            "skills": st.column_config.TextColumn("可能勤務 (カンマ区切り)", width="large"),
-            "role": st.column_config.SelectboxColumn("役職", options=["Manager", "Staff"]),
-            "gender": st.column_config.SelectboxColumn("性別", options=["M", "F"]),
-        },
-        use_container_width=True,
-        key=versioned("staff_editor"),
-    )
+    st.divider()
+    st.header("🗄 データ保存 (SQLite)")
+    prop = st.text_input("施設 (property)", store.DEFAULT_PROPERTY, key=versioned("property")).strip() or store.DEFAULT_PROPERTY
+
+    # ✅ 월/시설이 바뀔 때만 DB 에서 1번 읽음 (스태프 + 희망 + 전월 마지막 3일)
+    month_key = (prop, int(year), int(month))
+    if st.session_state.get("month_key") != month_key:
+        st.session_state["month_data"] = store.open_month(get_store(), int(year), int(month), prop)
+        st.session_state["saved_coverage_rules"] = store.load_coverage_rules(get_store(), prop)
+        st.session_state["saved_request_rules"] = store.load_request_rules(get_store(), prop)
+        st.session_state["month_key"] = month_key
+    month_data = st.session_state["month_data"]
+    st.caption(f"保存済み: スタッフ {len(month_data['staff'])}名 / 希望 {sum(len(v) for v in month_data['requests'].values())}件 / "
+               f"前月履歴 {len(month_data['prev_history'])}名")
+    if "published_msg" in st.session_state:
+        st.success(st.session_state.pop("published_msg"))
 
-current_names = edited_staff_df["name"].tolist() if "name" in edited_staff_df.columns else []
-
-with st.expander("🔙 前月の最後3日間の勤務入力 (CSVアップロード対応)"):
-    uploaded_prev = st.file_uploader("CSVファイルで一括アップロード (前月記録)", type=["csv"], key=versioned("prev_upload"))
-    prev_cols = ["d-3", "d-2", "d-1"]
-
-    if current_names:
-        init_prev = pd.DataFrame(index=current_names, columns=prev_cols)
-        if uploaded_prev is not None:
-            try:
-                df_upload_prev = pd.read_csv(uploaded_prev, index_col=0)
-                for c in prev_cols:
-                    if c in df_upload_prev.columns:
-                        df_upload_prev[c] = df_upload_prev[c].map(norm_code)
-                init_prev.update(df_upload_prev)
+# =========================================================
+# 입력 fragment: 셀 수정 시 해당 fragment 만 rerun (결과 표/다른 에디터는 그대로)
+# - 전체 rerun(실행 버튼 등) 때는 fragment 반환값이 최신 편집값
+# =========================================================
+@st.fragment
+def staff_section(month_data, prop):
+    with st.expander("👥 スタッフ管理（目標公休数＆可能勤務の編集）", expanded=True):
+        df_staff = memo("staff_base", lambda: pd.DataFrame(month_data["staff"] or INITIAL_STAFF_DB), month_data["staff"])
+        edited_staff_df = st.data_editor(
+            df_staff,
+            num_rows="dynamic",
+            column_config={
+                "target_off": st.column_config.NumberColumn("目標公休数", min_value=0, max_value=31, step=1),
+                "skills": st.column_config.TextColumn("可能勤務 (カンマ区切り)", width="large"),
+                "role": st.column_config.SelectboxColumn("役職", options=["Manager", "Staff"]),
+                "gender": st.column_config.SelectboxColumn("性別", options=["M", "F"]),
+            },
+            use_container_width=True,
+            key=versioned("staff_editor"),
+        )
+        if st.button("💾 スタッフを保存", key=versioned("save_staff")):
+            n = store.save_staff(get_store(), edited_staff_df.to_dict("records"), prop)
+            st.success(f"{n}名を保存しました。")
+
+    # ✅ 이름 목록이 바뀌면 前月/Stage1 에디터 행이 바뀌므로 전체 rerun
+    names = edited_staff_df["name"].tolist() if "name" in edited_staff_df.columns else []
+    if "current_names" in st.session_state and st.session_state["current_names"] != names:
+        st.session_state["current_names"] = names
+        st.rerun()
+    st.session_state["current_names"] = names
+    return edited_staff_df
+
+def build_init_prev(current_names, prev_cols, prev_history, uploaded_prev):
+    init_prev = pd.DataFrame(index=current_names, columns=prev_cols)
+    if prev_history:
+        init_prev.update(pd.DataFrame.from_dict(prev_history, orient="index"))
+    if uploaded_prev is not None:
+        df_upload_prev = pd.read_csv(uploaded_prev, index_col=0)
+        for c in prev_cols:
+            if c in df_upload_prev.columns:
+                df_upload_prev[c] = df_upload_prev[c].map(norm_code)
+        init_prev.update(df_upload_prev)
+    return init_prev
+
+@st.fragment
+def prev_section(current_names, month_data, dropdown):
+    prev_cols = store.PREV_COLS
+    with st.expander("🔙 前月の最後3日間の勤務入力 (CSVアップロード対応)"):
+        uploaded_prev = st.file_uploader("CSVファイルで一括アップロード (前月記録)", type=["csv"], key=versioned("prev_upload"))
+
+        if not current_names:
+            st.warning("スタッフリストが空です。")
+            return pd.DataFrame()
+        if month_data["prev_history"]:
+            st.caption("※ 前月の公開シフトから自動入力済み（CSVで上書き可）")
+        try:
+            init_prev = memo("init_prev", lambda: build_init_prev(current_names, prev_cols, month_data["prev_history"], uploaded_prev),
+                             current_names, month_data["prev_history"], upload_id(uploaded_prev))
+            if uploaded_prev is not None:
                 st.success("CSVアップロード完了！")
-            except Exception as e:
-                st.error(f"CSV読み込みエラー: {e}")
+        except Exception as e:
+            st.error(f"CSV読み込みエラー: {e}")
+            init_prev = build_init_prev(current_names, prev_cols, month_data["prev_history"], None)
 
         prev_column_config = {
-            col: st.column_config.SelectboxColumn(col, width="small", options=DROPDOWN_STAGE2, required=False)
+            col: st.column_config.SelectboxColumn(col, width="small", options=dropdown, required=False)
             for col in prev_cols
         }
         prev_editor = st.data_editor(init_prev, column_config=prev_column_config, num_rows="fixed", key=versioned("prev_editor"))
         st.download_button("📥 テンプレートをダウンロード (CSV)", init_prev.to_csv().encode("utf-8"), "prev_history_template.csv", key=versioned("prev_tpl"))
-    else:
-        st.warning("スタッフリストが空です。")
-        prev_editor = pd.DataFrame()
+    return prev_editor
 
-st.divider()
-st.subheader("Stage1：希望(公=希望休 / 希望勤務 / 夜勤(Q1,X1,R1) / L1 / 日)入力 → 自動でベース作成")
-
-uploaded_req = st.file_uploader("CSV一括アップロード (Stage1 希望入力)", type=["csv"], key=versioned("stage1_req_upload"))
-if current_names:
+def build_init_data(current_names, days_in_month, requests, uploaded_req):
     init_data = pd.DataFrame(index=current_names, columns=[f"{i}日" for i in range(1, days_in_month + 1)])
+    if requests:
+        init_data.update(pd.DataFrame.from_dict(
+            {name: {f"{d}日": c for d, c in mp.items()} for name, mp in requests.items()}, orient="index"))
     if uploaded_req is not None:
-        try:
-            df_upload_req = pd.read_csv(uploaded_req, index_col=0)
-            for col in df_upload_req.columns:
-                df_upload_req[col] = df_upload_req[col].map(norm_code)
-            init_data.update(df_upload_req)
+        df_upload_req = pd.read_csv(uploaded_req, index_col=0)
+        for col in df_upload_req.columns:
+            df_upload_req[col] = df_upload_req[col].map(norm_code)
+        init_data.update(df_upload_req)
+    return init_data
+
+@st.fragment
+def stage1_editor_section(current_names, month_data, days_in_month, dropdown, year, month, prop):
+    uploaded_req = st.file_uploader("CSV一括アップロード (Stage1 希望入力)", type=["csv"], key=versioned("stage1_req_upload"))
+    if not current_names:
+        st.warning("スタッフリストが空です。")
+        return pd.DataFrame()
+    try:
+        init_data = memo("init_data", lambda: build_init_data(current_names, days_in_month, month_data["requests"], uploaded_req),
+                         current_names, days_in_month, month_data["requests"], upload_id(uploaded_req))
+        if uploaded_req is not None:
             st.success("CSVアップロード完了！")
-        except Exception as e:
-            st.error(f"CSV読み込みエラー: {e}")
+    except Exception as e:
+        st.error(f"CSV読み込みエラー: {e}")
+        init_data = build_init_data(current_names, days_in_month, month_data["requests"], None)
 
     req_cfg = {
-        col: st.column_config.SelectboxColumn(col, width="small", options=DROPDOWN_STAGE1, required=False)
+        col: st.column_config.SelectboxColumn(col, width="small", options=dropdown, required=False)
         for col in init_data.columns
     }
     edited_stage1 = st.data_editor(init_data, column_config=req_cfg, num_rows="fixed", height=360, key=versioned("stage1_editor"))
-    st.download_button("📥 テンプレートDL (CSV)", init_data.to_csv().encode("utf-8"), "stage1_request_template.csv", key=versioned("stage1_tpl"))
-else:
-    st.warning("スタッフリストが空です。")
-    edited_stage1 = pd.DataFrame()
+    c_tpl, c_save = st.columns(2)
+    c_tpl.download_button("📥 テンプレートDL (CSV)", init_data.to_csv().encode("utf-8"), "stage1_request_template.csv", key=versioned("stage1_tpl"))
+    if c_save.button("💾 希望を保存", key=versioned("save_requests")):
+        n = store.save_requests(get_store(), int(year), int(month), requests_from_editor(edited_stage1), prop)
+        c_save.success(f"{n}件を保存しました。")
+    return edited_stage1
+
+@st.fragment
+def coverage_rules_section(saved_rules, shifts_day, shifts_night, prop):
+    with st.expander("📏 人数ルール（コード × 曜日/日付/月 ごとの最低・最大人数）"):
+        st.caption("codes: 「Q1」「E1+E2+G1+G1U」(合計)「@day」「@night」(日勤/夜勤コード全部) / role: 空欄=全員 / "
+                   "weekdays: 「土,日」「月-金」 / days: 「1-10,25」 / months: 「7,8」「12-2」 / "
+                   "weight: 0=必須(ハード)・1以上=1人不足(超過)あたりのペナルティ / stages: 「1,2」「2」 / "
+                   "日単位: ONならペナルティは不足(超過)人数に関係なく1日あたり（既定のE+G・Manager規則）")
+        base = memo("coverage_base", lambda: pd.DataFrame(
+            saved_rules if saved_rules is not None else default_coverage_rules(shifts_day, shifts_night),
+            columns=COVERAGE_RULE_COLUMNS), saved_rules, shifts_day, shifts_night)
+        edited = st.data_editor(
+            base,
+            num_rows="dynamic",
+            column_config={
+                "codes": st.column_config.TextColumn("codes", required=True),
+                "role": st.column_config.SelectboxColumn("role", options=["", "Manager", "Staff"]),
+                "min": st.column_config.NumberColumn("min", min_value=0, step=1),
+                "max": st.column_config.NumberColumn("max", min_value=0, step=1),
+                "weight": st.column_config.NumberColumn("weight", min_value=0, step=1000),
+                "on_closed": st.column_config.CheckboxColumn("休館日も適用"),
+                "per_day": st.column_config.CheckboxColumn("日単位", help="ソフト規則のペナルティを人数ではなく1日あたりで数える"),
+            },
+            use_container_width=True,
+            hide_index=True,
+            key=versioned("coverage_editor"),
+        )
+        # ✅ 자유 입력(weekdays/days/months)은 여기서 미리 검사 -> 잘못된 행은 표시하고 제외 (solve 중 예외 방지)
+        rules = []
+        for row, record in enumerate(edited.to_dict("records"), 1):
+            for rule in normalize_coverage_rules([record]):
+                error = coverage_rule_error(rule)
+                if error:
+                    st.error(f"{row}行目（{rule['codes']}）: {error}。この行は無視されます。")
+                else:
+                    rules.append(rule)
+        unknown = unknown_coverage_codes(rules, shifts_day, shifts_night)
+        if unknown:
+            st.warning(f"勤務コード設定にないコードは無視されます: {', '.join(unknown)}")
+        if st.button("💾 ルールを保存（この施設）", key=versioned("save_coverage")):
+            n = store.save_coverage_rules(get_store(), rules, prop)
+            st.success(f"{n}件を保存しました。")
+    st.session_state["coverage_rules_now"] = rules
+    return rules
+
+coverage_rules = coverage_rules_section(st.session_state["saved_coverage_rules"], st.session_state["shifts_day"],
+                                        st.session_state["shifts_night"], prop)
+
+@st.fragment
+def request_rules_section(saved_rules, prop):
+    """soft 모드면 우선순위 규칙 리스트, 아니면 None (= 희망/고정 셀 전부 하드)"""
+    with st.expander("🙏 希望の扱い（ハード / 優先度付きソフト）"):
+        soft = st.checkbox("希望・固定セルをソフトにする（叶わない希望があっても1回で解き、却下された希望を一覧表示）",
+                           value=False, key=versioned("soft_requests"))
+        st.caption("上の行から最初に当てはまるルールの weight を使用（role 指定行を上に置くと役職別の優先度）。"
+                   "codes: 「公」「@night」「@day」「日」「-」「E1+E2」 / stages: 1=Stage1希望・2=Stage2固定セル / "
+                   "weight: 0=ハード・1以上=却下1件あたりのペナルティ / どのルールにも当てはまらない希望はハード")
+        base = memo("request_rules_base", lambda: pd.DataFrame(
+            saved_rules if saved_rules is not None else default_request_rules(), columns=REQUEST_RULE_COLUMNS),
+            saved_rules)
+        edited = st.data_editor(
+            base,
+            num_rows="dynamic",
+            column_config={
+                "codes": st.column_config.TextColumn("codes", required=True),
+                "role": st.column_config.SelectboxColumn("role", options=["", "Manager", "Staff"]),
+                "weight": st.column_config.NumberColumn("weight", min_value=0, step=100000),
+            },
+            use_container_width=True,
+            hide_index=True,
+            disabled=not soft,
+            key=versioned("request_rules_editor"),
+        )
+        rules = normalize_request_rules(edited.to_dict("records"))
+        if st.button("💾 優先度を保存（この施設）", key=versioned("save_request_rules")):
+            n = store.save_request_rules(get_store(), rules, prop)
+            st.success(f"{n}件を保存しました。")
+    st.session_state["request_rules_now"] = rules if soft else None
+    return st.session_state["request_rules_now"]
+
+@st.fragment
+def night_fairness_section(prop, year, month, shifts_night):
+    """평준화 off 면 None, on 이면 fairness dict (history = 공개된 직전 N개월 야근 횟수)"""
+    with st.expander("🌙 夜勤回数の平準化"):
+        on = st.checkbox("夜勤回数をスタッフ間で平準化する（そのコードのスキルを持つ人どうしで最多と最少の差を小さく）",
+                         value=False, key=versioned("night_fairness"))
+        c1, c2, c3 = st.columns(3)
+        per_code = c1.checkbox("コード別（" + "/".join(shifts_night) + "）", value=True,
+                               key=versioned("fair_per_code"), disabled=not on)
+        total = c2.checkbox("夜勤合計", value=True, key=versioned("fair_total"), disabled=not on)
+        weekend = c3.checkbox("土日の夜勤", value=True, key=versioned("fair_weekend"), disabled=not on)
+        weight = st.number_input("重み（差1回あたりのペナルティ）", 0, 1_000_000, FAIRNESS_DEFAULTS["weight"], step=1000,
+                                 key=versioned("fair_weight"), disabled=not on)
+        months = st.number_input("前月までの履歴を考慮（公開済みシフトの月数・0=今月のみ）", 0, 12, 0,
+                                 key=versioned("fair_history_months"), disabled=not on)
+        st.caption("既定の重みは人数ルール不足（1名50,000）より小さく、日勤の割り当て（2,000）より大きい値です。")
+        # ✅ 평준화 on 은 단계별 풀이 (희망·人数 -> 평준화 -> 주간), fairness_bench: 200명까지 30초 안에 OPTIMAL
+        st.caption("⚠️ 平準化をオンにすると、希望・人数ルール → 平準化 → 日勤の順に段階的に解くため時間が増えます"
+                   "（目安: 20名で約1.5秒→約1.7秒、50名で約3秒→約16秒）。"
+                   "時間が足りない場合はサイドバーの「Stage1 ソルバー設定」で制限時間を延ばしてください。")
+    if not on:
+        st.session_state["fairness_now"] = None
+        return None
+    # 공개 목록(published_at 포함)을 키에 넣어서 다른 세션이 공개/재공개해도 다시 집계
+    history = memo("night_history", lambda: analytics.store_night_history(
+        get_store(), int(year), int(month), int(months), shifts_night, prop),
+        prop, int(year), int(month), int(months), list(shifts_night),
+        store.list_published(get_store(), prop)) if months else None
+    st.session_state["fairness_now"] = {"weight": int(weight), "per_code": per_code, "total": total, "weekend": weekend,
+                                        "history": history}
+    return st.session_state["fairness_now"]
+
+FAIRNESS_LABELS = {"night": "夜勤合計", WEEKEND_KEY: "土日夜勤"}
+
+def show_night_spread(df, staff_data, shifts_night, year, month, fairness):
+    """적격자 안에서 야근 횟수 최소–최대 (history 포함)"""
+    spread = night_spread(df, staff_data, shifts_night, year, month, (fairness or {}).get("history"))
+    if spread:
+        st.caption("🌙 夜勤回数（対象者の最少–最多" + ("・履歴込み" if (fairness or {}).get("history") else "") + "）: "
+                   + " / ".join(f"{FAIRNESS_LABELS.get(k, k)} {lo}–{hi}" for k, (lo, hi) in spread.items()))
+
+def show_denied(denied, label):
+    if not denied:
+        st.caption(f"✅ {label}: すべて反映されました。")
+        return
+    st.warning(f"⚠️ {label}: 反映できなかったもの {len(denied)}件（weight の小さいものから却下）")
+    st.dataframe(pd.DataFrame(denied), use_container_width=True, hide_index=True)
+
+request_rules = request_rules_section(st.session_state["saved_request_rules"], prop)
+fairness = night_fairness_section(prop, year, month, st.session_state["shifts_night"])
+edited_staff_df = staff_section(month_data, prop)
+current_names = st.session_state["current_names"]
+prev_cols = store.PREV_COLS
+prev_editor = prev_section(current_names, month_data, DROPDOWN_STAGE2)
+
+st.divider()
+st.subheader("Stage1：希望(公=希望休 / 希望勤務 / 夜勤(Q1,X1,R1) / L1 / 日)入力 → 自動でベース作成")
+
+edited_stage1 = stage1_editor_section(current_names, month_data, days_in_month, DROPDOWN_STAGE1, year, month, prop)
 
 colA, colB = st.columns([1, 2])
 with colA:
     run_stage1 = st.button("🚀 Stage1 自動作成", type="primary", key=versioned("run_stage1"))
+    n_alternatives = st.number_input("ベース案の数（1回の探索で複数案）", 1, 4, 1, key=versioned("stage1_k"),
+                                     help="「Stage1 ソルバー設定」の制限時間は全案の合計です。"
+                                          "案を増やすとモデルが案の数だけ大きくなるため、必要なら制限時間を延ばしてください。")
+    alt_min_diff = st.number_input("案どうしの最低差分（Stage1 対象コードが異なるセル数）", 1, 60, 10,
+                                   key=versioned("stage1_min_diff"), disabled=n_alternatives == 1,
+                                   help="人数ルールの Stage1 対象コード（既定: 夜勤/L1）で、スタッフ×日×コードが違うセルの数。"
+                                        "担当者の入れ替え1枠は2セルと数えます。")
 with colB:
-    st.info("※ ✅ 毎日 夜勤(Q1=1, X1=1, R1=1) ハード。✅ L1も毎日1名ハード。その他の主な日勤はStage2で完成。")
+    st.info("※ ✅ 人数ルールのうち Stage1 対象（既定: 夜勤コード各1名・L1 1名）をハード。その他の主な日勤はStage2で完成。")
 
 if run_stage1:
     if edited_staff_df.empty:
         st.error("スタッフデータがありません。")
         st.stop()
-    if len(st.session_state["shifts_night"]) != 3:
-        st.error("夜勤コードを3つにしてください（例: Q1, X1, R1）。")
-        st.stop()
-    if "L1" not in st.session_state["shifts_day"]:
-        st.error("L1が日勤コードにありません。L1は毎日1名必須です。")
-        st.stop()
 
     staff_data = edited_staff_df.to_dict("records")
-    missing = validate_mandatory_coverage(staff_data, st.session_state["shifts_day"], st.session_state["shifts_night"])
+    missing = validate_mandatory_coverage(staff_data, st.session_state["shifts_day"], st.session_state["shifts_night"],
+                                          coverage_rules)
     if missing:
-        st.error(f"必須コードに対応できるスタッフが0人です: {', '.join(missing)}（スタッフのskillsを見直して）")
+        st.error(f"人数ルールの最低人数を満たせるスタッフが足りません: {', '.join(missing)}（スタッフのskillsを見直して）")
         st.stop()
 
-    prev_history = {}
-    if not prev_editor.empty:
-        for staff_name in prev_editor.index:
-            prev_history[staff_name] = {}
-            for col in prev_cols:
-                prev_history[staff_name][col] = norm_code(prev_editor.loc[staff_name, col]) or OFF_CODE
-
-    requests = {}
-    if not edited_stage1.empty:
-        for staff_name in edited_stage1.index:
-            requests[staff_name] = {}
-            for day_col in edited_stage1.columns:
-                v = norm_code(edited_stage1.loc[staff_name, day_col])
-                if v == "":
-                    continue
-                day_num = int(day_col.replace("日", ""))
-                requests[staff_name][day_num] = v
+    prev_history = prev_history_from_editor(prev_editor, prev_cols)
+    requests = requests_from_editor(edited_stage1)
 
     st.write("### 🧾 Stage1 希望入力サマリー")
     st.dataframe(pd.DataFrame([summarize_requests(requests, st.session_state["shifts_day"], st.session_state["shifts_night"])]),
                  use_container_width=True)
 
     with st.spinner("Stage1（夜勤+L1+希望）を計算中..."):
-        result_df1, summary_df1 = solve_stage1(
-            days_in_month, year, month,
-            prev_history, requests, staff_data,
-            st.session_state["shifts_day"], st.session_state["shifts_night"],
-            closed_days,
-            APP_VERSION,  # ✅ 캐시 키에도 버전 반영
-        )
-
-    if result_df1 is None:
-        st.error("❌ Stage1 실패: 조건 충돌(휴관/희망/야근 연속 규칙/스킬/인원 등)")
+        if n_alternatives == 1:
+            result_df1, summary_df1, run_info1 = solve_stage1(
+                days_in_month, year, month,
+                prev_history, requests, staff_data,
+                st.session_state["shifts_day"], st.session_state["shifts_night"],
+                closed_days, coverage_rules, encoding, request_rules, fairness,
+                int(portfolio_size),
+                stage1_params,
+            )
+            alternatives = None if result_df1 is None else [(result_df1, summary_df1, run_info1["objective"])]
+        else:
+            alternatives, run_info1 = solve_stage1_alternatives(
+                days_in_month, year, month,
+                prev_history, requests, staff_data,
+                st.session_state["shifts_day"], st.session_state["shifts_night"],
+                closed_days, coverage_rules, encoding, request_rules, fairness, int(n_alternatives), int(alt_min_diff),
+                stage1_params,
+            )
+        st.session_state["stage1_run_info"] = run_info1
+
+    stage1_args = (days_in_month, year, month, prev_history, requests, staff_data,
+                   st.session_state["shifts_day"], st.session_state["shifts_night"], closed_days, coverage_rules,
+                   encoding, request_rules, fairness)
+    if alternatives is None:
+        st.error("❌ Stage1 실패: 조건 충돌(휴관/희망/야근 연속 규칙/스킬/인원 등)"
+                 + ("  ※ 案の数/最低差分を減らすと解ける場合あり" if n_alternatives > 1 else "")
+                 + ("  ※「🙏 希望の扱い」でソフトにすると、叶わない希望を却下して解を出せます" if request_rules is None else ""))
+        show_solve_metrics(run_info1)
+        snapshot_button("stage1", stage1_args, run_info1)
         st.stop()
 
     st.session_state["stage1_requests"] = requests
+    st.session_state["stage1_request_rules"] = request_rules
+    st.session_state["stage1_fairness"] = fairness
     st.session_state["stage1_staff_data"] = staff_data
     st.session_state["stage1_prev_history"] = prev_history
-    st.session_state["stage1_result"] = result_df1
+    st.session_state["stage1_base_codes"] = stage1_base_codes(coverage_rules, st.session_state["shifts_day"],
+                                                              st.session_state["shifts_night"])
+    # ✅ 세션에는 int 코드 배열로 보관 (표시/편집할 때만 DataFrame 으로 펼침)
+    st.session_state["stage1_alternatives"] = result_cache.compact(alternatives)
+    st.session_state["stage1_result"] = st.session_state["stage1_alternatives"][0][0]
+    st.session_state.pop(versioned("stage1_pick"), None)
 
     st.success("✅ Stage1 완료! (주간 미정은 빈칸으로 남김)")
-    st.write("### Stage1 결과")
-    st.markdown(generate_colored_table_html(result_df1, requests), unsafe_allow_html=True)
-    st.write("### Stage1 日別集計")
-    st.dataframe(summary_df1, use_container_width=True, height=350)
+    snapshot_button("stage1", stage1_args, run_info1)
+
+# ✅ Stage1 결과 (대안이 여러 개면 나란히 비교 + Stage2 에 쓸 안 선택)
+@st.fragment
+def stage1_results_section(year, month, days_in_month, shifts_night):
+    compact_alternatives = st.session_state["stage1_alternatives"]
+    alternatives = result_cache.expand(compact_alternatives)
+    requests = st.session_state["stage1_requests"]
+    request_rules = st.session_state["stage1_request_rules"]
+    show_solve_metrics(st.session_state["stage1_run_info"])
+
+    def show_denied_requests(df):
+        # soft 모드일 때만: 이 안에서 거절된 희망
+        if request_rules is None:
+            return
+        staff_data = st.session_state["stage1_staff_data"]
+        wanted = requests_to_cells(requests, staff_data, days_in_month)
+        weights = request_weights(request_rules, wanted, staff_data, 1, st.session_state["shifts_day"], shifts_night)
+        show_denied(denied_requests(df, wanted, staff_data, build_day_headers(year, month, days_in_month), weights),
+                    "Stage1 希望")
+
+    def table_html(i, df):
+        # 결과 HTML 은 (해당 안, 희망) 이 같으면 재사용
+        return memo(f"stage1_html_{i}", lambda: generate_colored_table_html(df, requests), compact_alternatives[i][0], requests)
+
+    if len(alternatives) == 1:
+        result_df1, summary_df1, _ = alternatives[0]
+        st.write("### Stage1 결과")
+        show_denied_requests(result_df1)
+        show_night_spread(result_df1, st.session_state["stage1_staff_data"], shifts_night, year, month,
+                          st.session_state["stage1_fairness"])
+        st.markdown(table_html(0, result_df1), unsafe_allow_html=True)
+        st.write("### Stage1 日別集計")
+        st.dataframe(summary_df1, use_container_width=True, height=350)
+        show_run_info(st.session_state["stage1_run_info"], "stage1")
+        return
+
+    st.write(f"### Stage1 ベース案 比較（{len(alternatives)}案）")
+    alt_headers = build_day_headers(year, month, days_in_month)
+    base_codes = st.session_state.get("stage1_base_codes") or stage1_base_codes(
+        None, st.session_state["shifts_day"], shifts_night)
+    cols = st.columns(len(alternatives))
+    for i, (df_alt, _, obj) in enumerate(alternatives):
+        with cols[i]:
+            st.metric(f"案{i + 1}", f"目的値 {obj}",
+                      f"案1との差分 {base_assignment_diff(alternatives[0][0], df_alt, alt_headers, base_codes)}セル",
+                      delta_color="off")
+            counts = pd.DataFrame({c: (df_alt[alt_headers] == c).sum(axis=1) for c in base_codes})
+            counts.index = df_alt["Staff"]
+            st.dataframe(counts[counts.sum(axis=1) > 0], use_container_width=True)
+
+    tabs = st.tabs([f"案{i + 1}" for i in range(len(alternatives))])
+    for i, (tab, (df_alt, summary_alt, _)) in enumerate(zip(tabs, alternatives)):
+        with tab:
+            show_denied_requests(df_alt)
+            show_night_spread(df_alt, st.session_state["stage1_staff_data"], shifts_night, year, month,
+                              st.session_state["stage1_fairness"])
+            st.markdown(table_html(i, df_alt), unsafe_allow_html=True)
+            with st.expander("日別集計"):
+                st.dataframe(summary_alt, use_container_width=True, height=350)
+
+    picked = st.radio("Stage2 に使うベース案", list(range(len(alternatives))),
+                      format_func=lambda i: f"案{i + 1}", horizontal=True, key=versioned("stage1_pick"))
+    if st.session_state["stage1_result"] is not compact_alternatives[picked][0]:
+        st.session_state["stage1_result"] = compact_alternatives[picked][0]
+        st.rerun()   # ✅ Stage2 에디터가 새 안을 쓰도록 전체 rerun
+
+if "stage1_alternatives" in st.session_state:
+    stage1_results_section(year, month, days_in_month, st.session_state["shifts_night"])
 
 st.divider()
 st.subheader("修正（任意）→ Stage2：主な日勤も埋めて完成")
 
-if "stage1_result" in st.session_state:
+@st.fragment
+def stage2_section(year, month, days_in_month, closed_days, encoding, prop, portfolio_size, stage2_params, dropdown,
+                   personal_settings):
+    # ✅ 규칙 입력 fragment 는 따로 rerun 되므로 인자(마지막 전체 rerun 시점 값) 대신 세션의 최신값
+    coverage_rules = st.session_state["coverage_rules_now"]
+    request_rules = st.session_state["request_rules_now"]
+    fairness = st.session_state["fairness_now"]
     st.caption("수정 안 하면 그대로 Stage2. 수정하면 그 값을 하드로 고정해서 Stage2가 나머지를 채움.")
-    base_df = st.session_state["stage1_result"].copy()
+    base_df = memo("stage2_base", lambda: result_cache.expand(st.session_state["stage1_result"]),
+                   st.session_state["stage1_result"])
     day_headers = build_day_headers(year, month, days_in_month)
-    stage2_edit_cfg = {h: st.column_config.SelectboxColumn(h, width="small", options=DROPDOWN_STAGE2, required=False) for h in day_headers}
+    stage2_edit_cfg = {h: st.column_config.SelectboxColumn(h, width="small", options=dropdown, required=False) for h in day_headers}
 
     edited_fixed = st.data_editor(
         base_df,
@@ -976,48 +872,170 @@ if "stage1_result" in st.session_state:
         key=versioned("stage2_fixed_editor"),
     )
 
+    # ✅ 셀별 가능코드 인덱스: Stage1 결과가 바뀌면 새로, 아니면 바뀐 셀만 갱신
+    oracle_staff = st.session_state["stage1_staff_data"]
+    fixed_now = fixed_cells_from_table(edited_fixed, oracle_staff, day_headers)
+    oracle = st.session_state.get("stage2_oracle")
+    # 인덱스 입력 전부 (Stage1 뒤에 휴관일/코드 목록/전월 이력/스태프가 바뀌어도 새로 만듦)
+    index_key = result_cache.make_key(coverage_rules, closed_days, st.session_state["shifts_day"],
+                                      st.session_state["shifts_night"], st.session_state["stage1_prev_history"],
+                                      oracle_staff)
+    oracle_base = (st.session_state["stage1_result"], index_key)
+    if oracle is None or st.session_state.get("stage2_oracle_base") != oracle_base:
+        oracle = FeasibleOptionsIndex(
+            oracle_staff, st.session_state["stage1_prev_history"], fixed_now, days_in_month,
+            st.session_state["shifts_day"], st.session_state["shifts_night"], closed_days, coverage_rules,
+        )
+        st.session_state["stage2_oracle"] = oracle
+        st.session_state["stage2_oracle_base"] = oracle_base
+    else:
+        oracle.sync(fixed_now)
+
+    conflicts = oracle.conflicts()
+    if conflicts:
+        st.warning(f"⚠️ 規則に反する入力が {len(conflicts)} セルあります"
+                   + ("（ソフトモード: 優先度の低いものから却下されます）" if request_rules is not None
+                      else "（このままだとStage2は失敗します）"))
+        st.dataframe(pd.DataFrame([
+            {"Staff": oracle_staff[s]["name"], "日付": day_headers[d], "入力": v,
+             "選択可能": ", ".join(oracle.options_for(s, d)) or "(なし)"}
+            for s, d, v, _ in conflicts
+        ]), use_container_width=True, hide_index=True)
+
+    with st.expander("🔍 セル別の選択可能コード（現在の固定値から判定）"):
+        options_df = memo("stage2_options", lambda: pd.DataFrame(
+            [[", ".join(oracle.options_for(s, d)) for d in range(days_in_month)] for s in range(len(oracle_staff))],
+            index=[s["name"] for s in oracle_staff], columns=day_headers,
+        ), st.session_state["stage1_result"], fixed_now, index_key)
+        st.dataframe(options_df, use_container_width=True, height=420)
+
     run_stage2 = st.button("✅ Stage2 完成させる", type="primary", key=versioned("run_stage2"))
+    if not run_stage2:
+        return
 
-    if run_stage2:
-        staff_data = st.session_state["stage1_staff_data"]
-        prev_history = st.session_state["stage1_prev_history"]
-        requests = st.session_state["stage1_requests"]
+    staff_data = st.session_state["stage1_staff_data"]
+    prev_history = st.session_state["stage1_prev_history"]
+    requests = st.session_state["stage1_requests"]
 
-        missing = validate_mandatory_coverage(staff_data, st.session_state["shifts_day"], st.session_state["shifts_night"])
-        if missing:
-            st.error(f"必須コードに対応できるスタッフが0人です: {', '.join(missing)}（スタッフのskillsを見直して）")
-            st.stop()
+    missing = validate_mandatory_coverage(staff_data, st.session_state["shifts_day"], st.session_state["shifts_night"],
+                                          coverage_rules)
+    if missing:
+        st.error(f"人数ルールの最低人数を満たせるスタッフが足りません: {', '.join(missing)}（スタッフのskillsを見直して）")
+        return
 
-        for h in day_headers:
-            edited_fixed[h] = edited_fixed[h].map(norm_code)
+    edited_fixed = edited_fixed.assign(**{h: edited_fixed[h].map(norm_code) for h in day_headers})
 
-        with st.spinner("Stage2（完成）を計算中..."):
-            result_df2, summary_df2 = solve_stage2(
-                days_in_month, year, month,
-                prev_history, edited_fixed, staff_data,
-                st.session_state["shifts_day"], st.session_state["shifts_night"],
-                closed_days,
-                APP_VERSION,  # ✅ 캐시 키 버전
-            )
+    with st.spinner("Stage2（完成）を計算中..."):
+        result_df2, summary_df2, run_info2 = solve_stage2(
+            days_in_month, year, month,
+            prev_history, edited_fixed, staff_data,
+            st.session_state["shifts_day"], st.session_state["shifts_night"],
+            closed_days, coverage_rules, encoding, request_rules, fairness,
+            int(portfolio_size),
+            stage2_params,
+        )
+
+    stage2_args = (days_in_month, year, month, prev_history, edited_fixed, staff_data,
+                   st.session_state["shifts_day"], st.session_state["shifts_night"], closed_days, coverage_rules,
+                   encoding, request_rules, fairness)
+    if result_df2 is None:
+        st.error("❌ Stage2 실패: 수정값이 규칙(야근→明, 휴관, 연속근무, 스킬)과 충돌했을 가능성 큼.")
+        show_solve_metrics(run_info2)
+        snapshot_button("stage2", stage2_args, run_info2)
+        return
+
+    st.success("✅ Stage2 완료! (최종 시프트)")
+    if request_rules is not None:
+        show_denied(run_info2.get("denied_requests"), "Stage2 固定セル")
+    show_solve_metrics(run_info2)
+    show_night_spread(result_df2, staff_data, st.session_state["shifts_night"], year, month, fairness)
+    st.write("### 📅 최종 시フト表")
+    st.markdown(generate_colored_table_html(result_df2, requests), unsafe_allow_html=True)
+
+    st.write("### 📊 日別集計")
+    def highlight_zero(val):
+        if isinstance(val, int) and val == 0:
+            return "background-color: #ffcccc; color: red; font-weight: bold;"
+        return ""
+    st.dataframe(summary_df2.style.applymap(highlight_zero, subset=summary_df2.columns[1:]),
+                 height=470, use_container_width=True)
+
+    excel_data = excel_export.create_styled_excel(result_df2, summary_df2, requests, st.session_state["shifts_night"])
+    st.download_button("📥 Excelダウンロード（色付き・集計・希望反映）",
+                       excel_data, f"{year}_{month}_shift_styled.xlsx", key=versioned("dl_excel"))
+    code_times, personal_formats = personal_settings
+    st.download_button("📅 個人別シフト（iCal/CSV・全員分zip）",
+                       lambda: personal_export.zip_bytes(
+                           personal_export.schedule_to_long(result_df2, int(year), int(month), day_headers),
+                           code_times, personal_formats),
+                       f"{year}_{month}_personal_shifts.zip", mime="application/zip", key=versioned("dl_personal"))
+    st.button("📌 このシフトを公開（DB保存・翌月の前月履歴に使用）", key=versioned("publish"),
+              on_click=publish_to_store, args=(prop, int(year), int(month), result_df2, day_headers, run_info2))
+    show_run_info(run_info2, "stage2")
+    snapshot_button("stage2", stage2_args, run_info2)
+
+# 개인별 출력 설정은 fragment 밖 (Stage2 결과 fragment 의 download 콜백이 항상 최신 설정을 잡도록)
+with st.expander("📅 個人別シフト出力の設定（iCal / CSV）"):
+    st.caption("開始・終了は HH:MM。終了≦開始は翌日終了（夜勤）。時間が空欄のコードは終日予定。公・明は出力しません。")
+    code_times_base = memo("code_times_base", lambda: pd.DataFrame(
+        personal_export.default_code_times(st.session_state["shifts_day"], st.session_state["shifts_night"])),
+        st.session_state["shifts_day"], st.session_state["shifts_night"])
+    code_times = st.data_editor(code_times_base, num_rows="dynamic", hide_index=True, use_container_width=True,
+                                key=versioned("code_times_editor"))
+    personal_formats = st.multiselect("出力形式", personal_export.FORMATS, default=list(personal_export.FORMATS),
+                                      key=versioned("personal_formats"))
+personal_settings = (code_times, personal_formats)
 
-        if result_df2 is None:
-            st.error("❌ Stage2 실패: 수정값이 규칙(야근→明, 휴관, 연속근무, 스킬)과 충돌했을 가능성 큼.")
-            st.stop()
-
-        st.success("✅ Stage2 완료! (최종 시프트)")
-        st.write("### 📅 최종 시フト表")
-        st.markdown(generate_colored_table_html(result_df2, requests), unsafe_allow_html=True)
-
-        st.write("### 📊 日別集計")
-        def highlight_zero(val):
-            if isinstance(val, int) and val == 0:
-                return "background-color: #ffcccc; color: red; font-weight: bold;"
-            return ""
-        st.dataframe(summary_df2.style.applymap(highlight_zero, subset=summary_df2.columns[1:]),
-                     height=470, use_container_width=True)
-
-        excel_data = create_styled_excel(result_df2, summary_df2, requests, year, month)
-        st.download_button("📥 Excelダウンロード（色付き・集計・希望反映）",
-                           excel_data, f"{year}_{month}_shift_styled.xlsx", key=versioned("dl_excel"))
+if "stage1_result" in st.session_state:
+    stage2_section(year, month, days_in_month, closed_days, encoding, prop, portfolio_size, stage2_params,
+                   DROPDOWN_STAGE2, personal_settings)
 else:
     st.info("Stage1을 먼저 실행해줘.")
+
+# ✅ 과거 분석: 버튼으로 열기 전에는 아무것도 안 읽음 (fragment 라 필터 변경도 이 블록만 rerun)
+#    읽은 뒤에는 (공개 목록, 필터, Parquet 재작성 횟수) 가 같으면 history / 리포트 재사용
+@st.fragment
+def analytics_section(personal_settings):
+    code_times, personal_formats = personal_settings
+    with st.expander("📈 過去シフト分析（公平性レポート / 公開済みシフト）"):
+        if not st.session_state.get("an_loaded"):
+            if not st.button("📊 分析を読み込む", key=versioned("an_load")):
+                return
+            st.session_state["an_loaded"] = True
+        published = store.list_published(get_store())
+        if not published:
+            st.info("公開済みのシフトがありません。Stage2 完成後に「公開」すると蓄積されます。")
+            return
+        ca, cb, cc = st.columns([2, 2, 1])
+        sel_props = ca.multiselect("施設", sorted({p for p, _, _, _ in published}), key=versioned("an_props"))
+        sel_years = cb.multiselect("年", sorted({y for _, y, _, _ in published}), key=versioned("an_years"))
+        if cc.button("🔁 Parquet再作成", key=versioned("an_rebuild")):
+            paths = analytics.export_all(get_store(), st.session_state["shifts_day"], st.session_state["shifts_night"])
+            st.session_state["an_rebuilds"] = st.session_state.get("an_rebuilds", 0) + 1
+            st.success(f"{len(paths)}ヶ月分を書き出しました。")
+
+        def load():
+            history = analytics.load_history(properties=sel_props, years=sel_years)
+            return history, analytics.fairness_report(history)
+        history, report = memo("analytics_report", load, published, sel_props, sel_years,
+                               st.session_state.get("an_rebuilds", 0))
+        if not report:
+            st.info("Parquet がまだありません。「Parquet再作成」を押してください。")
+            return
+        st.caption(f"{len(history):,} 行（施設×日×スタッフ）")
+        st.download_button("📅 選択期間の個人別シフト（iCal/CSV・全員分zip）",
+                           lambda: personal_export.zip_bytes(history, code_times, personal_formats),
+                           "personal_shifts.zip", mime="application/zip", key=versioned("dl_personal_history"))
+        titles = {
+            "night_by_code": "🌙 夜勤回数（コード別）",
+            "weekend_off": "🗓 週末（土日）の公",
+            "myong": "😴 明（夜勤→明 の連続）",
+            "off_target": "🎯 公休数の目標との差（月平均）",
+            "requests": "✅ 希望の反映率",
+        }
+        for k, title in titles.items():
+            st.write(f"#### {title}")
+            st.dataframe(report[k], use_container_width=True)
+
+st.divider()
+analytics_section(personal_settings)
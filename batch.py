@@ -0,0 +1,375 @@
+"""
+여러 시설 × 여러 달 일괄 생성 (manifest + 프로세스 풀)
+- manifest(JSON):
+    {"defaults": {"time_budget": 60, "shifts_day": [...], "shifts_night": [...], "encoding": "onehot"},
+     "jobs": [{"property": "tokyo", "year": 2026, "month": 2,
+               "staff": "tokyo/staff.csv", "requests": "tokyo/2026_02.csv", "prev": "tokyo/prev.csv",
+               "closed_days": [5], "coverage_rules": "tokyo/rules.json", "soft_requests": true}, ...]}
+  - 경로는 manifest 위치 기준. staff / requests / coverage_rules / request_rules 생략 시 store(SQLite) 의 저장값
+  - soft_requests: true 면 희망/고정 셀을 request_rules 우선순위로 soft (거절된 희망은 status 의 denied 수)
+  - night_fairness: true 또는 {"weight": ..., "per_code": ..., "total": ..., "weekend": ...} 면 야근 횟수 평준화
+    fairness_history_months: N 이면 store 에 공개된 직전 N개월 야근 횟수도 포함 (배치 안 미공개 전월은 제외)
+  - staff.csv = 스태프 편집표 열(name, gender, role, target_off, skills) / requests.csv = Stage1 템플릿(행=이름, 열=N日)
+  - prev 생략 시: 같은 시설 전월이 배치에 있으면 그 결과(끝나는 대로 다음 달 제출), 없으면 store 의 공개 시프트
+- 잡 1개 = Stage1 -> Stage2, time_budget 초를 Stage1 에 stage1_share 만큼, 남은 시간을 Stage2 에
+- 출력: 시설별 xlsx (시트 = 월별 Shift/Summary) 또는 --combined 로 1파일 + status.csv / 상태표 출력
+  (soft 모드에서 거절된 희망이 있으면 denied.csv)
+- 실행: python batch.py manifest.json --out out/ [--processes 8] [--workers 2] [--combined] [--publish]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+import analytics
+import excel_export
+import shift_solver
+import store
+from shift_solver import OFF_CODE, norm_code, build_day_headers, validate_mandatory_coverage
+
+DEFAULT_TIME_BUDGET = 60.0
+DEFAULT_STAGE1_SHARE = 0.5
+MIN_STAGE_SECONDS = 1.0
+
+# =========================================================
+# Manifest / 입력 파일
+# =========================================================
+def read_staff_csv(path):
+    df = pd.read_csv(path)
+    df = df.astype(object).where(df.notna(), None)
+    staff = [s for s in df.to_dict("records") if str(s.get("name") or "").strip()]
+    for s in staff:
+        s["name"] = str(s["name"]).strip()
+        if s.get("target_off") is not None:
+            s["target_off"] = int(s["target_off"])
+    return staff
+
+def read_requests_csv(path):
+    """Stage1 템플릿 CSV (행=이름, 열="1日".."31日") -> {name: {day: code}}"""
+    df = pd.read_csv(path, index_col=0)
+    requests = {}
+    for name, row in df.iterrows():
+        mp = {int(str(col).replace("日", "")): norm_code(v) for col, v in row.items()}
+        mp = {d: c for d, c in mp.items() if c}
+        if mp:
+            requests[str(name)] = mp
+    return requests
+
+def read_prev_csv(path):
+    """前月 템플릿 CSV (행=이름, 열=d-3,d-2,d-1) -> prev_history"""
+    df = pd.read_csv(path, index_col=0)
+    return {str(name): {c: norm_code(row.get(c)) or OFF_CODE for c in store.PREV_COLS} for name, row in df.iterrows()}
+
+def prev_history_from_result(df_result, day_headers):
+    """배치 안의 전월 Stage2 결과 -> 다음 달 prev_history"""
+    last3 = day_headers[-3:]
+    return {name: {c: norm_code(v) or OFF_CODE for c, v in zip(store.PREV_COLS, vals)}
+            for name, vals in zip(df_result["Staff"], df_result[last3].itertuples(index=False))}
+
+def job_key(job):
+    return (job["property"], int(job["year"]), int(job["month"]))
+
+def job_label(key):
+    prop, year, month = key
+    return f"{prop} {year}-{month:02d}"
+
+def load_manifest(path, conn):
+    """
+    manifest -> 잡 리스트 (입력 파일/DB 값을 읽어서 solve 인자까지 채운 dict)
+    - prev_history 가 None 이고 depends_on 이 있으면 배치 안 전월 결과를 기다림
+    """
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    resolve = lambda p: p if os.path.isabs(p) else os.path.join(base_dir, p)
+    defaults = manifest.get("defaults", {})
+
+    jobs = []
+    for raw in manifest["jobs"]:
+        spec = {**defaults, **raw}
+        spec.setdefault("property", store.DEFAULT_PROPERTY)
+        prop, year, month = key = job_key(spec)
+
+        rules = spec.get("coverage_rules")
+        if isinstance(rules, str):
+            with open(resolve(rules), encoding="utf-8") as f:
+                rules = json.load(f)
+        elif rules is None:
+            rules = store.load_coverage_rules(conn, prop)
+
+        request_rules = None
+        if spec.get("soft_requests"):
+            request_rules = spec.get("request_rules")
+            if isinstance(request_rules, str):
+                with open(resolve(request_rules), encoding="utf-8") as f:
+                    request_rules = json.load(f)
+            elif request_rules is None:
+                request_rules = store.load_request_rules(conn, prop) or shift_solver.default_request_rules()
+
+        fairness = spec.get("night_fairness")
+        if fairness:
+            fairness = dict(fairness) if isinstance(fairness, dict) else {}
+            months = int(spec.get("fairness_history_months") or 0)
+            if months:
+                fairness["history"] = analytics.store_night_history(
+                    conn, year, month, months,
+                    list(spec.get("shifts_night") or shift_solver.DEFAULT_SHIFTS_NIGHT), prop)
+        else:
+            fairness = None
+
+        jobs.append({
+            "key": key,
+            "num_days": pd.Period(f"{year}-{month:02d}").days_in_month,
+            "staff_data": read_staff_csv(resolve(spec["staff"])) if spec.get("staff") else store.load_staff(conn, prop),
+            "requests": (read_requests_csv(resolve(spec["requests"])) if spec.get("requests")
+                         else store.load_requests(conn, year, month, prop)),
+            "prev_history": read_prev_csv(resolve(spec["prev"])) if spec.get("prev") else None,
+            "shifts_day": list(spec.get("shifts_day") or shift_solver.DEFAULT_SHIFTS_DAY),
+            "shifts_night": list(spec.get("shifts_night") or shift_solver.DEFAULT_SHIFTS_NIGHT),
+            "closed_days": [int(d) for d in spec.get("closed_days") or []],
+            "coverage_rules": rules,
+            "encoding": spec.get("encoding"),
+            "request_rules": request_rules,
+            "fairness": fairness,
+            "time_budget": float(spec.get("time_budget", DEFAULT_TIME_BUDGET)),
+            "stage1_share": float(spec.get("stage1_share", DEFAULT_STAGE1_SHARE)),
+        })
+
+    keys = {j["key"] for j in jobs}
+    if len(keys) != len(jobs):
+        raise ValueError("manifest に同じ property/year/month のジョブが重複しています")
+    for j in jobs:
+        prop, year, month = j["key"]
+        dep = (prop, *store.prev_month(year, month))
+        j["depends_on"] = dep if j["prev_history"] is None and dep in keys else None
+        if j["prev_history"] is None and j["depends_on"] is None:
+            j["prev_history"] = store.load_prev_history(conn, year, month, prop)
+    return jobs
+
+# =========================================================
+# 잡 실행 (워커 프로세스)
+# =========================================================
+def run_job(job, workers=1):
+    """
+    Stage1 -> Stage2 1회 (예외는 잡 결과로 돌려줌)
+    반환: {"key", "status", "error", "result", "summary", "stage1", "stage2", "seconds"}
+    """
+    t0 = time.perf_counter()
+    out = {"key": job["key"], "status": "ERROR", "error": None, "result": None, "summary": None,
+           "stage1": None, "stage2": None}
+    try:
+        args = (job["num_days"], job["key"][1], job["key"][2], job["prev_history"])
+        common = (job["staff_data"], job["shifts_day"], job["shifts_night"], job["closed_days"],
+                  job["coverage_rules"], job["encoding"], job["request_rules"], job["fairness"])
+        bad = [f"{r['codes']}: {e}" for r in shift_solver.normalize_coverage_rules(job["coverage_rules"])
+               for e in [shift_solver.coverage_rule_error(r)] if e]
+        if bad:
+            out["error"] = "人数ルールに読めない行があります: " + " / ".join(bad)
+            return out
+        missing = validate_mandatory_coverage(job["staff_data"], job["shifts_day"], job["shifts_night"],
+                                              job["coverage_rules"])
+        if missing:
+            out["error"] = "人数ルールの最低人数を満たせるスタッフが足りません: " + ", ".join(missing)
+            return out
+
+        budget = job["time_budget"]
+        p1 = {"max_time_in_seconds": max(MIN_STAGE_SECONDS, budget * job["stage1_share"]), "num_workers": workers}
+        df1, _, info1 = shift_solver.solve_stage1(*args, job["requests"], *common, params=p1)
+        out["stage1"] = info1
+        if df1 is None:
+            out["status"] = "STAGE1_FAILED"
+            return out
+
+        remaining = budget - (time.perf_counter() - t0)
+        p2 = {"max_time_in_seconds": max(MIN_STAGE_SECONDS, remaining), "num_workers": workers}
+        df2, summary2, info2 = shift_solver.solve_stage2(*args, df1, *common, params=p2)
+        out["stage2"] = info2
+        if df2 is None:
+            out["status"] = "STAGE2_FAILED"
+            return out
+
+        out.update(status="OK", result=df2, summary=summary2)
+        return out
+    except Exception:
+        out["error"] = traceback.format_exc(limit=3)
+        return out
+    finally:
+        out["seconds"] = round(time.perf_counter() - t0, 2)
+
+def available_cpus():
+    # 컨테이너/taskset 으로 제한된 경우 os.cpu_count() 는 호스트 전체 수라서 affinity 우선
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+def run_batch(jobs, processes=None, workers=None, on_done=None):
+    """
+    잡들을 프로세스 풀로 (전월 의존 잡은 전월이 끝나면 제출) -> {key: 결과}
+    - processes: 동시 잡 수 (기본 min(잡 수, CPU 수))
+    - workers: 잡당 CP-SAT num_workers (기본 CPU 수 / processes)
+    - 전월이 실패한 잡은 SKIPPED
+    """
+    cpus = available_cpus()
+    processes = processes or max(1, min(len(jobs), cpus))
+    workers = workers or max(1, cpus // processes)
+    waiting = {j["key"]: j for j in jobs}
+    results = {}
+
+    # Streamlit 서버와 같은 이유로 spawn (fork 안 함)
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx) as pool:
+        running = {}
+
+        def submit_ready():
+            for key, job in list(waiting.items()):
+                dep = job["depends_on"]
+                if dep is not None and dep not in results:
+                    continue
+                del waiting[key]
+                if dep is not None:
+                    prev = results[dep]
+                    if prev["status"] != "OK":
+                        results[key] = {"key": key, "status": "SKIPPED", "error": f"前月 {job_label(dep)} が失敗",
+                                        "result": None, "summary": None, "stage1": None, "stage2": None,
+                                        "seconds": 0.0}
+                        if on_done:
+                            on_done(results[key])
+                        continue
+                    dep_headers = build_day_headers(dep[1], dep[2], pd.Period(f"{dep[1]}-{dep[2]:02d}").days_in_month)
+                    job = {**job, "prev_history": prev_history_from_result(prev["result"], dep_headers)}
+                running[pool.submit(run_job, job, workers)] = key
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                res = fut.result()
+                results[running.pop(fut)] = res
+                if on_done:
+                    on_done(res)
+            # SKIPPED 가 연쇄로 생길 수 있으므로 제출할 게 없을 때까지
+            while True:
+                n = len(results)
+                submit_ready()
+                if len(results) == n:
+                    break
+    return results
+
+# =========================================================
+# 출력
+# =========================================================
+def status_report(jobs, results):
+    rows = []
+    for job in jobs:
+        res = results.get(job["key"], {})
+        s1, s2 = res.get("stage1") or {}, res.get("stage2") or {}
+        prop, year, month = job["key"]
+        rows.append({
+            "property": prop,
+            "year": year,
+            "month": month,
+            "status": res.get("status", "NOT_RUN"),
+            "staff": len(job["staff_data"]),
+            "stage1": s1.get("status"),
+            "stage1_objective": s1.get("objective"),
+            "stage1_wall": s1.get("wall_time"),
+            "stage2": s2.get("status"),
+            "stage2_objective": s2.get("objective"),
+            "stage2_wall": s2.get("wall_time"),
+            "hit_time_limit": bool(s1.get("hit_time_limit") or s2.get("hit_time_limit")),
+            # soft 모드에서 거절된 희망 / 고정 셀 수
+            "denied": len(s1.get("denied_requests") or []) + len(s2.get("denied_requests") or []),
+            "seconds": res.get("seconds"),
+            "error": ((res.get("error") or "").strip().splitlines() or [""])[-1],   # traceback 은 마지막 줄만
+        })
+    return pd.DataFrame(rows)
+
+def denied_report(jobs, results):
+    """soft 모드에서 거절된 희망 / 고정 셀 전체 (1행 = 1건)"""
+    rows = []
+    for job in jobs:
+        res = results.get(job["key"], {})
+        prop, year, month = job["key"]
+        for stage in ("stage1", "stage2"):
+            for d in (res.get(stage) or {}).get("denied_requests") or []:
+                rows.append({"property": prop, "year": year, "month": month, "stage": stage, **d})
+    return pd.DataFrame(rows)
+
+def write_workbooks(jobs, results, out_dir, combined=False):
+    """성공한 잡 -> 시설별 xlsx (combined 면 batch_shifts.xlsx 1개), 만든 파일 경로 리스트"""
+    os.makedirs(out_dir, exist_ok=True)
+    books = {}
+    for job in sorted(jobs, key=lambda j: j["key"]):
+        res = results.get(job["key"])
+        if not res or res["status"] != "OK":
+            continue
+        prop, year, month = job["key"]
+        name = "batch_shifts.xlsx" if combined else f"{prop}_shifts.xlsx"
+        wb = books.setdefault(name, excel_export.new_workbook())
+        prefix = f"{prop} {year}-{month:02d} " if combined else f"{year}-{month:02d} "
+        excel_export.add_shift_sheets(wb, res["result"], res["summary"], job["requests"], job["shifts_night"], prefix)
+    paths = []
+    for name, wb in books.items():
+        path = os.path.join(out_dir, name)
+        wb.save(path)
+        paths.append(path)
+    return paths
+
+def publish_results(conn, jobs, results):
+    n = 0
+    for job in jobs:
+        res = results.get(job["key"])
+        if res and res["status"] == "OK":
+            prop, year, month = job["key"]
+            store.publish_schedule(conn, year, month, res["result"], build_day_headers(year, month, job["num_days"]),
+                                   res["stage2"], prop)
+            n += 1
+    return n
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="batch Stage1->Stage2 generation for many properties / months")
+    parser.add_argument("manifest")
+    parser.add_argument("--out", default="batch_out", help="xlsx / status.csv 출력 폴더")
+    parser.add_argument("--processes", type=int, default=None, help="동시 잡 수 (기본 min(잡 수, CPU))")
+    parser.add_argument("--workers", type=int, default=None, help="잡당 CP-SAT ワーカー数 (기본 CPU / processes)")
+    parser.add_argument("--time-budget", type=float, default=None, help="잡당 제한시간(초), manifest 값보다 우선")
+    parser.add_argument("--combined", action="store_true", help="전 시설을 xlsx 1개로")
+    parser.add_argument("--publish", action="store_true", help="성공한 달을 store 에 공개 (翌月 前月履歴)")
+    parser.add_argument("--db", default=None, help="SQLite 경로 (기본 SHIFT_DB_PATH)")
+    args = parser.parse_args(argv)
+
+    conn = store.connect(args.db)
+    jobs = load_manifest(args.manifest, conn)
+    if args.time_budget is not None:
+        for job in jobs:
+            job["time_budget"] = args.time_budget
+
+    t0 = time.perf_counter()
+    on_done = lambda res: print(f"[{time.perf_counter() - t0:7.1f}s] {job_label(res['key'])}: {res['status']}",
+                                flush=True)
+    results = run_batch(jobs, args.processes, args.workers, on_done)
+
+    report = status_report(jobs, results)
+    os.makedirs(args.out, exist_ok=True)
+    report.to_csv(os.path.join(args.out, "status.csv"), index=False)
+    denied = denied_report(jobs, results)
+    if not denied.empty:
+        denied.to_csv(os.path.join(args.out, "denied.csv"), index=False)
+    paths = write_workbooks(jobs, results, args.out, args.combined)
+    if args.publish:
+        print(f"published: {publish_results(conn, jobs, results)}")
+
+    print(report.drop(columns=["error"]).to_string(index=False))
+    for row in report[report["error"].astype(bool)].itertuples():
+        print(f"{row.property} {row.year}-{row.month:02d}: {row.error}")
+    print(f"wrote: {', '.join(paths) or '(none)'} / total {time.perf_counter() - t0:.1f}s")
+    return 0 if (report["status"] == "OK").all() else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
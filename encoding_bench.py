@@ -0,0 +1,139 @@
+"""
+셀 인코딩 벤치마크 (one-hot vs int)
+- 합성 스태프(인원 N, 주간 코드 수 C, seed 고정 랜덤 스킬)로 Stage1 -> Stage2 를 인코딩별로 구성/풀이
+- 측정: 모델 구성 시간 / 구성 중 Python 메모리 peak(tracemalloc) / model.pb 크기 / 변수·제약 수 / 상태·목적값·풀이 시간
+- 실행: python encoding_bench.py --sizes 20 50 100 200 --day-codes 16 [--time-limit 30] [--stage stage1]
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+import shift_solver
+from snapshot import _model_bytes
+
+BASE_DAY_CODES = shift_solver.DEFAULT_SHIFTS_DAY
+NIGHT_CODES = shift_solver.DEFAULT_SHIFTS_NIGHT
+
+def synthetic_shifts(n_day_codes):
+    """기본 주간 코드 + 부족분은 A1, A2, ... 로 채움"""
+    extra = [f"A{i + 1}" for i in range(max(0, n_day_codes - len(BASE_DAY_CODES)))]
+    return BASE_DAY_CODES[:n_day_codes] + extra, list(NIGHT_CODES)
+
+def synthetic_staff(n_staff, shifts_day, shifts_night, seed=0):
+    """
+    랜덤 스킬 스태프 (기본 규칙이 풀리도록: 야근/L1/E1·E2·G1·G1U 는 코드마다 최소 4명 보장)
+    - 1/5 은 Manager, 나머지 Staff
+    """
+    rng = random.Random(seed)
+    core = shifts_night + [c for c in ("L1", "E1", "E2", "G1", "G1U") if c in shifts_day]
+    staff = []
+    for i in range(n_staff):
+        k = rng.randint(min(3, len(shifts_day)), min(8, len(shifts_day)))
+        skills = set(rng.sample(shifts_day, k))
+        if rng.random() < 0.5:
+            skills |= set(rng.sample(shifts_night, rng.randint(1, len(shifts_night))))
+        skills.add(core[i % len(core)])
+        staff.append({
+            "name": f"S{i + 1:03d}",
+            "gender": rng.choice("MF"),
+            "role": "Manager" if i % 5 == 0 else "Staff",
+            "target_off": 8,
+            "skills": ", ".join(sorted(skills) + ["日", shift_solver.MYONG_CODE, shift_solver.OFF_CODE]),
+        })
+    return staff
+
+def synthetic_requests(staff_data, num_days, shifts_day, seed=0):
+    """스태프당 公 2개 + 주간 희망 1개 정도"""
+    rng = random.Random(seed + 1)
+    requests = {}
+    for s in staff_data:
+        own = sorted(c for c in shift_solver.parse_skills(s["skills"]) if c in shifts_day)   # set 순서는 실행마다 다름
+        days = rng.sample(range(1, num_days + 1), 3)
+        requests[s["name"]] = {days[0]: shift_solver.OFF_CODE, days[1]: shift_solver.OFF_CODE,
+                               days[2]: rng.choice(own)}
+    return requests
+
+def measure_build(stage, args, encoding):
+    """-> (model, cells, build_seconds, peak_bytes)"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    model, cells = shift_solver.MODEL_BUILDERS[stage](*args, None, encoding)
+    build_seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return model, cells, build_seconds, peak
+
+def bench_one(n_staff, n_day_codes, year, month, params, stages, seed=0):
+    shifts_day, shifts_night = synthetic_shifts(n_day_codes)
+    staff = synthetic_staff(n_staff, shifts_day, shifts_night, seed)
+    num_days = pd.Period(f"{year}-{month:02d}").days_in_month
+    requests = synthetic_requests(staff, num_days, shifts_day, seed)
+    base = (num_days, year, month, {}, requests, staff, shifts_day, shifts_night, [])
+
+    rows = []
+    fixed_table = None
+    for stage in ("stage1", "stage2"):
+        if stage == "stage2":
+            if fixed_table is None:
+                break
+            base = (num_days, year, month, {}, fixed_table, staff, shifts_day, shifts_night, [])
+        for encoding in shift_solver.ENCODINGS:
+            model, _, build_seconds, peak = measure_build(stage, base, encoding)
+            proto = model.Proto()
+            row = {
+                "staff": n_staff,
+                "codes": len(shifts_day) + len(shifts_night) + len(shift_solver.SPECIAL_CODES),
+                "stage": stage,
+                "encoding": encoding,
+                "variables": len(proto.variables),
+                "constraints": len(proto.constraints),
+                "build": round(build_seconds, 3),
+                "build_peak_mb": round(peak / 2**20, 1),
+                "model_kb": round(len(_model_bytes(model)) / 1024, 1),
+            }
+            if stage in stages:
+                df, _, info = shift_solver.SOLVERS[stage](*base, None, encoding, params=params)
+                row.update(status=info["status"], objective=info["objective"], wall=info["wall_time"],
+                           first_solution=info["first_solution_seconds"])
+                # Stage2 입력은 one-hot Stage1 결과로 통일 (인코딩 간 같은 문제)
+                if stage == "stage1" and encoding == "onehot":
+                    fixed_table = df
+            rows.append(row)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="one-hot vs int cell encoding benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 50, 100, 200], help="스태프 수")
+    parser.add_argument("--day-codes", type=int, default=16, help="주간 코드 수 (야근 3 + 日/明/公 별도)")
+    parser.add_argument("--year", type=int, default=2026)
+    parser.add_argument("--month", type=int, default=1)
+    parser.add_argument("--stage", choices=["stage1", "stage2", "both", "none"], default="both",
+                        help="풀이할 stage (none = 구성만 측정, Stage2 는 stage1 을 풀어야 만들어짐)")
+    parser.add_argument("--seed", type=int, default=0, help="합성 데이터 seed")
+    parser.add_argument("--time-limit", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--csv", default=None, help="결과 CSV 저장 경로")
+    args = parser.parse_args(argv)
+
+    params = {"max_time_in_seconds": args.time_limit}
+    if args.workers is not None:
+        params["num_workers"] = args.workers
+    stages = {"both": ("stage1", "stage2"), "none": ()}.get(args.stage, (args.stage,))
+    if "stage2" in stages:
+        stages = ("stage1", "stage2")
+
+    rows = []
+    for n in args.sizes:
+        rows += bench_one(n, args.day_codes, args.year, args.month, params, stages, args.seed)
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False))
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+색칠된 시프트 Excel (Streamlit 없이 import 가능)
+- app.py 다운로드 버튼 / batch.py 일괄 출력에서 공통 사용
+- add_shift_sheets(): 기존 Workbook 에 Shift + Summary 시트 추가 (시설/월별 여러 세트를 한 파일에)
+"""
+import io
+
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from openpyxl.utils.dataframe import dataframe_to_rows
+
+from shift_solver import OFF_CODE, MYONG_CODE
+
+SHEET_TITLE_MAX = 31   # Excel 시트명 길이 제한
+
+def add_shift_sheets(wb, df_shift, df_summary, requests, night_codes, prefix=""):
+    """wb 에 "<prefix>Shift" / "<prefix>Summary" 시트 추가"""
+    ws_shift = wb.create_sheet((prefix + "Shift")[-SHEET_TITLE_MAX:])
+
+    for r in dataframe_to_rows(df_shift, index=False, header=True):
+        ws_shift.append(r)
+
+    fill_off = PatternFill(start_color="F0F2F6", end_color="F0F2F6", fill_type="solid")
+    fill_night = PatternFill(start_color="FFCDD2", end_color="FFCDD2", fill_type="solid")
+    fill_myong = PatternFill(start_color="FFF9C4", end_color="FFF9C4", fill_type="solid")
+    fill_l1 = PatternFill(start_color="E1BEE7", end_color="E1BEE7", fill_type="solid")
+    fill_nichi = PatternFill(start_color="C8E6C9", end_color="C8E6C9", fill_type="solid")
+
+    fill_sat_bg = PatternFill(start_color="D6EAF8", end_color="D6EAF8", fill_type="solid")
+    fill_sun_bg = PatternFill(start_color="FADBD8", end_color="FADBD8", fill_type="solid")
+
+    thin_border = Border(
+        left=Side(style="thin"), right=Side(style="thin"),
+        top=Side(style="thin"), bottom=Side(style="thin")
+    )
+    center_align = Alignment(horizontal="center", vertical="center")
+
+    font_req = Font(bold=True, color="0000FF")
+    font_sat = Font(bold=True, color="0000FF")
+    font_sun = Font(bold=True, color="FF0000")
+
+    header_row = ws_shift[1]
+    for cell in header_row:
+        cell.alignment = center_align
+        cell.border = thin_border
+        val = str(cell.value)
+        if "(" in val:
+            if "(土)" in val:
+                cell.font = font_sat
+                cell.fill = fill_sat_bg
+            elif "(日)" in val:
+                cell.font = font_sun
+                cell.fill = fill_sun_bg
+
+    for row in ws_shift.iter_rows(min_row=2, max_row=ws_shift.max_row, min_col=1, max_col=ws_shift.max_column):
+        staff_name = str(row[0].value)
+        for cell in row:
+            cell.alignment = center_align
+            cell.border = thin_border
+            val = str(cell.value)
+            col_idx = cell.column
+
+            if val == OFF_CODE:
+                cell.fill = fill_off
+                cell.font = Font(color="BDC3C7")
+            elif val in night_codes:
+                cell.fill = fill_night
+                cell.font = Font(color="B71C1C")
+            elif val == MYONG_CODE:
+                cell.fill = fill_myong
+                cell.font = Font(color="F57F17")
+            elif val == "L1":
+                cell.fill = fill_l1
+            elif val == "日":
+                cell.fill = fill_nichi
+                cell.font = Font(bold=True)
+
+            if col_idx > 2:
+                day_num = col_idx - 2
+                if staff_name in requests and day_num in requests[staff_name]:
+                    if requests[staff_name][day_num] == val:
+                        cell.font = font_req
+
+    ws_summary = wb.create_sheet((prefix + "Summary")[-SHEET_TITLE_MAX:])
+    for r in dataframe_to_rows(df_summary, index=False, header=True):
+        ws_summary.append(r)
+
+    fill_alert = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
+    for row in ws_summary.iter_rows(min_row=2, max_row=ws_summary.max_row, min_col=2, max_col=ws_summary.max_column):
+        for cell in row:
+            cell.alignment = center_align
+            cell.border = thin_border
+            if cell.value == 0:
+                cell.fill = fill_alert
+                cell.font = Font(color="FF0000", bold=True)
+    return ws_shift, ws_summary
+
+def new_workbook():
+    """기본 빈 시트 없는 Workbook"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    return wb
+
+def workbook_bytes(wb):
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def create_styled_excel(df_shift, df_summary, requests, night_codes):
+    """Shift + Summary 2시트 xlsx -> bytes"""
+    wb = new_workbook()
+    add_shift_sheets(wb, df_shift, df_summary, requests, night_codes)
+    return workbook_bytes(wb)
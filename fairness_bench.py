@@ -0,0 +1,101 @@
+"""
+야근 평준화(fairness) 벤치마크 (off vs on)
+- encoding_bench 의 합성 스태프/희망으로 Stage1 을 fairness 없이 / 있이 풀어서 비교 (야근은 Stage1 에서 정해짐)
+  희망은 기본 우선순위 soft (대인원 합성 희망끼리 충돌해도 풀리도록)
+- 측정: 변수·제약 수 / 상태 / 풀이 시간 / 첫 해 시간 / 그룹별 야근 횟수 폭(최대 - 최소, 적격자만)
+- --history-months N: 적격자마다 직전 N개월치 랜덤 야근 횟수(코드당 0..N)를 history 로 줌 (누적 평준화)
+- 참고 (1 CPU, 30초, 단계별 풀이): off 20/50/100명 1.5/3.4/5.2초 OPTIMAL, 200명 시간 한도
+  on 20/50/100/200명 1.7/16/7.5/24초 전부 OPTIMAL (폭은 대부분 1 로 줄어듦)
+- 실행: python fairness_bench.py --sizes 20 50 100 200 300 [--time-limit 30] [--encoding int]
+"""
+import argparse
+import random
+import sys
+
+import pandas as pd
+
+import shift_solver
+from encoding_bench import synthetic_requests, synthetic_shifts, synthetic_staff
+
+def synthetic_history(staff_data, shifts_night, months, seed=0):
+    """야근 스킬 보유자마다 코드당 0..months 회, 주말은 그 합의 약 2/7"""
+    if months <= 0:
+        return None
+    rng = random.Random(seed + 2)
+    history = {}
+    for s in staff_data:
+        own = sorted(c for c in shift_solver.parse_skills(s["skills"]) if c in shifts_night)   # set 순서는 실행마다 다름
+        if not own:
+            continue
+        counts = {c: rng.randint(0, months) for c in own}
+        counts[shift_solver.WEEKEND_KEY] = round(sum(counts.values()) * 2 / 7)
+        history[s["name"]] = counts
+    return history
+
+def spread_columns(df, staff_data, shifts_night, year, month, history):
+    if df is None:
+        return {}
+    spread = shift_solver.night_spread(df, staff_data, shifts_night, year, month, history)
+    return {f"spread_{k}": hi - lo for k, (lo, hi) in spread.items()}
+
+def bench_one(n_staff, n_day_codes, year, month, params, encoding, fairness_weight, history_months, seed=0):
+    shifts_day, shifts_night = synthetic_shifts(n_day_codes)
+    staff = synthetic_staff(n_staff, shifts_day, shifts_night, seed)
+    num_days = pd.Period(f"{year}-{month:02d}").days_in_month
+    requests = synthetic_requests(staff, num_days, shifts_day, seed)
+    history = synthetic_history(staff, shifts_night, history_months, seed)
+    base = (num_days, year, month, {}, requests, staff, shifts_day, shifts_night, [], None, encoding,
+            shift_solver.default_request_rules())
+
+    rows = []
+    for label, fairness in (("off", None), ("on", {"weight": fairness_weight, "history": history})):
+        model, _ = shift_solver.build_stage1_model(*base, fairness)
+        proto = model.Proto()
+        df, _, info = shift_solver.solve_stage1(*base, fairness, params=params)
+        rows.append({
+            "staff": n_staff,
+            "fairness": label,
+            "variables": len(proto.variables),
+            "constraints": len(proto.constraints),
+            "status": info["status"],
+            "objective": info["objective"],
+            "wall": info["wall_time"],
+            "first_solution": info["first_solution_seconds"],
+            "denied": len(info.get("denied_requests") or []),
+            # off 도 같은 history 기준으로 폭을 계산 (누적 관점 비교)
+            **spread_columns(df, staff, shifts_night, year, month, history),
+        })
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="night fairness objective benchmark (Stage1)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 50, 100, 200, 300], help="스태프 수")
+    parser.add_argument("--day-codes", type=int, default=9, help="주간 코드 수 (야근 3 + 日/明/公 별도)")
+    parser.add_argument("--year", type=int, default=2026)
+    parser.add_argument("--month", type=int, default=1)
+    parser.add_argument("--encoding", choices=shift_solver.ENCODINGS, default="onehot")
+    parser.add_argument("--weight", type=int, default=shift_solver.FAIRNESS_DEFAULTS["weight"],
+                        help="폭 1 당 페널티")
+    parser.add_argument("--history-months", type=int, default=0, help="합성 history 개월 수 (0 = 이번 달만)")
+    parser.add_argument("--seed", type=int, default=0, help="합성 데이터 seed")
+    parser.add_argument("--time-limit", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--csv", default=None, help="결과 CSV 저장 경로")
+    args = parser.parse_args(argv)
+
+    params = {"max_time_in_seconds": args.time_limit}
+    if args.workers is not None:
+        params["num_workers"] = args.workers
+
+    rows = []
+    for n in args.sizes:
+        rows += bench_one(n, args.day_codes, args.year, args.month, params, args.encoding, args.weight,
+                          args.history_months, args.seed)
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False))
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+개인별 시프트 출력 (iCalendar / CSV) -> zip 1개
+- 입력은 long 포맷(1행 = 스태프 × 날짜: name, date, code [, property])
+  - 이번 달 Stage2 결과: schedule_to_long() 로 wide -> long (numpy 한 번)
+  - 여러 달 공개분: analytics.load_history() 결과 그대로
+- 코드 -> 시간: code_times 표 (code, start "HH:MM", end "HH:MM", label). end <= start 면 다음날 종료(야근)
+  시간 없는 코드는 종일 이벤트, 公 / 明(-) 은 기본 제외
+- 이벤트 문자열은 열 단위 문자열 연산으로 한 번에 만들고 스태프별 groupby join -> 셀 단위 루프 없음
+- zip 은 파일 객체에 멤버 단위로 씀 (app 은 download_button 에 callable 로 넘겨 클릭 시에만 생성)
+"""
+import datetime
+import io
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from shift_solver import OFF_CODE, MYONG_CODE, WEEKDAY_CHARS
+
+CODE_TIME_COLUMNS = ["code", "start", "end", "label"]
+SKIP_CODES = (OFF_CODE, MYONG_CODE)
+FORMATS = ("ics", "csv")
+CRLF = "\r\n"
+
+def default_code_times(shifts_day, shifts_night):
+    """코드별 빈 시간표 (시간은 시설마다 달라서 비워둠 = 종일 이벤트)"""
+    codes = list(dict.fromkeys(list(shifts_day) + list(shifts_night) + ["日"]))
+    return [{"code": c, "start": "", "end": "", "label": ""} for c in codes]
+
+def _parse_hhmm(s):
+    """'HH:MM' Series -> Timedelta Series (빈칸/형식 오류 NaT)"""
+    s = s.fillna("").astype(str).str.strip()
+    ok = s.str.fullmatch(r"\d{1,2}:\d{2}")
+    parts = s.where(ok, "0:0").str.split(":", expand=True).astype(int)
+    td = pd.to_timedelta(parts[0] * 60 + parts[1], unit="min")
+    return td.where(ok, pd.NaT)
+
+def normalize_code_times(code_times):
+    """레코드/DataFrame -> code 유일한 DataFrame (start/end Timedelta, timed 여부)"""
+    df = pd.DataFrame(code_times, columns=CODE_TIME_COLUMNS) if not isinstance(code_times, pd.DataFrame) \
+        else code_times.reindex(columns=CODE_TIME_COLUMNS)
+    df = df.assign(code=df["code"].fillna("").astype(str).str.strip())
+    df = df[df["code"] != ""].drop_duplicates("code", keep="last")
+    start, end = _parse_hhmm(df["start"]), _parse_hhmm(df["end"])
+    return pd.DataFrame({
+        "code": df["code"].to_numpy(),
+        "start_td": start.to_numpy(),
+        "end_td": end.to_numpy(),
+        "label": df["label"].fillna("").astype(str).str.strip().to_numpy(),
+    })
+
+def schedule_to_long(df_result, year, month, day_headers, prop=None):
+    """Stage2 결과(wide: Staff + day_headers) -> long (name, date, code [, property])"""
+    codes = df_result[day_headers].fillna("").astype(str).to_numpy()
+    n_staff, n_days = codes.shape
+    dates = pd.date_range(datetime.date(year, month, 1), periods=n_days, freq="D")
+    df = pd.DataFrame({
+        "name": np.repeat(df_result["Staff"].astype(str).to_numpy(), n_days),
+        "date": np.tile(dates.to_numpy(), n_staff),
+        "code": codes.ravel(),
+    })
+    if prop is not None:
+        df.insert(0, "property", prop)
+    return df
+
+def build_events(long_df, code_times, skip_codes=SKIP_CODES):
+    """
+    long -> 이벤트 표 (근무 1건 = 1행): owner / date / code / label / start / end / timed
+    - owner = (property, name) 키 (여러 시설 같은 이름 구분)
+    """
+    df = long_df.loc[:, [c for c in ("property", "name", "date", "code") if c in long_df.columns]].copy()
+    df["code"] = df["code"].astype(str)
+    df = df[(df["code"] != "") & ~df["code"].isin(list(skip_codes))]
+    if "property" not in df.columns:
+        df["property"] = ""
+    df["property"] = df["property"].astype(str)
+    df["name"] = df["name"].astype(str)
+    df["date"] = pd.to_datetime(df["date"]).dt.normalize()
+
+    times = normalize_code_times(code_times)
+    df = df.merge(times, on="code", how="left")
+    df["timed"] = df["start_td"].notna() & df["end_td"].notna()
+    overnight = df["timed"] & (df["end_td"] <= df["start_td"])
+    df["start"] = df["date"] + df["start_td"].fillna(pd.Timedelta(0))
+    df["end"] = df["date"] + df["end_td"].fillna(pd.Timedelta(0)) + pd.to_timedelta(overnight.astype(int), unit="D")
+    df["label"] = df["label"].fillna("")
+    return df.drop(columns=["start_td", "end_td"]).sort_values(["property", "name", "date"], kind="stable")
+
+def _ics_escape(s):
+    return (s.str.replace("\\", "\\\\", regex=False).str.replace(";", "\\;", regex=False)
+             .str.replace(",", "\\,", regex=False))
+
+def _ics_events(ev, stamp):
+    """이벤트 표 -> VEVENT 문자열 Series (벡터 연산)"""
+    all_day_start = ev["date"].dt.strftime("%Y%m%d")
+    all_day_end = (ev["date"] + pd.Timedelta(days=1)).dt.strftime("%Y%m%d")
+    dtstart = np.where(ev["timed"], "DTSTART:" + ev["start"].dt.strftime("%Y%m%dT%H%M%S"),
+                       "DTSTART;VALUE=DATE:" + all_day_start)
+    dtend = np.where(ev["timed"], "DTEND:" + ev["end"].dt.strftime("%Y%m%dT%H%M%S"),
+                     "DTEND;VALUE=DATE:" + all_day_end)
+    owner_hash = pd.util.hash_pandas_object(ev[["property", "name"]], index=False).map("{:016x}".format)
+    summary = np.where(ev["label"] != "", ev["code"] + " " + ev["label"], ev["code"])
+    return ("BEGIN:VEVENT" + CRLF
+            + "UID:" + owner_hash + "-" + all_day_start + "@hotel-shift" + CRLF
+            + "DTSTAMP:" + stamp + CRLF
+            + pd.Series(dtstart, index=ev.index) + CRLF
+            + pd.Series(dtend, index=ev.index) + CRLF
+            + "SUMMARY:" + _ics_escape(pd.Series(summary, index=ev.index)) + CRLF
+            + "END:VEVENT" + CRLF)
+
+def _csv_lines(ev):
+    """이벤트 표 -> CSV 1행 문자열 Series"""
+    weekday = pd.Series(np.array(WEEKDAY_CHARS)[ev["date"].dt.weekday.to_numpy()], index=ev.index)
+    start = ev["start"].dt.strftime("%Y-%m-%d %H:%M").where(ev["timed"], "")
+    end = ev["end"].dt.strftime("%Y-%m-%d %H:%M").where(ev["timed"], "")
+    return (ev["date"].dt.strftime("%Y-%m-%d") + "," + weekday + "," + ev["code"] + ","
+            + ev["label"].str.replace(",", " ", regex=False) + "," + start + "," + end + "\n")
+
+def _safe_filename(s):
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", s).strip("_") or "_"
+
+def personal_files(long_df, code_times, formats=FORMATS, skip_codes=SKIP_CODES, calendar_tz="Asia/Tokyo"):
+    """
+    -> (파일 경로, 텍스트) 제너레이터 (스태프 1명 = ics 1개 / csv 1개)
+    - 시설이 여러 개면 "<property>/<name>.ics" 로 폴더 구분
+    """
+    ev = build_events(long_df, code_times, skip_codes)
+    if ev.empty:
+        return
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    keys = ["property", "name"]
+    bodies = {}
+    if "ics" in formats:
+        bodies["ics"] = _ics_events(ev, stamp).groupby([ev["property"], ev["name"]], sort=False).agg("".join)
+    if "csv" in formats:
+        bodies["csv"] = _csv_lines(ev).groupby([ev["property"], ev["name"]], sort=False).agg("".join)
+    multi_prop = ev["property"].nunique() > 1
+
+    for prop, name in ev[keys].drop_duplicates().itertuples(index=False):
+        stem = (_safe_filename(prop) + "/" if multi_prop else "") + _safe_filename(name)
+        if "ics" in bodies:
+            yield stem + ".ics", ("BEGIN:VCALENDAR" + CRLF + "VERSION:2.0" + CRLF
+                                  + "PRODID:-//hotel-shift-manager//personal//JA" + CRLF
+                                  + "CALSCALE:GREGORIAN" + CRLF
+                                  + f"X-WR-CALNAME:{name} シフト" + CRLF
+                                  + f"X-WR-TIMEZONE:{calendar_tz}" + CRLF
+                                  + bodies["ics"][(prop, name)] + "END:VCALENDAR" + CRLF)
+        if "csv" in bodies:
+            yield stem + ".csv", "日付,曜日,コード,内容,開始,終了\n" + bodies["csv"][(prop, name)]
+
+def write_zip(fileobj, long_df, code_times, formats=FORMATS, skip_codes=SKIP_CODES):
+    """fileobj 에 zip 을 멤버 단위로 씀 -> 파일 수"""
+    n = 0
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for path, text in personal_files(long_df, code_times, formats, skip_codes):
+            with zf.open(path, "w") as f:
+                f.write(text.encode("utf-8-sig" if path.endswith(".csv") else "utf-8"))
+            n += 1
+    return n
+
+def zip_bytes(long_df, code_times, formats=FORMATS, skip_codes=SKIP_CODES):
+    buf = io.BytesIO()
+    write_zip(buf, long_df, code_times, formats, skip_codes)
+    return buf.getvalue()
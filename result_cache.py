@@ -0,0 +1,190 @@
+"""
+메모리 상한 있는 결과 캐시 + 시프트표 int 코드 압축
+- BoundedCache: 엔트리 수 / 바이트 상한 + TTL, LRU 로 밀어냄 (프로세스 공용, 스레드 안전)
+- CompactSchedule / CompactTable: 문자열 DataFrame 대신 코드 사전 + int8/int32 배열로 보관
+- compact() / expand(): solve 반환값(튜플/리스트/dict 안의 DataFrame 포함)을 통째로 변환
+"""
+import hashlib
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# Compact storage
+# =========================================================
+class CompactSchedule:
+    """Staff 열 + 정수 열(공휴수 등) + 코드 열(날짜) 시프트표"""
+
+    __slots__ = ("names", "int_cols", "ints", "code_cols", "vocab", "codes")
+
+    def __init__(self, df):
+        self.names = tuple(df["Staff"])
+        self.int_cols = [c for c in df.columns if c != "Staff" and pd.api.types.is_integer_dtype(df[c])]
+        self.ints = df[self.int_cols].to_numpy(dtype=np.int16)
+        self.code_cols = [c for c in df.columns if c != "Staff" and c not in self.int_cols]
+        codes, vocab = pd.factorize(df[self.code_cols].to_numpy().ravel(), use_na_sentinel=False)
+        self.vocab = tuple(vocab)
+        self.codes = codes.astype(np.int8).reshape(len(df), len(self.code_cols))
+
+    def to_frame(self):
+        df = pd.DataFrame({"Staff": list(self.names)})
+        for i, c in enumerate(self.int_cols):
+            df[c] = self.ints[:, i].astype(np.int64)
+        vocab = np.array(self.vocab, dtype=object)
+        decoded = pd.DataFrame(vocab[self.codes], columns=self.code_cols)
+        return pd.concat([df, decoded], axis=1)
+
+    @property
+    def nbytes(self):
+        return self.ints.nbytes + self.codes.nbytes + sum(sys.getsizeof(s) for s in self.names + self.vocab)
+
+class CompactTable:
+    """라벨 1열 + 나머지 정수 열 표 (日別集計 등)"""
+
+    __slots__ = ("label_col", "labels", "columns", "values")
+
+    def __init__(self, df):
+        self.label_col = df.columns[0]
+        self.labels = tuple(df[self.label_col])
+        self.columns = list(df.columns[1:])
+        self.values = df[self.columns].to_numpy(dtype=np.int32)
+
+    def to_frame(self):
+        df = pd.DataFrame(self.values.astype(np.int64), columns=self.columns)
+        df.insert(0, self.label_col, list(self.labels))
+        return df
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + sum(sys.getsizeof(s) for s in self.labels)
+
+def _compact_frame(df):
+    if "Staff" in df.columns and len(df) and df.index.equals(pd.RangeIndex(len(df))):
+        return CompactSchedule(df)
+    if len(df.columns) > 1 and all(pd.api.types.is_integer_dtype(df[c]) for c in df.columns[1:]):
+        return CompactTable(df)
+    return df
+
+def compact(obj):
+    """DataFrame(시프트표/집계) -> Compact*, 컨테이너는 재귀"""
+    if isinstance(obj, pd.DataFrame):
+        return _compact_frame(obj)
+    if isinstance(obj, tuple):
+        return tuple(compact(x) for x in obj)
+    if isinstance(obj, list):
+        return [compact(x) for x in obj]
+    return obj
+
+def expand(obj):
+    """compact() 역변환 (매번 새 DataFrame 이라 호출측에서 수정해도 캐시 안전)"""
+    if isinstance(obj, (CompactSchedule, CompactTable)):
+        return obj.to_frame()
+    if isinstance(obj, tuple):
+        return tuple(expand(x) for x in obj)
+    if isinstance(obj, list):
+        return [expand(x) for x in obj]
+    return obj
+
+# =========================================================
+# Memory accounting
+# =========================================================
+def estimate_bytes(obj, _seen=None):
+    """대략적인 점유 바이트 (DataFrame 은 deep, 컨테이너/객체는 재귀)"""
+    _seen = set() if _seen is None else _seen
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (CompactSchedule, CompactTable)):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_bytes(k, _seen) + estimate_bytes(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_bytes(x, _seen) for x in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_bytes(vars(obj), _seen)
+    return size
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:,.0f}{unit}" if unit == "B" else f"{n:,.1f}{unit}"
+        n /= 1024
+
+# =========================================================
+# Bounded LRU cache
+# =========================================================
+def make_key(*parts):
+    return hashlib.sha1(pickle.dumps(parts, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+class BoundedCache:
+    """엔트리 수 / 총 바이트 / TTL 상한이 있는 LRU (값은 compact() 후 보관 권장)"""
+
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024, ttl_seconds=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()   # key -> (value, nbytes, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        """-> (hit, value)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl_seconds and time.time() - item[2] > self.ttl_seconds:
+                self._drop(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[0]
+
+    def put(self, key, value):
+        nbytes = estimate_bytes(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return False
+            self._data[key] = (value, nbytes, time.time())
+            self._bytes += nbytes
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+            return True
+
+    def _drop(self, key):
+        _, nbytes, _ = self._data.pop(key)
+        self._bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,1407 @@
+"""
+호텔 시프트 솔버 코어 (Streamlit 없이 import 가능)
+- app.py(UI), 병렬 포트폴리오 프로세스, 재현(replay) 실행에서 공통으로 사용
+"""
+import datetime
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from ortools.sat.python import cp_model
+
+# =========================================================
+# Base Config
+# =========================================================
+
+OFF_CODE = "公"
+MYONG_CODE = "-"     # 明け
+UNASSIGNED_CODE = "未"  # Stage1 내부용(표시는 빈칸)
+WEEKDAY_CHARS = ["月", "火", "水", "木", "金", "土", "日"]
+
+DEFAULT_SHIFTS_DAY = ["E1", "E2", "G1", "G1U", "H1", "H2", "I1", "I2", "L1"]
+DEFAULT_SHIFTS_NIGHT = ["Q1", "X1", "R1"]
+
+SPECIAL_CODES = ["日", MYONG_CODE, OFF_CODE]
+SPECIAL_CODES_STAGE1 = ["日", MYONG_CODE, OFF_CODE, UNASSIGNED_CODE]
+
+# =========================================================
+# Helpers
+# =========================================================
+def norm_code(x):
+    if pd.isna(x):
+        return ""
+    s = str(x).strip()
+    if s == "":
+        return ""
+    if s.upper() == "OFF" or s in ["休", "公休"]:
+        return OFF_CODE
+    if s == "明":
+        return MYONG_CODE
+    if s == "D":
+        return ""   # ✅ D 제거
+    return s
+
+def build_day_headers(year, month, num_days):
+    headers = []
+    for d in range(num_days):
+        cur_date = datetime.date(year, month, d + 1)
+        w_str = WEEKDAY_CHARS[cur_date.weekday()]
+        headers.append(f"{d + 1}日({w_str})")
+    return headers
+
+def parse_skills(skill_str: str):
+    if skill_str is None:
+        return set()
+    s = str(skill_str).replace("明", MYONG_CODE).replace("OFF", OFF_CODE)
+    items = [x.strip() for x in s.split(",") if x.strip()]
+    items = [x for x in items if x != "D"]
+    return set(items)
+
+def validate_mandatory_coverage(staff_data, shifts_day, shifts_night, coverage_rules=None):
+    """하드 min 규칙 중 적격 스태프 수가 min 보다 적은 것 -> ["Q1", "E1+E2(Manager)", ...]"""
+    if coverage_rules is None:
+        coverage_rules = default_coverage_rules(shifts_day, shifts_night)
+    known = set(shifts_day) | set(shifts_night) | set(SPECIAL_CODES)
+    skill_sets = [parse_skills(s.get("skills", "")) for s in staff_data]
+    missing = []
+    for rule in normalize_coverage_rules(coverage_rules):
+        codes = set(coverage_rule_codes(rule, shifts_day, shifts_night)) & known
+        if rule["weight"] > 0 or not rule["min"] or not codes:
+            continue
+        eligible = [i for i, sk in enumerate(skill_sets)
+                    if sk & codes and (not rule["role"] or staff_data[i].get("role") == rule["role"])]
+        if len(eligible) < rule["min"]:
+            label = rule["codes"] + (f"({rule['role']})" if rule["role"] else "")
+            if label not in missing:
+                missing.append(label)
+    return missing
+
+def fixed_cells_from_table(fixed_table, staff_data, day_headers):
+    """Stage2 편집표 -> {(s_idx, d): code} (빈칸 제외)"""
+    name_to_idx = {s["name"]: i for i, s in enumerate(staff_data)}
+    cells = {}
+    for _, r in fixed_table.iterrows():
+        name = r["Staff"]
+        if name not in name_to_idx:
+            continue
+        s_idx = name_to_idx[name]
+        for d, col in enumerate(day_headers):
+            v = norm_code(r.get(col, ""))
+            if v != "":
+                cells[(s_idx, d)] = v
+    return cells
+
+# =========================================================
+# Coverage rules (선언형 인원 규칙 테이블)
+# =========================================================
+# 1행 = 1규칙
+# - codes    : "Q1" / "E1+E2+G1+G1U" (합산) / "@day" "@night" (日勤·夜勤 코드 전체)
+# - role     : "" = 전원 / "Manager" 등 역할 한정
+# - weekdays : "" = 매일 / "土,日" / "月-金"
+# - days     : "" = 매일 / "1-10,25" (그 달의 날짜)
+# - months   : "" = 매월 / "7,8" / "12-2" (시즌)
+# - min/max  : 빈칸 = 제한 없음
+# - weight   : 0 = 하드 / >0 = soft (부족·초과 1명당 penalty)
+# - stages   : "1,2" / "2"
+# - on_closed: 휴관일에도 적용할지
+# - per_day  : soft 일 때 부족·초과가 있는 날 1일당 weight (인원 수 무관, 기존 E+G / Manager 규칙 방식)
+COVERAGE_RULE_COLUMNS = ["codes", "role", "weekdays", "days", "months", "min", "max", "weight", "stages", "on_closed",
+                         "per_day"]
+
+def _blank(x):
+    return x is None or (isinstance(x, float) and x != x) or str(x).strip() == ""
+
+def normalize_coverage_rules(rules):
+    """data_editor 레코드/JSON -> 빈칸·NaN 정리한 규칙 dict 리스트 (codes 없는 행은 버림)"""
+    out = []
+    for r in rules or []:
+        if _blank(r.get("codes")):
+            continue
+        out.append({
+            "codes": str(r["codes"]).strip(),
+            "role": "" if _blank(r.get("role")) else str(r["role"]).strip(),
+            "weekdays": "" if _blank(r.get("weekdays")) else str(r["weekdays"]).strip(),
+            "days": "" if _blank(r.get("days")) else str(r["days"]).strip(),
+            "months": "" if _blank(r.get("months")) else str(r["months"]).strip(),
+            "min": None if _blank(r.get("min")) else int(r["min"]),
+            "max": None if _blank(r.get("max")) else int(r["max"]),
+            "weight": 0 if _blank(r.get("weight")) else int(r["weight"]),
+            "stages": "1,2" if _blank(r.get("stages")) else str(r["stages"]).strip(),
+            "on_closed": False if _blank(r.get("on_closed")) else bool(r["on_closed"]),
+            "per_day": False if _blank(r.get("per_day")) else bool(r["per_day"]),
+        })
+    return out
+
+def default_coverage_rules(shifts_day, shifts_night):
+    """기존 하드코딩 규칙: 야근 코드별 1명 / L1 1명 (하드), E+G>=2 / Manager 주간>=1 (Stage2 soft)"""
+    rules = [{"codes": c, "min": 1, "max": 1, "stages": "1,2"} for c in shifts_night]
+    if "L1" in shifts_day:
+        rules.append({"codes": "L1", "min": 1, "max": 1, "stages": "1,2"})
+    rules.append({"codes": "E1+E2+G1+G1U", "min": 2, "weight": 50000, "stages": "2", "on_closed": True, "per_day": True})
+    rules.append({"codes": "@day", "role": "Manager", "min": 1, "weight": 50000, "stages": "2", "on_closed": True,
+                  "per_day": True})
+    return normalize_coverage_rules(rules)
+
+def _range_tokens(text):
+    # "、" / "〜" "~" "－" 도 받아줌 (일본어 입력 그대로)
+    text = str(text).replace("、", ",")
+    for ch in ("〜", "～", "~", "－", "ー"):
+        text = text.replace(ch, "-")
+    return [tok.strip() for tok in text.split(",") if tok.strip()]
+
+def _parse_int_set(text, lo, hi):
+    # "1-10,25" -> {1..10, 25},  "12-2" (lo..hi 순환) -> {12, 1, 2}  (범위 밖 / 숫자 아님 -> ValueError)
+    out = set()
+    for tok in _range_tokens(text):
+        ends = [int(x) for x in tok.split("-", 1)]
+        if any(not lo <= x <= hi for x in ends):
+            raise ValueError(tok)
+        if len(ends) == 2:
+            a, b = ends
+            span = (b - a) % (hi - lo + 1)
+            out.update((a - lo + k) % (hi - lo + 1) + lo for k in range(span + 1))
+        else:
+            out.add(ends[0])
+    return out
+
+def _parse_weekdays(text):
+    # "土,日" / "月-金" -> weekday 번호 set (月=0)  (모르는 요일 -> ValueError)
+    idx = {c: i for i, c in enumerate(WEEKDAY_CHARS)}
+    out = set()
+    for tok in _range_tokens(text):
+        ends = [x.strip() for x in tok.split("-", 1)]
+        if any(x not in idx for x in ends):
+            raise ValueError(tok)
+        if len(ends) == 2:
+            a, b = (idx[x] for x in ends)
+            out.update((a + k) % 7 for k in range((b - a) % 7 + 1))
+        else:
+            out.add(idx[ends[0]])
+    return out
+
+COVERAGE_TEXT_FIELDS = {
+    # 필드 -> (파서, 입력 예)
+    "weekdays": (_parse_weekdays, "土,日 / 月-金"),
+    "days": (lambda t: _parse_int_set(t, 1, 31), "1-10,25"),
+    "months": (lambda t: _parse_int_set(t, 1, 12), "7,8 / 12-2"),
+}
+
+def coverage_rule_error(rule):
+    """정규화된 규칙 1개의 weekdays/days/months 를 미리 파싱 -> 문제 있으면 메시지, 없으면 None"""
+    for field, (parse, example) in COVERAGE_TEXT_FIELDS.items():
+        if not rule[field]:
+            continue
+        try:
+            parse(rule[field])
+        except ValueError:
+            return f"{field}「{rule[field]}」を読めません（例: {example}）"
+    return None
+
+def coverage_rule_codes(rule, shifts_day, shifts_night):
+    """규칙 codes -> 실제 코드 리스트 (@day/@night 전개, 순서 유지·중복 제거)"""
+    alias = {"@day": list(shifts_day), "@night": list(shifts_night)}
+    codes = []
+    for tok in str(rule["codes"]).replace("+", ",").split(","):
+        tok = tok.strip()
+        for c in alias.get(tok, [tok] if tok else []):
+            if c not in codes:
+                codes.append(c)
+    return codes
+
+def coverage_rule_days(rule, num_days, year, month, closed_idx):
+    """규칙이 걸리는 day index 리스트"""
+    if rule["months"] and month not in _parse_int_set(rule["months"], 1, 12):
+        return []
+    weekdays = _parse_weekdays(rule["weekdays"]) if rule["weekdays"] else None
+    dates = _parse_int_set(rule["days"], 1, num_days) if rule["days"] else None
+    first_wd = datetime.date(year, month, 1).weekday()
+    return [
+        d for d in range(num_days)
+        if (rule["on_closed"] or d not in closed_idx)
+        and (weekdays is None or (first_wd + d) % 7 in weekdays)
+        and (dates is None or d + 1 in dates)
+    ]
+
+def _rule_applies_to(rule, stage):
+    return str(stage) in [x.strip() for x in rule["stages"].split(",")]
+
+def unknown_coverage_codes(coverage_rules, shifts_day, shifts_night):
+    """규칙에 있지만 근무 코드 설정에 없는 코드 (무시됨)"""
+    known = set(shifts_day) | set(shifts_night) | set(SPECIAL_CODES)
+    out = []
+    for rule in normalize_coverage_rules(coverage_rules):
+        for c in coverage_rule_codes(rule, shifts_day, shifts_night):
+            if c not in known and c not in out:
+                out.append(c)
+    return out
+
+def unique_coverage_codes(coverage_rules, shifts_day, shifts_night):
+    """Stage2 에서 매일(휴관 제외) 하루 최대 1명인 단일 코드 (편집 가이드의 '하루 1명' 전파용)"""
+    out = set()
+    for rule in normalize_coverage_rules(coverage_rules):
+        codes = coverage_rule_codes(rule, shifts_day, shifts_night)
+        if (len(codes) == 1 and rule["weight"] == 0 and rule["max"] == 1 and not rule["role"]
+                and not (rule["weekdays"] or rule["days"] or rule["months"]) and _rule_applies_to(rule, 2)):
+            out.add(codes[0])
+    return out
+
+def add_coverage_constraints(model, cells, coverage_rules, stage, staff_data, all_shifts, shifts_day, shifts_night,
+                             num_days, year, month, closed_idx, tag=""):
+    """
+    규칙 테이블 -> 모델 (반환: soft penalty 리스트)
+    - cells: 셀 뷰 (OneHotCells / IntCells)
+    - 적격 인덱스(코드그룹 -> 스킬 있는 스태프와 그 코드) 로 항을 만들어서 스킬상 0 인 변수는 식에 안 넣음
+    - (코드그룹, role, 날짜) 당 선형식 1개, 같은 식의 하드 규칙은 [max(min), min(max)] 로 합쳐 제약 1개
+    - soft: 부족/초과 IntVar × weight (per_day 규칙은 "부족한 날" BoolVar × weight)
+    """
+    skills = [parse_skills(s.get("skills", "")) for s in staff_data]
+
+    hard = {}    # (codes, role, d) -> [lo, hi]
+    soft = []    # (codes, role, d, rule)
+    for rule in normalize_coverage_rules(coverage_rules):
+        if not _rule_applies_to(rule, stage):
+            continue
+        codes = tuple(c for c in coverage_rule_codes(rule, shifts_day, shifts_night) if c in all_shifts)
+        if not codes or (rule["min"] is None and rule["max"] is None):
+            continue
+        for d in coverage_rule_days(rule, num_days, year, month, closed_idx):
+            if rule["weight"] > 0:
+                soft.append((codes, rule["role"], d, rule))
+                continue
+            lo_hi = hard.setdefault((codes, rule["role"], d), [0, None])
+            if rule["min"] is not None:
+                lo_hi[0] = max(lo_hi[0], rule["min"])
+            if rule["max"] is not None:
+                lo_hi[1] = rule["max"] if lo_hi[1] is None else min(lo_hi[1], rule["max"])
+
+    eligible = {}   # (codes, role) -> [(s, 그 사람이 가진 codes)]
+    terms_cache = {}
+    def terms(codes, role, d):
+        if (codes, role) not in eligible:
+            eligible[(codes, role)] = [
+                (s, [c for c in codes if c in skills[s]]) for s in range(len(staff_data))
+                if skills[s].intersection(codes) and (not role or staff_data[s].get("role") == role)
+            ]
+        key = (codes, role, d)
+        if key not in terms_cache:
+            terms_cache[key] = [cells.count(s, d, cs) for s, cs in eligible[(codes, role)]]
+        return terms_cache[key]
+
+    for (codes, role, d), (lo, hi) in hard.items():
+        t = terms(codes, role, d)
+        if not t:
+            if lo > 0:
+                model.AddBoolOr([])   # 적격자 0명인데 필수 -> 불가능 (빈 식 제약은 솔버가 무시하므로 명시)
+            continue
+        model.AddLinearConstraint(cp_model.LinearExpr.Sum(t), lo, len(t) if hi is None else hi)
+
+    penalties = []
+    for i, (codes, role, d, rule) in enumerate(soft):
+        t = terms(codes, role, d)
+        expr = cp_model.LinearExpr.Sum(t)
+        if rule["per_day"]:
+            if rule["min"] is not None:
+                short = model.NewBoolVar(f"{tag}cov{i}_short_d{d}")
+                model.Add(expr >= rule["min"]).OnlyEnforceIf(short.Not())
+                penalties.append(short * rule["weight"])
+            if rule["max"] is not None:
+                over = model.NewBoolVar(f"{tag}cov{i}_over_d{d}")
+                model.Add(expr <= rule["max"]).OnlyEnforceIf(over.Not())
+                penalties.append(over * rule["weight"])
+            continue
+        if rule["min"] is not None:
+            short = model.NewIntVar(0, rule["min"], f"{tag}cov{i}_short_d{d}")
+            model.Add(expr + short >= rule["min"])
+            penalties.append(short * rule["weight"])
+        if rule["max"] is not None:
+            over = model.NewIntVar(0, len(t), f"{tag}cov{i}_over_d{d}")
+            model.Add(expr - over <= rule["max"])
+            penalties.append(over * rule["weight"])
+    return penalties
+
+# =========================================================
+# Request priorities (희망 / 고정 셀 soft 모드)
+# =========================================================
+# request_rules=None 이면 기존대로 전부 하드. 규칙을 주면 희망(Stage1) / 고정 셀(Stage2) 이 가중 soft 리터럴
+# 1행 = 1규칙, 위에서부터 처음 맞는 규칙의 weight 적용 (role 한정 행을 위에 두면 역할별 우선순위)
+# - codes : "公" / "@night" / "@day" / "日" / "-" / "E1+E2" (coverage 규칙과 같은 표기)
+# - role  : "" = 전원 / "Manager" 등
+# - stages: "1" = Stage1 희망 / "2" = Stage2 고정 셀 / "1,2"
+# - weight: 0 = 하드 / >0 = 거절 1건당 penalty (커버리지 soft 50000, 公 목표 100000 보다 충분히 크게)
+# 맞는 규칙이 없는 희망은 하드
+REQUEST_RULE_COLUMNS = ["codes", "role", "stages", "weight"]
+
+def normalize_request_rules(rules):
+    out = []
+    for r in rules or []:
+        if _blank(r.get("codes")):
+            continue
+        out.append({
+            "codes": str(r["codes"]).strip(),
+            "role": "" if _blank(r.get("role")) else str(r["role"]).strip(),
+            "stages": "1,2" if _blank(r.get("stages")) else str(r["stages"]).strip(),
+            "weight": 0 if _blank(r.get("weight")) else int(r["weight"]),
+        })
+    return out
+
+def default_request_rules():
+    """公 > 야근 > 日 > 주간 희망, 明(-) 은 야근 고정에 딸려오므로 야근과 같게"""
+    return normalize_request_rules([
+        {"codes": OFF_CODE, "weight": 10_000_000},
+        {"codes": "@night", "weight": 5_000_000},
+        {"codes": MYONG_CODE, "stages": "2", "weight": 5_000_000},
+        {"codes": "日", "weight": 3_000_000},
+        {"codes": "@day", "weight": 1_000_000},
+    ])
+
+def request_weights(request_rules, wanted, staff_data, stage, shifts_day, shifts_night):
+    """{(s, d): code} -> {(s, d): weight} (0 = 하드)"""
+    rules = [(r, set(coverage_rule_codes(r, shifts_day, shifts_night)))
+             for r in normalize_request_rules(request_rules) if _rule_applies_to(r, stage)]
+    out = {}
+    for (s, d), code in wanted.items():
+        role = staff_data[s].get("role")
+        out[(s, d)] = next((r["weight"] for r, codes in rules
+                            if code in codes and (not r["role"] or r["role"] == role)), 0)
+    return out
+
+def requests_to_cells(requests, staff_data, num_days):
+    """Stage1 희망 {name: {day: code}} -> {(s_idx, d): code}"""
+    cells = {}
+    for s_idx, staff in enumerate(staff_data):
+        for day, code in requests.get(staff["name"], {}).items():
+            if 1 <= day <= num_days and code:
+                cells[(s_idx, day - 1)] = code
+    return cells
+
+def add_wanted_cells(cells, wanted, weights, all_shifts):
+    """희망/고정 셀 적용: weight 0 은 fix, >0 은 거절 penalty 리스트로"""
+    penalties = []
+    for (s, d), code in wanted.items():
+        if code not in all_shifts:
+            continue
+        w = weights.get((s, d), 0)
+        if w > 0:
+            penalties.append(w * (1 - cells.lit(s, d, code)))
+        else:
+            cells.fix(s, d, code)
+    return penalties
+
+def denied_requests(df_result, wanted, staff_data, day_headers, weights=None):
+    """결과에서 안 지켜진 희망/고정 셀 -> [{Staff, 日付, 希望, 結果, weight}] (weight 큰 순)"""
+    out = []
+    for (s, d), code in wanted.items():
+        got = norm_code(df_result.iloc[s][day_headers[d]])
+        if got != code:
+            out.append({"Staff": staff_data[s]["name"], "日付": day_headers[d], "希望": code, "結果": got,
+                        "weight": (weights or {}).get((s, d), 0)})
+    return sorted(out, key=lambda r: -r["weight"])
+
+# =========================================================
+# Night fairness (야근 횟수 평준화, 선택)
+# =========================================================
+# fairness=None 이면 없음. dict 로 주면 그룹별 min/max 폭(hi - lo) * weight 를 목적에 추가
+# - per_code: 야근 코드별 (Q1/X1/R1 각각, 그 코드 스킬 보유자끼리)
+# - total   : 야근 합계 (야근 스킬 하나라도 있는 사람끼리)
+# - weekend : 土日 야근 합계 (同上)
+# - history : {name: {code: n, ..., "weekend": n}} 이전 달까지 누적 (없으면 이번 달만)
+# 쌍별 |a-b| 대신 그룹당 IntVar 2개 (hi >= 각자, lo <= 각자) -> 제약 수 = 적격자 수 × 2
+# weight 는 가중합(Stage2 / 대안)에서만 쓰임: solve_stage1 은 희망·커버리지 다음 순위로 단계별 최소화 (run_phases)
+WEEKEND_KEY = "weekend"
+FAIRNESS_DEFAULTS = {"weight": 10000, "per_code": True, "total": True, "weekend": True, "history": None}
+
+def fairness_groups(fairness, staff_data, shifts_night, num_days, year, month):
+    """-> [(그룹명, 코드 리스트, day index 리스트, 적격 staff index, history 키)]"""
+    f = {**FAIRNESS_DEFAULTS, **(fairness or {})}
+    skill_sets = [parse_skills(s.get("skills", "")) for s in staff_data]
+    all_days = list(range(num_days))
+    first_wd = datetime.date(year, month, 1).weekday()
+    weekend_days = [d for d in all_days if (first_wd + d) % 7 >= 5]
+    night_eligible = [i for i, sk in enumerate(skill_sets) if sk & set(shifts_night)]
+
+    groups = []
+    if f["per_code"]:
+        for c in shifts_night:
+            groups.append((c, [c], all_days, [i for i, sk in enumerate(skill_sets) if c in sk], c))
+    if f["total"] and len(shifts_night) > 1:
+        groups.append(("night", list(shifts_night), all_days, night_eligible, None))
+    if f["weekend"]:
+        groups.append((WEEKEND_KEY, list(shifts_night), weekend_days, night_eligible, WEEKEND_KEY))
+    return [g for g in groups if len(g[3]) >= 2 and g[2]]
+
+def _history_count(history, name, key, codes):
+    h = (history or {}).get(name) or {}
+    if key is not None:
+        return int(h.get(key, 0) or 0)
+    return sum(int(h.get(c, 0) or 0) for c in codes)
+
+def add_night_fairness(model, cells, fairness, staff_data, shifts_night, num_days, year, month, tag=""):
+    """야근 공평성 -> penalties (fairness=None / weight 0 이면 [], {} 는 기본값으로 on)"""
+    if fairness is None:
+        return []
+    f = {**FAIRNESS_DEFAULTS, **fairness}
+    if not f["weight"]:
+        return []
+    penalties = []
+    for name, codes, days, eligible, hist_key in fairness_groups(f, staff_data, shifts_night, num_days, year, month):
+        hist = {s: _history_count(f["history"], staff_data[s]["name"], hist_key, codes) for s in eligible}
+        ub = len(days) + max(hist.values())
+        hi = model.NewIntVar(0, ub, f"{tag}fair_{name}_hi")
+        lo = model.NewIntVar(0, ub, f"{tag}fair_{name}_lo")
+        counts = [sum(cells.count(s, d, codes) for d in days) + hist[s] for s in eligible]
+        for n in counts:
+            model.Add(hi >= n)
+            model.Add(lo <= n)
+        # 중복 제약 (lo <= 평균 <= hi): LP 완화가 평균 근처 폭 하한을 바로 알게 돼서 최적 증명이 빨라짐
+        model.Add(sum(counts) <= hi * len(eligible))
+        model.Add(sum(counts) >= lo * len(eligible))
+        penalties.append((hi - lo) * f["weight"])
+    return penalties
+
+def night_spread(df_result, staff_data, shifts_night, year, month, history=None):
+    """결과 시프트의 그룹별 야근 횟수 폭 -> {그룹명: (min, max)} (적격자만, history 포함)"""
+    num_days = len(df_result.columns) - 3
+    day_headers = build_day_headers(year, month, num_days)
+    codes = df_result[day_headers].to_numpy()
+    out = {}
+    for name, gcodes, days, eligible, hist_key in fairness_groups({}, staff_data, shifts_night, num_days, year, month):
+        counts = [int(pd.Series(codes[s, days]).isin(gcodes).sum())
+                  + _history_count(history, staff_data[s]["name"], hist_key, gcodes) for s in eligible]
+        out[name] = (min(counts), max(counts))
+    return out
+
+class FeasibleOptionsIndex:
+    """
+    Stage2 편집용 (staff, day)별 "아직 넣을 수 있는 코드" 인덱스
+    - 고정셀 기준으로 solve_stage2 의 하드 규칙을 전파:
+      스킬 / 휴관 / 전월 이월 / 야근→明 / 明→주간불가 / 하루 1명 코드(커버리지 규칙) / 야근 간격 / 5일창 근무<=4
+    - 셀 변경 시 영향 범위(같은 날 전원 + 같은 스태프 ±4일)만 재계산
+    - 전파만 하므로 "여기 넣으면 확실히 불가"만 잡음 (통과해도 solve 실패 가능)
+    """
+
+    def __init__(self, staff_data, prev_history, fixed_cells, num_days,
+                 shifts_day, shifts_night, closed_days, coverage_rules=None):
+        self.num_days = num_days
+        self.n_staff = len(staff_data)
+        self.shifts_day = list(shifts_day)
+        self.shifts_night = list(shifts_night)
+        self.all_shifts = list(shifts_day) + list(shifts_night) + SPECIAL_CODES
+        self.closed_idx = set([d - 1 for d in closed_days if 1 <= d <= num_days])
+        self.no_after_myong = set(shifts_day) | {"日", MYONG_CODE}
+        if coverage_rules is None:
+            coverage_rules = default_coverage_rules(shifts_day, shifts_night)
+        self.unique_codes = unique_coverage_codes(coverage_rules, shifts_day, shifts_night) & set(self.all_shifts)
+        # 휴관일: 모델과 같은 집합(야근 + L1)을 금지, 하루 1명은 on_closed 규칙만
+        self.closed_forbidden = set(shifts_night) | {"L1"}
+        self.closed_unique = unique_coverage_codes(
+            [r for r in normalize_coverage_rules(coverage_rules) if r["on_closed"]], shifts_day, shifts_night
+        ) & set(self.all_shifts)
+
+        self.allowed = [parse_skills(s.get("skills", "")) & set(self.all_shifts) for s in staff_data]
+        self.hist = []
+        for s in staff_data:
+            h = prev_history.get(s["name"], {})
+            self.hist.append([norm_code(h.get(k, OFF_CODE)) or OFF_CODE for k in ("d-3", "d-2", "d-1")])
+
+        self.fixed = dict(fixed_cells)
+        self.options = {}
+        for s in range(self.n_staff):
+            for d in range(num_days):
+                self.options[(s, d)] = self._cell_options(s, d)
+
+    def _code_at(self, s, d):
+        # d<0 은 전월 기록 (항상 확정), 범위 밖/빈칸은 None
+        if -3 <= d < 0:
+            return self.hist[s][d + 3]
+        return self.fixed.get((s, d))
+
+    def _cell_options(self, s, d):
+        opts = set(self.allowed[s])
+        night = set(self.shifts_night)
+
+        if d in self.closed_idx:
+            opts -= self.closed_forbidden
+
+        # 전날 -> 오늘
+        prev = self._code_at(s, d - 1)
+        if prev is not None:
+            if prev in night:
+                opts &= {MYONG_CODE}
+            elif d > 0:
+                opts.discard(MYONG_CODE)
+            if prev == MYONG_CODE:
+                opts -= self.no_after_myong
+
+        # 오늘 -> 다음날
+        if d + 1 < self.num_days:
+            nxt = self.fixed.get((s, d + 1))
+            if nxt == MYONG_CODE:
+                opts &= night
+            elif nxt is not None:
+                opts -= night
+                if nxt in self.no_after_myong:
+                    opts.discard(MYONG_CODE)
+
+        # 하루 1명 코드 (기본: 야근/L1)
+        unique = self.closed_unique if d in self.closed_idx else self.unique_codes
+        for o in range(self.n_staff):
+            if o != s and self.fixed.get((o, d)) in unique:
+                opts.discard(self.fixed[(o, d)])
+
+        # 야근 간격: d, d+2, d+4 중 2개까지
+        for t in (d - 4, d - 2, d):
+            if t < 0 or t + 4 >= self.num_days:
+                continue
+            others = [x for x in (t, t + 2, t + 4) if x != d]
+            if all(self.fixed.get((s, x)) in night for x in others):
+                opts -= night
+
+        # 5일창 근무<=4 (전월 3일 포함)
+        for k in range(d - 4, d + 1):
+            if k < -3 or k + 4 >= self.num_days:
+                continue
+            others = [self._code_at(s, x) for x in range(k, k + 5) if x != d]
+            if all(c is not None and c != OFF_CODE for c in others):
+                opts &= {OFF_CODE}
+
+        return opts
+
+    def update(self, changed_cells):
+        """changed_cells: {(s_idx, d): code or ""} -> 재계산한 셀 집합"""
+        touched = set()
+        for (s, d), code in changed_cells.items():
+            if code:
+                self.fixed[(s, d)] = code
+            else:
+                self.fixed.pop((s, d), None)
+            for dd in range(max(0, d - 4), min(self.num_days, d + 5)):
+                touched.add((s, dd))
+            for o in range(self.n_staff):
+                touched.add((o, d))
+        for cell in touched:
+            self.options[cell] = self._cell_options(*cell)
+        return touched
+
+    def sync(self, fixed_cells):
+        """현재 편집표 전체와 비교해서 바뀐 셀만 update"""
+        changed = {}
+        for cell in set(self.fixed) | set(fixed_cells):
+            new = fixed_cells.get(cell, "")
+            if self.fixed.get(cell, "") != new:
+                changed[cell] = new
+        if changed:
+            self.update(changed)
+        return changed
+
+    def conflicts(self):
+        """[(s_idx, d, 입력값, 가능코드)] : 고정값이 불가 or 빈칸인데 선택지 0개"""
+        out = []
+        for (s, d), opts in self.options.items():
+            v = self.fixed.get((s, d))
+            if (v is not None and v not in opts) or (v is None and not opts):
+                out.append((s, d, v or "", opts))
+        return sorted(out, key=lambda x: (x[1], x[0]))
+
+    def options_for(self, s, d):
+        order = {c: i for i, c in enumerate(self.all_shifts)}
+        return sorted(self.options[(s, d)], key=lambda c: order.get(c, len(order)))
+
+# =========================================================
+# Solver (2-Stage)
+# =========================================================
+DEFAULT_SOLVER_PARAMS = {"max_time_in_seconds": 10.0, "num_workers": 8}
+
+class _SolutionLog(cp_model.CpSolverSolutionCallback):
+    """탐색 중 발견된 해의 (경과초, 목적값) 기록"""
+
+    def __init__(self):
+        super().__init__()
+        self.history = []
+
+    def on_solution_callback(self):
+        self.history.append((round(self.WallTime(), 2), self.ObjectiveValue()))
+
+DEADLINE_MIN_SECONDS = 1.0
+
+def run_solver(model, params=None):
+    """
+    CpSolver 실행 -> (solver, status, run_info)
+    - params: DEFAULT_SOLVER_PARAMS 위에 덮어쓸 CP-SAT 파라미터 (필드명 그대로)
+      예) max_time_in_seconds / relative_gap_limit / absolute_gap_limit / num_workers / stop_after_first_solution
+    - params["wall_deadline"] (CP-SAT 파라미터 아님, time.time() 기준 시각): 있으면 제한시간 = Solve 직전에 남은 시간
+      (최소 DEADLINE_MIN_SECONDS) -> 모델 구성에 쓴 시간도 예산에서 빠짐 (포트폴리오 멤버용)
+    - run_info: 상태, 목적값, best bound, gap, 첫 해까지 시간, 시간제한 도달 여부,
+      실제 사용한 파라미터 + deterministic_time (replay 용)
+    """
+    used = dict(DEFAULT_SOLVER_PARAMS)
+    used.update(params or {})
+    deadline = used.pop("wall_deadline", None)
+    if deadline is not None:
+        used["max_time_in_seconds"] = max(DEADLINE_MIN_SECONDS, deadline - time.time())
+    solver = cp_model.CpSolver()
+    for name, value in used.items():
+        setattr(solver.parameters, name, value)
+    log = _SolutionLog()
+    status = solver.Solve(model, log)
+    ok = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+
+    objective = solver.ObjectiveValue() if ok else None
+    bound = solver.BestObjectiveBound() if ok else None
+    wall = solver.WallTime()
+    limit = used.get("max_time_in_seconds")
+    run_info = {
+        "status": solver.StatusName(status),
+        "objective": objective,
+        "best_bound": bound,
+        "gap": abs(objective - bound) / max(1.0, abs(objective)) if ok else None,
+        "first_solution_seconds": log.history[0][0] if log.history else None,
+        "solutions": len(log.history),
+        # OPTIMAL/INFEASIBLE 이 아닌데 제한시간을 다 썼으면 시간이 병목
+        "hit_time_limit": bool(status in (cp_model.FEASIBLE, cp_model.UNKNOWN)
+                               and not used.get("stop_after_first_solution")
+                               and limit and wall >= 0.95 * limit),
+        "params": used,
+        "deterministic_time": solver.ResponseProto().deterministic_time,
+        "wall_time": round(wall, 3),
+    }
+    return solver, status, run_info
+
+PHASE_MIN_SECONDS = 0.5
+
+def _objective_value(solver, terms):
+    return round(sum(solver.Value(t) for t in terms))
+
+def run_phases(model, phases, params=None, after_phase=None):
+    """
+    우선순위 순 목적 [(이름, 항 리스트), ...] 를 차례로 최소화 (lexicographic) -> (solver, status, run_info)
+    - 단계마다 직전 해 전체를 hint 로 주고, 직전 단계 목적값을 상한 제약으로 고정
+    - after_phase(name, solver): 단계가 끝난 뒤 추가 고정 (예: 야근 셀 고정)
+    - max_time_in_seconds 는 전체 예산: 단계마다 남은 시간 (최소 PHASE_MIN_SECONDS)
+      wall_deadline 이 있으면 예산 = 그 시각까지 남은 시간 (run_solver 와 같음)
+    - replay: params["phase_deterministic_times"] 가 있으면 단계별로 그 deterministic_time 에서 멈춤
+      (None = 원래 최적 증명까지 간 단계: 끝에서 잰 시간으로 자르면 증명 직전에 멈출 수 있어서 제한 없이)
+    - 상태 OPTIMAL = 모든 단계가 (앞 단계 고정 하에서) 최적 증명, 목적값 = 전 단계 항의 합
+    """
+    params = dict(params or {})
+    phase_dtimes = params.pop("phase_deterministic_times", None)
+    deadline = params.pop("wall_deadline", None)
+    t0 = time.time()
+    if deadline is not None:
+        params["max_time_in_seconds"] = max(DEADLINE_MIN_SECONDS, deadline - t0)
+    used = {**DEFAULT_SOLVER_PARAMS, **params}
+    budget = used["max_time_in_seconds"]
+
+    done = []        # (name, solver, status, run_info)
+    for k, (name, terms) in enumerate(phases):
+        if phase_dtimes is not None and k >= len(phase_dtimes):
+            break      # 원래 실행도 여기서 시간 부족으로 멈춤
+        p = dict(params)
+        if phase_dtimes is not None:
+            p.pop("max_time_in_seconds", None)
+            p.pop("max_deterministic_time", None)
+            if phase_dtimes[k] is not None:
+                p["max_deterministic_time"] = phase_dtimes[k]
+        else:
+            p["max_time_in_seconds"] = max(PHASE_MIN_SECONDS, budget - (time.time() - t0))
+        model.Minimize(sum(terms))
+        solver, status, info = run_solver(model, p)
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            if not done:
+                return solver, status, {**info, "params": used, "phases": [{"name": name, "status": info["status"]}]}
+            break      # 시간 부족 등: 직전 단계 해를 그대로 씀
+        done.append((name, solver, status, info))
+        if k == len(phases) - 1:
+            break
+        if terms:
+            model.Add(sum(terms) <= _objective_value(solver, terms))
+        model.clear_hints()
+        hint = model.Proto().solution_hint
+        hint.vars.extend(range(len(model.Proto().variables)))
+        hint.values.extend(solver.ResponseProto().solution)
+        if after_phase is not None:
+            after_phase(name, solver)
+
+    solver, status = done[-1][1], done[-1][2]
+    optimal = len(done) == len(phases) and all(st == cp_model.OPTIMAL for _, _, st, _ in done)
+    objective = sum(_objective_value(solver, terms) for _, terms in phases)
+    infos = [info for _, _, _, info in done]
+    run_info = {
+        "status": "OPTIMAL" if optimal else "FEASIBLE",
+        "objective": float(objective),
+        "best_bound": float(objective) if optimal else None,
+        "gap": 0.0 if optimal else None,
+        "first_solution_seconds": infos[0]["first_solution_seconds"],
+        "solutions": sum(i["solutions"] for i in infos),
+        "hit_time_limit": any(i["hit_time_limit"] for i in infos) or len(done) < len(phases),
+        "params": used,
+        "deterministic_time": sum(i["deterministic_time"] for i in infos),
+        "wall_time": round(time.time() - t0, 3),
+        "phases": [{"name": name, "status": info["status"], "objective": info["objective"],
+                    "wall_time": info["wall_time"], "deterministic_time": info["deterministic_time"]}
+                   for name, _, _, info in done],
+    }
+    return solver, (cp_model.OPTIMAL if optimal else cp_model.FEASIBLE), run_info
+
+# =========================================================
+# 셀 인코딩 (one-hot / int)
+# =========================================================
+# 모델 규칙은 셀 뷰(lit / count / fix / forbid / forbid_if) 로만 씀 -> 인코딩 교체 가능
+# - onehot: (staff, day, code) 마다 BoolVar + 셀당 exactly-one (기존 방식)
+# - int   : 셀당 IntVar 1개 (도메인 = 스킬 있는 코드 index), Bool 은 규칙이 실제로 세는 코드/코드묶음만 필요할 때 생성
+ENCODINGS = ("onehot", "int")
+
+class OneHotCells:
+    def __init__(self, model, tag, n_staff, num_days, codes, allowed):
+        self.model = model
+        self.codes = list(codes)
+        self.allowed = allowed
+        self.x = {}
+        for s in range(n_staff):
+            for d in range(num_days):
+                for code in self.codes:
+                    self.x[(s, d, code)] = model.NewBoolVar(f"{tag}s{s}_d{d}_{code}")
+        for s in range(n_staff):
+            for d in range(num_days):
+                model.Add(sum(self.x[(s, d, c)] for c in self.codes) == 1)
+        for s in range(n_staff):
+            for d in range(num_days):
+                for code in self.codes:
+                    if code not in allowed[s]:
+                        model.Add(self.x[(s, d, code)] == 0)
+
+    def lit(self, s, d, code):
+        return self.x[(s, d, code)]
+
+    def count(self, s, d, codes):
+        """셀이 codes 중 하나면 1 인 식"""
+        return sum(self.x[(s, d, c)] for c in codes if c in self.codes)
+
+    def fix(self, s, d, code):
+        self.model.Add(self.x[(s, d, code)] == 1)
+
+    def forbid(self, s, d, codes):
+        for c in codes:
+            if c in self.codes:
+                self.model.Add(self.x[(s, d, c)] == 0)
+
+    def forbid_if(self, s, d, codes, cond):
+        for c in codes:
+            if c in self.codes:
+                self.model.AddImplication(cond, self.x[(s, d, c)].Not())
+
+    def value(self, solver, s, d):
+        for code in self.codes:
+            if solver.Value(self.x[(s, d, code)]):
+                return code
+        return "ERR"
+
+class IntCells:
+    def __init__(self, model, tag, n_staff, num_days, codes, allowed):
+        self.model = model
+        self.tag = tag
+        self.codes = list(codes)
+        self.index = {c: i for i, c in enumerate(self.codes)}
+        self.allowed_idx = [sorted(self.index[c] for c in self.codes if c in allowed[s]) for s in range(n_staff)]
+        self.cell = {}
+        for s in range(n_staff):
+            # 스킬이 하나도 없으면 빈 도메인은 MODEL_INVALID 라서 더미 도메인 + 빈 절 -> INFEASIBLE (one-hot 과 같은 결과)
+            if not self.allowed_idx[s]:
+                model.AddBoolOr([])
+            dom = cp_model.Domain.FromValues(self.allowed_idx[s] or [0])
+            for d in range(num_days):
+                self.cell[(s, d)] = model.NewIntVarFromDomain(dom, f"{tag}c{s}_d{d}")
+        self._false = model.NewBoolVar(f"{tag}false")
+        model.Add(self._false == 0)
+        self._true = self._false.Not()
+        self._lits = {}
+
+    def _idxs(self, s, codes):
+        want = {self.index[c] for c in codes if c in self.index}
+        return [i for i in self.allowed_idx[s] if i in want]
+
+    def _in_set(self, s, d, idxs, name):
+        b = self.model.NewBoolVar(f"{self.tag}{name}_s{s}_d{d}")
+        rest = [i for i in self.allowed_idx[s] if i not in idxs]
+        self.model.AddLinearExpressionInDomain(self.cell[(s, d)], cp_model.Domain.FromValues(idxs)).OnlyEnforceIf(b)
+        self.model.AddLinearExpressionInDomain(self.cell[(s, d)], cp_model.Domain.FromValues(rest)).OnlyEnforceIf(b.Not())
+        return b
+
+    def count(self, s, d, codes):
+        idxs = tuple(self._idxs(s, codes))
+        if not idxs:
+            return self._false
+        if len(idxs) == len(self.allowed_idx[s]):
+            return self._true
+        key = (s, d, idxs)
+        if key not in self._lits:
+            self._lits[key] = self._in_set(s, d, list(idxs), "is" + "_".join(str(i) for i in idxs))
+        return self._lits[key]
+
+    def lit(self, s, d, code):
+        return self.count(s, d, [code])
+
+    def fix(self, s, d, code):
+        self.model.Add(self.cell[(s, d)] == self.index[code])
+
+    def forbid(self, s, d, codes):
+        for i in self._idxs(s, codes):
+            self.model.Add(self.cell[(s, d)] != i)
+
+    def forbid_if(self, s, d, codes, cond):
+        idxs = set(self._idxs(s, codes))
+        if not idxs:
+            return
+        rest = [i for i in self.allowed_idx[s] if i not in idxs]
+        if not rest:
+            self.model.AddBoolOr([cond.Not()])
+            return
+        self.model.AddLinearExpressionInDomain(self.cell[(s, d)], cp_model.Domain.FromValues(rest)).OnlyEnforceIf(cond)
+
+    def value(self, solver, s, d):
+        return self.codes[solver.Value(self.cell[(s, d)])]
+
+CELL_ENCODINGS = {"onehot": OneHotCells, "int": IntCells}
+
+def make_cells(model, tag, encoding, staff_data, num_days, codes, extra_allowed=()):
+    """인코딩 이름 -> 셀 뷰 (allowed = 스킬 ∩ codes + extra_allowed)"""
+    allowed = [parse_skills(s.get("skills", "")) | set(extra_allowed) for s in staff_data]
+    return CELL_ENCODINGS[encoding or "onehot"](model, tag, len(staff_data), num_days, codes, allowed)
+
+def add_stage1_model(model, tag, num_days, year, month, prev_history, requests, staff_data,
+                     shifts_day, shifts_night, closed_idx, coverage_rules=None, encoding=None, request_rules=None,
+                     fairness=None):
+    """
+    Stage1 변수/제약을 model 에 추가 -> (cells, tiers)
+    - tiers: 목적 항을 우선순위 순으로 [("main", 희망·커버리지), ("fairness", 야근 평준화), ("tie_breaks", 주간/未 선호)]
+      가중합이면 전부 더해서 Minimize, 평준화 on 이면 solve_stage1 이 단계별로 (run_phases)
+    - tag: 변수명 prefix (대안 여러 개를 한 모델에 넣을 때 구분용)
+    - coverage_rules: None 이면 default_coverage_rules (stages 에 1 이 있는 규칙만 적용)
+    - encoding: "onehot"(기본) / "int" -> 셀 뷰 (OneHotCells / IntCells)
+    - request_rules: None 이면 희망 전부 하드 / 규칙 있으면 우선순위별 soft (stages 에 1 이 있는 규칙)
+    - fairness: None 이면 없음 / dict 면 야근 횟수 평준화 (야근은 Stage1 에서 정해지므로 여기가 주 적용처)
+    """
+    ALL_SHIFTS = shifts_day + shifts_night + SPECIAL_CODES_STAGE1
+    staff_indices = range(len(staff_data))
+    days_indices = range(num_days)
+
+    cells = make_cells(model, tag, encoding, staff_data, num_days, ALL_SHIFTS, extra_allowed=[UNASSIGNED_CODE])
+
+    # prev month carry
+    for s_idx, staff in enumerate(staff_data):
+        name = staff["name"]
+        h_d1 = norm_code(prev_history.get(name, {}).get("d-1", OFF_CODE))
+        h_d2 = norm_code(prev_history.get(name, {}).get("d-2", OFF_CODE))
+        h_d3 = norm_code(prev_history.get(name, {}).get("d-3", OFF_CODE))
+
+        if h_d1 in shifts_night:
+            cells.fix(s_idx, 0, MYONG_CODE)
+
+        if h_d1 == MYONG_CODE:
+            cells.forbid(s_idx, 0, shifts_day + ["日", MYONG_CODE])
+
+        w_d3 = 1 if h_d3 != OFF_CODE else 0
+        w_d2 = 1 if h_d2 != OFF_CODE else 0
+        w_d1 = 1 if h_d1 != OFF_CODE else 0
+        c0 = 1 - cells.lit(s_idx, 0, OFF_CODE) if 0 < num_days else 0
+        c1 = 1 - cells.lit(s_idx, 1, OFF_CODE) if 1 < num_days else 0
+
+        model.Add(w_d3 + w_d2 + w_d1 + c0 + c1 <= 4)
+        if num_days >= 3:
+            c2 = 1 - cells.lit(s_idx, 2, OFF_CODE)
+            model.Add(w_d2 + w_d1 + c0 + c1 + c2 <= 4)
+        if num_days >= 4:
+            c2 = 1 - cells.lit(s_idx, 2, OFF_CODE)
+            c3 = 1 - cells.lit(s_idx, 3, OFF_CODE)
+            model.Add(w_d1 + c0 + c1 + c2 + c3 <= 4)
+
+    # night -> next day is 明(-)
+    for s in staff_indices:
+        for d in range(num_days - 1):
+            model.Add(cells.lit(s, d + 1, MYONG_CODE) == cells.count(s, d, shifts_night))
+
+    # 明(-) -> next day cannot be day shift / 日 / 明
+    for s in staff_indices:
+        for d in range(num_days - 1):
+            cells.forbid_if(s, d + 1, shifts_day + ["日", MYONG_CODE], cells.lit(s, d, MYONG_CODE))
+
+    # spacing night: d, d+2, d+4 <= 2
+    for s in staff_indices:
+        for d in range(num_days - 4):
+            n1 = cells.count(s, d, shifts_night)
+            n2 = cells.count(s, d + 2, shifts_night)
+            n3 = cells.count(s, d + 4, shifts_night)
+            model.Add(n1 + n2 + n3 <= 2)
+
+    # 5 days window work <= 4
+    for s in staff_indices:
+        for d in range(num_days - 4):
+            works = [1 - cells.lit(s, d + k, OFF_CODE) for k in range(5)]
+            model.Add(sum(works) <= 4)
+
+    # closed day: no night and no L1
+    for d in closed_idx:
+        for s in staff_indices:
+            cells.forbid(s, d, shifts_night + ["L1"])
+
+    # user requests: 기본 하드 / request_rules 있으면 우선순위별 soft
+    wanted = requests_to_cells(requests, staff_data, num_days)
+    weights = request_weights(request_rules, wanted, staff_data, 1, shifts_day, shifts_night)
+    request_penalties = add_wanted_cells(cells, wanted, weights, ALL_SHIFTS)
+
+    # ✅ 커버리지 규칙 테이블 (기본: 야근 코드별 1명 + L1 1명, 휴관일 제외)
+    if coverage_rules is None:
+        coverage_rules = default_coverage_rules(shifts_day, shifts_night)
+    penalties = add_coverage_constraints(model, cells, coverage_rules, 1, staff_data, ALL_SHIFTS,
+                                         shifts_day, shifts_night, num_days, year, month, closed_idx, tag)
+    penalties += request_penalties
+    fairness_penalties = add_night_fairness(model, cells, fairness, staff_data, shifts_night, num_days, year, month,
+                                            tag)
+
+    # Objective: prefer leaving unspecified day shifts as UNASSIGNED
+    tie_breaks = []
+    requested_day_cells = set()
+    for name, mp in requests.items():
+        for day, code in mp.items():
+            if code in shifts_day or code == "日":
+                requested_day_cells.add((name, day))
+
+    for s_idx, staff in enumerate(staff_data):
+        name = staff["name"]
+        for d in days_indices:
+            day_num = d + 1
+            if (name, day_num) in requested_day_cells:
+                continue
+            tie_breaks.append(cells.count(s_idx, d, shifts_day) * 2000)
+            tie_breaks.append(-50 * cells.lit(s_idx, d, UNASSIGNED_CODE))
+
+    return cells, [("main", penalties), ("fairness", fairness_penalties), ("tie_breaks", tie_breaks)]
+
+def extract_stage1_result(solver, cells, staff_data, num_days, year, month):
+    staff_indices = range(len(staff_data))
+    days_indices = range(num_days)
+    day_headers = build_day_headers(year, month, num_days)
+
+    schedule_data = []
+    for s in staff_indices:
+        row = {"Staff": staff_data[s]["name"]}
+        vals = [cells.value(solver, s, d) for d in days_indices]
+        off_days = sum(1 for v in vals if v == OFF_CODE)
+        row["公休数"] = off_days
+        row["勤務日数(公以外)"] = num_days - off_days
+
+        for d in days_indices:
+            row[day_headers[d]] = "" if vals[d] == UNASSIGNED_CODE else vals[d]
+
+        schedule_data.append(row)
+
+    return pd.DataFrame(schedule_data)
+
+def build_stage1_model(num_days, year, month, prev_history, requests, staff_data,
+                       shifts_day, shifts_night, closed_days, coverage_rules=None, encoding=None, request_rules=None,
+                       fairness=None):
+    """Stage1 모델 구성 -> (model, cells) (목적 = 전 항 가중합)"""
+    model, cells, _ = _build_stage1(num_days, year, month, prev_history, requests, staff_data, shifts_day,
+                                    shifts_night, closed_days, coverage_rules, encoding, request_rules, fairness)
+    return model, cells
+
+def _build_stage1(num_days, year, month, prev_history, requests, staff_data,
+                  shifts_day, shifts_night, closed_days, coverage_rules, encoding, request_rules, fairness):
+    model = cp_model.CpModel()
+    closed_idx = set([d - 1 for d in closed_days if 1 <= d <= num_days])
+    cells, tiers = add_stage1_model(model, "", num_days, year, month, prev_history, requests, staff_data,
+                                    shifts_day, shifts_night, closed_idx, coverage_rules, encoding, request_rules,
+                                    fairness)
+    model.Minimize(sum(t for _, terms in tiers for t in terms))
+    return model, cells, tiers
+
+def solve_stage1(num_days, year, month, prev_history, requests, staff_data,
+                shifts_day, shifts_night, closed_days, coverage_rules=None, encoding=None, request_rules=None,
+                fairness=None, params=None):
+    """
+    Stage1:
+    - 입력된 (公/희망근무/야근/L1/日) 하드 고정
+    - ✅ 커버리지 규칙(기본: 야근 Q1,X1,R1 각 1명 / L1 1명) 중 stage1 규칙
+    - 나머지 주간은 未로 남기고 표시상 빈칸
+    - request_rules 있으면 희망은 soft -> run_info["denied_requests"] 에 거절된 희망
+    - fairness on: 가중합 한 번 대신 3단계 (run_phases, run_info["phases"])
+      희망·커버리지 최소 -> 그 값 고정하고 야근 폭 최소 -> 야근 셀 고정하고 주간/未 tie-break
+      (가중합은 폭 1 을 줄이는 해를 찾고 tie-break 까지 증명하느라 20명에도 제한시간을 다 씀, fairness_bench 참고)
+    반환: (df_result, df_summary, run_info) / 실패 시 (None, None, run_info)
+    """
+    model, cells, tiers = _build_stage1(num_days, year, month, prev_history, requests, staff_data, shifts_day,
+                                        shifts_night, closed_days, coverage_rules, encoding, request_rules, fairness)
+    closed_idx = set([d - 1 for d in closed_days if 1 <= d <= num_days])
+
+    if dict(tiers)["fairness"] and not (params or {}).get("stop_after_first_solution"):
+        def fix_nights(phase, solver):
+            if phase != "fairness":
+                return
+            for s in range(len(staff_data)):
+                for d in range(num_days):
+                    code = cells.value(solver, s, d)
+                    if code in shifts_night:
+                        cells.fix(s, d, code)
+                    else:
+                        cells.forbid(s, d, shifts_night)
+        solver, status, run_info = run_phases(model, tiers, params, fix_nights)
+    else:
+        solver, status, run_info = run_solver(model, params)
+    run_info["stage"] = "stage1"
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None, None, run_info
+
+    df_result = extract_stage1_result(solver, cells, staff_data, num_days, year, month)
+    df_summary = build_summary(df_result, staff_data, shifts_day, shifts_night, num_days, year, month, closed_idx)
+    if request_rules is not None:
+        wanted = requests_to_cells(requests, staff_data, num_days)
+        weights = request_weights(request_rules, wanted, staff_data, 1, shifts_day, shifts_night)
+        run_info["denied_requests"] = denied_requests(df_result, wanted, staff_data,
+                                                      build_day_headers(year, month, num_days), weights)
+    return df_result, df_summary, run_info
+
+def solve_stage1_alternatives(num_days, year, month, prev_history, requests, staff_data,
+                              shifts_day, shifts_night, closed_days, k, min_diff, coverage_rules=None, encoding=None,
+                              request_rules=None, fairness=None, params=None):
+    """
+    Stage1 대안 k개를 한 번의 탐색으로:
+    - 같은 Stage1 모델을 k벌 복사해서 한 모델에 넣고
+    - Stage1 규칙 코드(기본: 야근/L1) 배정이 (staff, day, code) 셀 기준 min_diff 칸 이상 다르게 (쌍별 Hamming 제약)
+    - 목적 = k개 목적값 합 -> 반환 순서는 목적값 좋은 순
+    - params 의 max_time_in_seconds 는 k안 합계 예산 (늘리지 않음)
+    반환: ([(df_result, df_summary, objective), ...], run_info) / 실패 시 (None, run_info)
+    """
+    model = cp_model.CpModel()
+    closed_idx = set([d - 1 for d in closed_days if 1 <= d <= num_days])
+    base_codes = stage1_base_codes(coverage_rules, shifts_day, shifts_night)
+    skill_sets = [parse_skills(s.get("skills", "")) for s in staff_data]
+
+    copies = []
+    for i in range(k):
+        cells, tiers = add_stage1_model(model, f"a{i}_", num_days, year, month, prev_history, requests,
+                                        staff_data, shifts_day, shifts_night, closed_idx, coverage_rules, encoding,
+                                        request_rules, fairness)
+        # soft 희망 거절 penalty(1건 1e7 급)가 쌓여도 넘치지 않게 (대안은 평준화도 가중합 그대로)
+        obj = model.NewIntVar(-10**15, 10**15, f"a{i}_obj")
+        model.Add(obj == sum(t for _, terms in tiers for t in terms))
+        copies.append((cells, obj))
+
+    # 두 대안에서 (s, d, code) 가 한쪽만 1 이면 diff=1 -> 다른 셀 수 하한
+    # (슬롯 수를 가정하지 않으므로 규칙이 L1 없음 / Q1 2명 등이어도 그대로 성립)
+    # diff 는 >= 쪽으로만 쓰이니 상한 2개 (diff <= a+b, diff <= 2-a-b = XOR) 로 충분
+    for i in range(k):
+        for j in range(i + 1, k):
+            diff = []
+            for d in range(num_days):
+                for code in base_codes:
+                    for s in range(len(staff_data)):
+                        if code not in skill_sets[s]:
+                            continue
+                        a, b = copies[i][0].lit(s, d, code), copies[j][0].lit(s, d, code)
+                        t = model.NewBoolVar(f"diff_{i}_{j}_{s}_{d}_{code}")
+                        model.Add(t <= a + b)
+                        model.Add(t <= 2 - a - b)
+                        diff.append(t)
+            model.Add(sum(diff) >= min_diff)
+
+    # 대칭 제거: 대안 i 가 i+1 보다 목적값이 나쁘지 않게
+    for i in range(k - 1):
+        model.Add(copies[i][1] <= copies[i + 1][1])
+    model.Minimize(sum(obj for _, obj in copies))
+
+    # 제한시간은 설정값 그대로 k안 전체 예산 (모델이 k배라 1안 풀이보다 빡빡함 -> UI 도움말에 안내)
+    solver, status, run_info = run_solver(model, params)
+    run_info["stage"] = "stage1"
+    run_info["alternatives"] = k     # 스냅샷 replay/bench 가 1안 모델과 구분
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None, run_info
+
+    results = []
+    for cells, obj in copies:
+        df_result = extract_stage1_result(solver, cells, staff_data, num_days, year, month)
+        df_summary = build_summary(df_result, staff_data, shifts_day, shifts_night, num_days, year, month, closed_idx)
+        results.append((df_result, df_summary, solver.Value(obj)))
+    return results, run_info
+
+def stage1_base_codes(coverage_rules, shifts_day, shifts_night):
+    """Stage1 규칙에 나오는 코드 (= Stage1 이 정하는 배정, 대안끼리 비교 기준). 기본 규칙이면 야근 + L1"""
+    if coverage_rules is None:
+        coverage_rules = default_coverage_rules(shifts_day, shifts_night)
+    known = set(shifts_day) | set(shifts_night)
+    out = []
+    for rule in normalize_coverage_rules(coverage_rules):
+        if not _rule_applies_to(rule, 1):
+            continue
+        out += [c for c in coverage_rule_codes(rule, shifts_day, shifts_night) if c in known and c not in out]
+    return out
+
+def base_assignment_diff(df_a, df_b, day_headers, base_codes):
+    """두 Stage1 결과에서 base_codes 배정이 다른 (staff, day, code) 셀 수 (solve_stage1_alternatives 의 min_diff 기준)"""
+    diff = 0
+    for col in day_headers:
+        for code in base_codes:
+            who_a = set(df_a.loc[df_a[col] == code, "Staff"])
+            who_b = set(df_b.loc[df_b[col] == code, "Staff"])
+            diff += len(who_a ^ who_b)
+    return diff
+
+def build_stage2_model(num_days, year, month, prev_history, fixed_table, staff_data,
+                       shifts_day, shifts_night, closed_days, coverage_rules=None, encoding=None, request_rules=None,
+                       fairness=None):
+    """
+    Stage2 모델 구성 -> (model, cells)
+    - Stage1/수정본 고정값 하드 (request_rules 있으면 우선순위별 soft, stages 에 2 가 있는 규칙)
+    - fairness: 야근 평준화 (수정으로 야근을 비웠거나 soft 모드일 때 효과)
+    - 빈칸 채워 완성
+    - ✅ 커버리지 규칙 (기본: 야근 각 1명 / L1 1명 하드, E+G>=2 / Manager 주간>=1 soft)
+    - encoding: "onehot"(기본) / "int"
+    """
+    model = cp_model.CpModel()
+    ALL_SHIFTS = shifts_day + shifts_night + SPECIAL_CODES
+    staff_indices = range(len(staff_data))
+    days_indices = range(num_days)
+    closed_idx = set([d - 1 for d in closed_days if 1 <= d <= num_days])
+
+    cells = make_cells(model, "s2_", encoding, staff_data, num_days, ALL_SHIFTS)
+
+    # prev month carry
+    for s_idx, staff in enumerate(staff_data):
+        name = staff["name"]
+        h_d1 = norm_code(prev_history.get(name, {}).get("d-1", OFF_CODE))
+        h_d2 = norm_code(prev_history.get(name, {}).get("d-2", OFF_CODE))
+        h_d3 = norm_code(prev_history.get(name, {}).get("d-3", OFF_CODE))
+
+        if h_d1 in shifts_night:
+            cells.fix(s_idx, 0, MYONG_CODE)
+
+        if h_d1 == MYONG_CODE:
+            cells.forbid(s_idx, 0, shifts_day + ["日", MYONG_CODE])
+
+        w_d3 = 1 if h_d3 != OFF_CODE else 0
+        w_d2 = 1 if h_d2 != OFF_CODE else 0
+        w_d1 = 1 if h_d1 != OFF_CODE else 0
+        c0 = 1 - cells.lit(s_idx, 0, OFF_CODE) if 0 < num_days else 0
+        c1 = 1 - cells.lit(s_idx, 1, OFF_CODE) if 1 < num_days else 0
+
+        model.Add(w_d3 + w_d2 + w_d1 + c0 + c1 <= 4)
+        if num_days >= 3:
+            c2 = 1 - cells.lit(s_idx, 2, OFF_CODE)
+            model.Add(w_d2 + w_d1 + c0 + c1 + c2 <= 4)
+        if num_days >= 4:
+            c2 = 1 - cells.lit(s_idx, 2, OFF_CODE)
+            c3 = 1 - cells.lit(s_idx, 3, OFF_CODE)
+            model.Add(w_d1 + c0 + c1 + c2 + c3 <= 4)
+
+    # night -> next day is 明(-)
+    for s in staff_indices:
+        for d in range(num_days - 1):
+            model.Add(cells.lit(s, d + 1, MYONG_CODE) == cells.count(s, d, shifts_night))
+
+    # 明(-) -> next day cannot be day shift / 日 / 明
+    for s in staff_indices:
+        for d in range(num_days - 1):
+            cells.forbid_if(s, d + 1, shifts_day + ["日", MYONG_CODE], cells.lit(s, d, MYONG_CODE))
+
+    # spacing night
+    for s in staff_indices:
+        for d in range(num_days - 4):
+            n1 = cells.count(s, d, shifts_night)
+            n2 = cells.count(s, d + 2, shifts_night)
+            n3 = cells.count(s, d + 4, shifts_night)
+            model.Add(n1 + n2 + n3 <= 2)
+
+    # 5 days window work<=4
+    for s in staff_indices:
+        for d in range(num_days - 4):
+            works = [1 - cells.lit(s, d + k, OFF_CODE) for k in range(5)]
+            model.Add(sum(works) <= 4)
+
+    # closed day: no night and no L1
+    for d in closed_idx:
+        for s in staff_indices:
+            cells.forbid(s, d, shifts_night + ["L1"])
+
+    # fixed_table (non-empty): 기본 하드 / request_rules 있으면 우선순위별 soft
+    day_headers = build_day_headers(year, month, num_days)
+    wanted = fixed_cells_from_table(fixed_table, staff_data, day_headers)
+    weights = request_weights(request_rules, wanted, staff_data, 2, shifts_day, shifts_night)
+    fixed_penalties = add_wanted_cells(cells, wanted, weights, ALL_SHIFTS)
+
+    # ✅ 커버리지 규칙 테이블 -> 하드 제약 + soft penalty
+    if coverage_rules is None:
+        coverage_rules = default_coverage_rules(shifts_day, shifts_night)
+    penalties = add_coverage_constraints(model, cells, coverage_rules, 2, staff_data, ALL_SHIFTS,
+                                         shifts_day, shifts_night, num_days, year, month, closed_idx, "s2_")
+    penalties += fixed_penalties
+    penalties += add_night_fairness(model, cells, fairness, staff_data, shifts_night, num_days, year, month, "s2_")
+
+    # OFF target (가능하면)
+    for s in staff_indices:
+        target_off = staff_data[s].get("target_off", 8)
+        if pd.isna(target_off):
+            target_off = 8
+        target_off = int(target_off)
+
+        actual_offs = model.NewIntVar(0, num_days, f"s2_off_{s}")
+        model.Add(actual_offs == sum(cells.lit(s, d, OFF_CODE) for d in days_indices))
+
+        diff = model.NewIntVar(0, num_days, f"s2_offdiff_{s}")
+        model.AddAbsEquality(diff, actual_offs - target_off)
+        penalties.append(diff * 100000)
+
+    model.Minimize(sum(penalties))
+    return model, cells
+
+def solve_stage2(num_days, year, month, prev_history, fixed_table, staff_data,
+                shifts_day, shifts_night, closed_days, coverage_rules=None, encoding=None, request_rules=None,
+                fairness=None, params=None):
+    """
+    Stage2: build_stage2_model 풀어서 최종 시프트 완성
+    - request_rules 있으면 고정 셀은 soft -> run_info["denied_requests"] 에 안 지켜진 고정 셀
+    반환: (df_result, df_summary, run_info) / 실패 시 (None, None, run_info)
+    """
+    model, cells = build_stage2_model(num_days, year, month, prev_history, fixed_table, staff_data,
+                                      shifts_day, shifts_night, closed_days, coverage_rules, encoding, request_rules,
+                                      fairness)
+    staff_indices = range(len(staff_data))
+    days_indices = range(num_days)
+    closed_idx = set([d - 1 for d in closed_days if 1 <= d <= num_days])
+    day_headers = build_day_headers(year, month, num_days)
+
+    solver, status, run_info = run_solver(model, params)
+    run_info["stage"] = "stage2"
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None, None, run_info
+
+    schedule_data = []
+    for s in staff_indices:
+        row = {"Staff": staff_data[s]["name"]}
+        vals = [cells.value(solver, s, d) for d in days_indices]
+        off_days = sum(1 for v in vals if v == OFF_CODE)
+        row["公休数"] = off_days
+        row["勤務日数(公以外)"] = num_days - off_days
+
+        for d in days_indices:
+            row[day_headers[d]] = vals[d]
+
+        schedule_data.append(row)
+
+    df_result = pd.DataFrame(schedule_data)
+    df_summary = build_summary(df_result, staff_data, shifts_day, shifts_night, num_days, year, month, closed_idx)
+    if request_rules is not None:
+        wanted = fixed_cells_from_table(fixed_table, staff_data, day_headers)
+        weights = request_weights(request_rules, wanted, staff_data, 2, shifts_day, shifts_night)
+        run_info["denied_requests"] = denied_requests(df_result, wanted, staff_data, day_headers, weights)
+    return df_result, df_summary, run_info
+
+def build_summary(df_result, staff_data, shifts_day, shifts_night, num_days, year, month, closed_idx):
+    day_headers = build_day_headers(year, month, num_days)
+    daily_summary_list = []
+
+    for d in range(num_days):
+        col_name = day_headers[d]
+        day_stats = {"日付": col_name}
+
+        mgr_day = 0
+        mgr_night = 0
+        for s_idx, stf in enumerate(staff_data):
+            v = df_result.iloc[s_idx][col_name]
+            if stf["role"] == "Manager":
+                if v in shifts_day: mgr_day += 1
+                if v in shifts_night: mgr_night += 1
+
+        day_stats["Manager(昼)"] = mgr_day
+        day_stats["Manager(夜)"] = mgr_night
+
+        all_codes = shifts_night + shifts_day + [OFF_CODE, MYONG_CODE, "日"]
+        for code in all_codes:
+            day_stats[code] = sum(1 for s_idx in range(len(staff_data)) if df_result.iloc[s_idx][col_name] == code)
+
+        day_stats["休館"] = 1 if d in closed_idx else 0
+        daily_summary_list.append(day_stats)
+
+    return pd.DataFrame(daily_summary_list)
+
+
+# =========================================================
+# Portfolio (멀티 프로세스 / 결정적 재현)
+# =========================================================
+SOLVERS = {"stage1": solve_stage1, "stage2": solve_stage2}
+MODEL_BUILDERS = {"stage1": build_stage1_model, "stage2": build_stage2_model}
+
+# 멤버별로 seed + 탐색 성향을 바꿔서 돌림 (각 멤버는 1 worker = 결정적)
+PORTFOLIO_PRESETS = [
+    {},
+    {"linearization_level": 2},
+    {"linearization_level": 0},
+    {"optimize_with_core": True},
+]
+
+def default_portfolio(n_members):
+    return [{"random_seed": i, **PORTFOLIO_PRESETS[i % len(PORTFOLIO_PRESETS)]} for i in range(n_members)]
+
+def _portfolio_member(stage, args, params, deadline):
+    # 워커 기동 + 모델 구성에 쓴 시간은 예산에서 뺌 (deadline 은 부모가 잡은 wall-clock, run_solver 가 Solve 직전에 계산)
+    return SOLVERS[stage](*args, params={**params, "wall_deadline": deadline})
+
+def solve_portfolio(stage, args, n_members=None, params=None, members=None):
+    """
+    같은 wall-clock 예산으로 여러 seed/파라미터를 프로세스 병렬 실행 -> 목적값 최소 결과
+    - stage: "stage1" / "stage2", args: 해당 solve 함수의 위치 인자 (params 제외)
+    - params: 전 멤버 공통 파라미터 (제한시간/gap 등), 멤버별 seed/preset 이 위에 덮어씀
+    - 각 멤버는 num_workers=1 로 돌려서 run_info 만으로 replay() 재현 가능
+    - 제한시간은 프로세스 풀 기동(spawn + import) + 모델 구성 포함 wall-clock 예산:
+      멤버는 Solve 직전에 남은 시간만 풂 (최소 DEADLINE_MIN_SECONDS)
+      결과 추출/수집과 풀 종료는 예산 밖 (UI 에도 안내), portfolio_wall 에 실제 경과 시간
+    반환: 최선 멤버의 (df_result, df_summary, run_info) + run_info["portfolio"] 에 전체 멤버 요약
+    """
+    if members is None:
+        members = default_portfolio(n_members or min(8, os.cpu_count() or 1))
+    member_params = [{**(params or {}), "num_workers": 1, **m} for m in members]
+
+    budget = (params or {}).get("max_time_in_seconds", DEFAULT_SOLVER_PARAMS["max_time_in_seconds"])
+    t0 = time.time()
+    deadline = t0 + budget
+
+    # Streamlit 서버 프로세스를 fork 하지 않도록 spawn
+    ctx = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=len(member_params), mp_context=ctx)
+    try:
+        futures = [pool.submit(_portfolio_member, stage, args, p, deadline) for p in member_params]
+        results = [f.result() for f in futures]
+    finally:
+        # 결과를 다 받은 뒤 워커 프로세스 종료(0.5초 정도)는 기다리지 않음
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    best = None
+    for i, res in enumerate(results):
+        res[2]["member"] = i
+        if res[0] is None:
+            continue
+        if best is None or res[2]["objective"] < best[2]["objective"]:
+            best = res
+    if best is None:
+        best = results[0]
+
+    best[2]["portfolio_wall"] = round(time.time() - t0, 3)
+    best[2]["portfolio"] = [
+        {"member": r[2]["member"], "seed": r[2]["params"].get("random_seed"),
+         "status": r[2]["status"], "objective": r[2]["objective"]}
+        for r in results
+    ]
+    return best
+
+def replay(args, run_info):
+    """
+    run_info(포트폴리오 승자 등) 의 seed/파라미터로 같은 스케줄 재현
+    - wall-clock 대신 기록된 deterministic_time 으로 멈춰서 머신 부하와 무관하게 동일 결과
+    - num_workers=1 로 돌린 run_info 만 보장됨
+    """
+    params = dict(run_info["params"])
+    params.pop("max_time_in_seconds", None)
+    params["max_deterministic_time"] = run_info["deterministic_time"]
+    if run_info.get("phases"):
+        params["phase_deterministic_times"] = [None if p["status"] == "OPTIMAL" else p["deterministic_time"]
+                                               for p in run_info["phases"]]
+    return SOLVERS[run_info["stage"]](*args, params=params)
@@ -0,0 +1,261 @@
+"""
+솔버 입력 스냅샷 (오프라인 재현 / 회귀 벤치마크)
+- .snap = zip(meta.json + input.json + model.pb)
+  - input.json: staff_data / requests or fixed_table / prev_history / closed_days / 코드 세트 / 커버리지 규칙
+  - model.pb : 저장 당시 코드로 만든 CP-SAT 모델 proto (binary)
+- 재현:   python snapshot.py replay 2026_01_stage1.snap [--time-limit 30] [--seed 0] [--proto]
+  (파라미터는 저장된 run_info 의 params 기본, CLI 옵션이 덮어씀. 1 worker run 은 자동으로 정확 재현)
+- 정확 재현: python snapshot.py replay 2026_01_stage1.snap --exact [--out schedule.csv]
+  (num_workers=1 run = 포트폴리오 승자 등: 저장된 seed/파라미터/deterministic_time 으로 같은 스케줄)
+- 벤치:   python snapshot.py bench snapshots/ [--time-limit 10] [--tolerance 0]
+  (제한시간에 걸린 비최적 run / k案 run 은 목적값 악화를 회귀로 세지 않고 check 열에 따로 표시)
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+import pandas as pd
+from google.protobuf import text_format
+from ortools.sat import cp_model_pb2
+from ortools.sat.python import cp_model
+
+import shift_solver
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXT = ".snap"
+
+# solve_stage1 / solve_stage2 위치 인자 순서 그대로
+# (coverage_rules / encoding / request_rules / fairness 없는 예전 스냅샷은 None = 기본 규칙 / one-hot / 희망 하드 / 평준화 없음)
+ARG_NAMES = {
+    "stage1": ["num_days", "year", "month", "prev_history", "requests", "staff_data",
+               "shifts_day", "shifts_night", "closed_days", "coverage_rules", "encoding", "request_rules",
+               "fairness"],
+    "stage2": ["num_days", "year", "month", "prev_history", "fixed_table", "staff_data",
+               "shifts_day", "shifts_night", "closed_days", "coverage_rules", "encoding", "request_rules",
+               "fairness"],
+}
+
+def _json_default(x):
+    # data_editor 경유 값(numpy int64 등) 대응
+    if hasattr(x, "item"):
+        return x.item()
+    raise TypeError(f"not JSON serializable: {type(x)}")
+
+def _encode_inputs(stage, args):
+    inputs = dict(zip(ARG_NAMES[stage], args))
+    if stage == "stage1":
+        # day(int) 키는 JSON 에서 문자열이 되므로 그대로 두고 로드 시 복원
+        inputs["requests"] = {name: {str(d): c for d, c in mp.items()} for name, mp in inputs["requests"].items()}
+    else:
+        inputs["fixed_table"] = inputs["fixed_table"].to_dict(orient="split")
+    inputs["closed_days"] = [int(d) for d in inputs["closed_days"]]
+    return inputs
+
+def _decode_inputs(stage, inputs):
+    inputs = dict(inputs)
+    if stage == "stage1":
+        inputs["requests"] = {name: {int(d): c for d, c in mp.items()} for name, mp in inputs["requests"].items()}
+    else:
+        ft = inputs["fixed_table"]
+        inputs["fixed_table"] = pd.DataFrame(ft["data"], index=ft["index"], columns=ft["columns"]).fillna("")
+    return tuple(inputs.get(k) for k in ARG_NAMES[stage])
+
+def _model_bytes(model):
+    # 이 ortools 버전의 CpModelProto 는 SerializeToString 이 없어서 파일 경유
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.pb")
+        model.export_to_file(path)
+        with open(path, "rb") as f:
+            return f.read()
+
+def save_snapshot(stage, args, run_info=None):
+    """(stage, solve 인자, 선택: run_info) -> .snap bytes"""
+    model, _ = shift_solver.MODEL_BUILDERS[stage](*args)
+    meta = {
+        "snapshot_version": SNAPSHOT_VERSION,
+        "stage": stage,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "ortools_version": getattr(__import__("ortools"), "__version__", ""),
+        "run_info": run_info,
+    }
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("meta.json", json.dumps(meta, ensure_ascii=False, indent=2, default=_json_default))
+        zf.writestr("input.json", json.dumps(_encode_inputs(stage, args), ensure_ascii=False, default=_json_default))
+        zf.writestr("model.pb", _model_bytes(model))
+    return buf.getvalue()
+
+def load_snapshot(src):
+    """경로 or bytes -> (meta, solve 인자 tuple)"""
+    with zipfile.ZipFile(io.BytesIO(src) if isinstance(src, bytes) else src) as zf:
+        meta = json.loads(zf.read("meta.json"))
+        if meta.get("snapshot_version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot_version: {meta.get('snapshot_version')}")
+        inputs = json.loads(zf.read("input.json"))
+    return meta, _decode_inputs(meta["stage"], inputs)
+
+def load_model(src):
+    """저장된 model.pb -> CpModel (저장 당시 모델 그대로)"""
+    with zipfile.ZipFile(io.BytesIO(src) if isinstance(src, bytes) else src) as zf:
+        pb = cp_model_pb2.CpModelProto()
+        pb.ParseFromString(zf.read("model.pb"))
+    model = cp_model.CpModel()
+    model.Proto().parse_text_format(text_format.MessageToString(pb))
+    return model
+
+def replay_snapshot(src, params=None, use_proto=False):
+    """
+    스냅샷 재실행 -> run_info (+ build_seconds, replay = "exact" / "solve")
+    - 기본: 현재 코드로 입력에서 모델을 다시 만들어 풂 (코드 변경 회귀 확인용)
+    - 파라미터: 저장된 run_info["params"] 위에 params(CLI) 를 덮어씀
+    - 덮어쓰기가 없고 저장 run 이 1 worker 면 shift_solver.replay 로 정확 재현 (같은 목적값이어야 정상)
+    - use_proto: 저장된 모델 proto 를 그대로 풂 (솔버/파라미터만 비교)
+    """
+    meta, args = load_snapshot(src)
+    saved = meta.get("run_info") or {}
+    if not params and not use_proto and can_reproduce(saved) and not saved.get("alternatives"):
+        t0 = time.perf_counter()
+        _, _, run_info = shift_solver.replay(args, {**saved, "stage": meta["stage"]})
+        run_info["build_seconds"] = None
+        run_info["replay"] = "exact"
+        run_info["replay_seconds"] = round(time.perf_counter() - t0, 3)
+        return meta, run_info
+
+    used = {**(saved.get("params") or {}), **(params or {})}
+    t0 = time.perf_counter()
+    if use_proto:
+        model = load_model(src)
+    else:
+        model, _ = shift_solver.MODEL_BUILDERS[meta["stage"]](*args)
+    build_seconds = time.perf_counter() - t0
+    _, _, run_info = shift_solver.run_solver(model, used)
+    run_info["stage"] = meta["stage"]
+    run_info["build_seconds"] = round(build_seconds, 3)
+    run_info["replay"] = "solve"
+    return meta, run_info
+
+def _bench_check(saved, info):
+    """목적값 비교 방식: exact / solve / time-limited (비교 안 함) / alternatives (비교 안 함)"""
+    if saved.get("alternatives"):
+        return "alternatives"      # k案 모델의 합계 목적값이라 1안 모델과 비교 불가
+    if info.get("replay") == "exact":
+        return "exact"
+    if saved.get("status") != "OPTIMAL" and saved.get("hit_time_limit"):
+        return "time-limited"      # 시간에 걸린 해는 실행마다 달라서 악화가 곧 회귀는 아님
+    return "solve"
+
+def can_reproduce(run_info):
+    """shift_solver.replay 로 같은 해가 보장되는 run_info 인지 (1 worker + deterministic_time 기록)"""
+    run_info = run_info or {}
+    return ((run_info.get("params") or {}).get("num_workers") == 1
+            and run_info.get("deterministic_time") is not None)
+
+def reproduce_snapshot(src):
+    """
+    저장된 run_info 그대로 재현 (shift_solver.replay) -> (meta, df_result, df_summary, run_info)
+    - 현재 코드로 입력에서 모델을 다시 만들므로 모델이 바뀌었으면 결과도 달라짐
+    """
+    meta, args = load_snapshot(src)
+    saved = meta.get("run_info")
+    if not can_reproduce(saved):
+        raise ValueError("exact replay needs a saved run_info with num_workers=1 and deterministic_time "
+                         "(e.g. a portfolio winner)")
+    df_result, df_summary, run_info = shift_solver.replay(args, {**saved, "stage": meta["stage"]})
+    return meta, df_result, df_summary, run_info
+
+def bench(folder, params=None, tolerance=0.0):
+    """폴더의 .snap 전부 재실행 -> 저장값 대비 비교표 (DataFrame)"""
+    rows = []
+    for fname in sorted(os.listdir(folder)):
+        if not fname.endswith(SNAPSHOT_EXT):
+            continue
+        meta, info = replay_snapshot(os.path.join(folder, fname), params)
+        saved = meta.get("run_info") or {}
+        saved_obj, new_obj = saved.get("objective"), info["objective"]
+        check = _bench_check(saved, info)
+        worse = saved_obj is not None and new_obj is not None and new_obj > saved_obj + tolerance
+        regressed = (saved.get("status") in ("OPTIMAL", "FEASIBLE") and new_obj is None) or (
+            worse and check in ("exact", "solve"))
+        rows.append({
+            "file": fname,
+            "stage": meta["stage"],
+            "saved_status": saved.get("status"),
+            "status": info["status"],
+            "saved_objective": saved_obj,
+            "objective": new_obj,
+            "gap": info["gap"],
+            "first_solution": info["first_solution_seconds"],
+            "saved_wall": saved.get("wall_time"),
+            "wall": info["wall_time"],
+            "build": info["build_seconds"],
+            "check": check,
+            "worse": worse,
+            "regressed": regressed,
+        })
+    return pd.DataFrame(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="shift solver snapshot replay / regression bench")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_replay = sub.add_parser("replay", help="스냅샷 1개를 headless 로 재실행")
+    p_replay.add_argument("file")
+    p_replay.add_argument("--proto", action="store_true", help="저장된 모델 proto 를 그대로 풂")
+    p_replay.add_argument("--exact", action="store_true",
+                          help="저장된 run_info(seed/파라미터/deterministic_time) 로 같은 스케줄 재현")
+    p_replay.add_argument("--out", default=None, help="--exact: 재현한 스케줄 CSV 저장 경로")
+
+    p_bench = sub.add_parser("bench", help="폴더의 스냅샷 전체를 회귀 벤치마크")
+    p_bench.add_argument("folder")
+    p_bench.add_argument("--tolerance", type=float, default=0.0, help="허용 목적값 악화폭")
+
+    for p in (p_replay, p_bench):
+        p.add_argument("--time-limit", type=float, default=None)
+        p.add_argument("--seed", type=int, default=None)
+        p.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    params = {}
+    if args.time_limit is not None:
+        params["max_time_in_seconds"] = args.time_limit
+    if args.seed is not None:
+        params["random_seed"] = args.seed
+    if args.workers is not None:
+        params["num_workers"] = args.workers
+
+    if args.cmd == "replay" and args.exact:
+        if params or args.proto:
+            parser.error("--exact replays the saved parameters; drop --time-limit/--seed/--workers/--proto")
+        meta, df_result, _, info = reproduce_snapshot(args.file)
+        saved = meta["run_info"]
+        same = df_result is not None and info["objective"] == saved.get("objective")
+        print(json.dumps({"saved": saved, "replay": info, "same_objective": same}, ensure_ascii=False, indent=2,
+                         default=_json_default))
+        if args.out and df_result is not None:
+            df_result.to_csv(args.out, index=False, encoding="utf-8-sig")
+        return 0 if same else 1
+
+    if args.cmd == "replay":
+        meta, info = replay_snapshot(args.file, params, use_proto=args.proto)
+        print(json.dumps({"saved": meta.get("run_info"), "replay": info}, ensure_ascii=False, indent=2))
+        return 0 if info["objective"] is not None else 1
+
+    df = bench(args.folder, params, args.tolerance)
+    if df.empty:
+        print(f"no {SNAPSHOT_EXT} files in {args.folder}")
+        return 0
+    print(df.to_string(index=False))
+    uncounted = df[df["worse"] & ~df["regressed"]]
+    if not uncounted.empty:
+        print(f"\nobjective worse but not counted as regression ({', '.join(sorted(set(uncounted['check'])))}): "
+              + ", ".join(uncounted["file"]))
+    return 1 if df["regressed"].any() else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
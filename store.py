@@ -0,0 +1,242 @@
+"""
+SQLite 저장소 (스태프 / 월별 희망 / 공개된 시프트)
+- 모든 테이블 PK 가 (property, year, month, ...) 순이라 월 단위 조회가 인덱스로 끝남
+- open_month(): 스태프 + 그 달 희망 + 전월 마지막 3일(prev_history) 을 쿼리 1번으로
+- 시설별 커버리지 규칙 / 희망 우선순위 규칙은 JSON 1행 (규칙 수십 개라 테이블로 쪼갤 필요 없음)
+- DB 경로: 환경변수 SHIFT_DB_PATH (기본 shift_store.sqlite3)
+"""
+import calendar
+import datetime
+import json
+import os
+import sqlite3
+
+from shift_solver import OFF_CODE, norm_code, normalize_coverage_rules, normalize_request_rules
+
+DEFAULT_DB_PATH = os.environ.get("SHIFT_DB_PATH", "shift_store.sqlite3")
+DEFAULT_PROPERTY = "default"
+PREV_COLS = ["d-3", "d-2", "d-1"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS staff (
+    property   TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    gender     TEXT,
+    role       TEXT,
+    target_off INTEGER,
+    skills     TEXT,
+    sort_order INTEGER NOT NULL,
+    PRIMARY KEY (property, name)
+);
+CREATE TABLE IF NOT EXISTS requests (
+    property TEXT NOT NULL,
+    year     INTEGER NOT NULL,
+    month    INTEGER NOT NULL,
+    name     TEXT NOT NULL,
+    day      INTEGER NOT NULL,
+    code     TEXT NOT NULL,
+    PRIMARY KEY (property, year, month, name, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS schedules (
+    property TEXT NOT NULL,
+    year     INTEGER NOT NULL,
+    month    INTEGER NOT NULL,
+    day      INTEGER NOT NULL,
+    name     TEXT NOT NULL,
+    code     TEXT NOT NULL,
+    PRIMARY KEY (property, year, month, day, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage_rules (
+    property TEXT PRIMARY KEY,
+    rules    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS request_rules (
+    property TEXT PRIMARY KEY,
+    rules    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS schedule_meta (
+    property     TEXT NOT NULL,
+    year         INTEGER NOT NULL,
+    month        INTEGER NOT NULL,
+    published_at TEXT NOT NULL,
+    run_info     TEXT,
+    PRIMARY KEY (property, year, month)
+);
+"""
+
+def connect(path=None):
+    # 연결은 세션(사용자)마다 1개로 쓸 것: 연결 1개를 여럿이 공유하면 with conn: 트랜잭션이 섞여서
+    # DELETE+INSERT 교체가 깨짐. 연결끼리는 SQLite(WAL) 락이 쓰기를 직렬화
+    # check_same_thread=False 는 같은 세션의 rerun 이 다른 스레드에서 돌기 때문
+    conn = sqlite3.connect(path or DEFAULT_DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def prev_month(year, month):
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+# =========================================================
+# Staff
+# =========================================================
+def save_staff(conn, staff_data, prop=DEFAULT_PROPERTY):
+    """스태프 목록 통째로 교체 (순서 유지)"""
+    rows = []
+    for i, s in enumerate(staff_data):
+        name = str(s.get("name") or "").strip()
+        if not name:
+            continue
+        target_off = s.get("target_off")
+        target_off = None if target_off is None or target_off != target_off else int(target_off)
+        rows.append((prop, name, s.get("gender"), s.get("role"), target_off, s.get("skills"), i))
+    with conn:
+        conn.execute("DELETE FROM staff WHERE property = ?", (prop,))
+        conn.executemany("INSERT INTO staff VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+def load_staff(conn, prop=DEFAULT_PROPERTY):
+    cur = conn.execute(
+        "SELECT name, gender, role, target_off, skills FROM staff WHERE property = ? ORDER BY sort_order", (prop,))
+    return [dict(zip(("name", "gender", "role", "target_off", "skills"), r)) for r in cur]
+
+# =========================================================
+# Coverage rules (시설별 인원 규칙 테이블)
+# =========================================================
+def save_coverage_rules(conn, rules, prop=DEFAULT_PROPERTY):
+    rules = normalize_coverage_rules(rules)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO coverage_rules VALUES (?, ?)",
+                     (prop, json.dumps(rules, ensure_ascii=False)))
+    return len(rules)
+
+def load_coverage_rules(conn, prop=DEFAULT_PROPERTY):
+    """저장된 규칙 리스트 / 없으면 None (= 기본 규칙)"""
+    row = conn.execute("SELECT rules FROM coverage_rules WHERE property = ?", (prop,)).fetchone()
+    return None if row is None else json.loads(row[0])
+
+# =========================================================
+# Request rules (희망 soft 모드 우선순위)
+# =========================================================
+def save_request_rules(conn, rules, prop=DEFAULT_PROPERTY):
+    rules = normalize_request_rules(rules)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO request_rules VALUES (?, ?)",
+                     (prop, json.dumps(rules, ensure_ascii=False)))
+    return len(rules)
+
+def load_request_rules(conn, prop=DEFAULT_PROPERTY):
+    """저장된 규칙 리스트 / 없으면 None (= default_request_rules)"""
+    row = conn.execute("SELECT rules FROM request_rules WHERE property = ?", (prop,)).fetchone()
+    return None if row is None else json.loads(row[0])
+
+# =========================================================
+# Requests (Stage1 희망)
+# =========================================================
+def save_requests(conn, year, month, requests, prop=DEFAULT_PROPERTY):
+    """requests: {name: {day: code}} -> 그 달 희망 통째로 교체"""
+    rows = [(prop, year, month, name, int(day), code)
+            for name, mp in requests.items() for day, code in mp.items() if code]
+    with conn:
+        conn.execute("DELETE FROM requests WHERE property = ? AND year = ? AND month = ?", (prop, year, month))
+        conn.executemany("INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+def load_requests(conn, year, month, prop=DEFAULT_PROPERTY):
+    out = {}
+    cur = conn.execute("SELECT name, day, code FROM requests WHERE property = ? AND year = ? AND month = ?",
+                       (prop, year, month))
+    for name, day, code in cur:
+        out.setdefault(name, {})[day] = code
+    return out
+
+# =========================================================
+# Published schedules
+# =========================================================
+def publish_schedule(conn, year, month, df_result, day_headers, run_info=None, prop=DEFAULT_PROPERTY):
+    """Stage2 결과(df_result: Staff + day_headers 열) 공개 저장. 같은 달은 덮어씀"""
+    rows = []
+    for d, col in enumerate(day_headers):
+        for name, code in zip(df_result["Staff"], df_result[col]):
+            code = norm_code(code)
+            if code:
+                rows.append((prop, year, month, d + 1, name, code))
+    with conn:
+        conn.execute("DELETE FROM schedules WHERE property = ? AND year = ? AND month = ?", (prop, year, month))
+        conn.executemany("INSERT INTO schedules VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO schedule_meta VALUES (?, ?, ?, ?, ?)",
+                     (prop, year, month, datetime.datetime.now().isoformat(timespec="seconds"),
+                      json.dumps(run_info, ensure_ascii=False, default=str) if run_info else None))
+    return len(rows)
+
+def load_schedule(conn, year, month, prop=DEFAULT_PROPERTY, day_from=1):
+    """{name: {day: code}}"""
+    out = {}
+    cur = conn.execute(
+        "SELECT name, day, code FROM schedules WHERE property = ? AND year = ? AND month = ? AND day >= ?",
+        (prop, year, month, day_from))
+    for name, day, code in cur:
+        out.setdefault(name, {})[day] = code
+    return out
+
+def list_published(conn, prop=None):
+    sql = "SELECT property, year, month, published_at FROM schedule_meta"
+    args = ()
+    if prop is not None:
+        sql += " WHERE property = ?"
+        args = (prop,)
+    return conn.execute(sql + " ORDER BY property, year, month", args).fetchall()
+
+def _prev_history_from_rows(rows, last_day):
+    # rows: (name, day, code) -> {name: {"d-3","d-2","d-1"}}  기록 없는 날은 公
+    hist = {}
+    for name, day, code in rows:
+        k = last_day - day
+        if 0 <= k < 3:
+            hist.setdefault(name, {c: OFF_CODE for c in PREV_COLS})[PREV_COLS[2 - k]] = code
+    return hist
+
+def load_prev_history(conn, year, month, prop=DEFAULT_PROPERTY):
+    """전월 공개 시프트의 마지막 3일 -> prev_history"""
+    py, pm = prev_month(year, month)
+    last_day = calendar.monthrange(py, pm)[1]
+    rows = [(n, d, c) for n, mp in load_schedule(conn, py, pm, prop, last_day - 2).items() for d, c in mp.items()]
+    return _prev_history_from_rows(rows, last_day)
+
+# =========================================================
+# 월 열기 (쿼리 1번)
+# =========================================================
+def open_month(conn, year, month, prop=DEFAULT_PROPERTY):
+    """
+    -> {"staff": [...], "requests": {name: {day: code}}, "prev_history": {name: {d-3,d-2,d-1}}}
+    스태프 / 그 달 희망 / 전월 마지막 3일을 UNION ALL 한 번으로 읽음
+    """
+    py, pm = prev_month(year, month)
+    last_day = calendar.monthrange(py, pm)[1]
+    cur = conn.execute(
+        """
+        SELECT 'staff', name, sort_order, NULL, gender, role, target_off, skills
+          FROM staff WHERE property = ?
+        UNION ALL
+        SELECT 'req', name, day, code, NULL, NULL, NULL, NULL
+          FROM requests WHERE property = ? AND year = ? AND month = ?
+        UNION ALL
+        SELECT 'prev', name, day, code, NULL, NULL, NULL, NULL
+          FROM schedules WHERE property = ? AND year = ? AND month = ? AND day >= ?
+        """,
+        (prop, prop, year, month, prop, py, pm, last_day - 2),
+    )
+    staff, requests, prev_rows = [], {}, []
+    for kind, name, num, code, gender, role, target_off, skills in cur:
+        if kind == "staff":
+            staff.append((num, {"name": name, "gender": gender, "role": role,
+                                "target_off": target_off, "skills": skills}))
+        elif kind == "req":
+            requests.setdefault(name, {})[num] = code
+        else:
+            prev_rows.append((name, num, code))
+    return {
+        "staff": [s for _, s in sorted(staff, key=lambda x: x[0])],
+        "requests": requests,
+        "prev_history": _prev_history_from_rows(prev_rows, last_day),
+    }
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shift_solver  # noqa: E402
+
+SHIFTS_DAY = ["E1", "H1", "L1"]
+SHIFTS_NIGHT = ["Q1", "X1"]
+
+@pytest.fixture
+def shifts():
+    return list(SHIFTS_DAY), list(SHIFTS_NIGHT)
+
+@pytest.fixture
+def staff_data():
+    """전원 전 코드 가능 (스킬로 막히는 셀이 없도록)"""
+    skills = ", ".join(SHIFTS_DAY + SHIFTS_NIGHT + ["日", shift_solver.MYONG_CODE, shift_solver.OFF_CODE])
+    return [{"name": f"S{i}", "gender": "M", "role": "Manager" if i == 0 else "Staff", "target_off": 8,
+             "skills": skills} for i in range(8)]
@@ -0,0 +1,26 @@
+import pytest
+
+import shift_solver
+
+YEAR, MONTH, NUM_DAYS = 2026, 2, 28
+PARAMS = {"num_workers": 1, "max_time_in_seconds": 10, "stop_after_first_solution": True}   # 차이 제약만 확인
+NO_L1 = [{"codes": "Q1", "min": 1, "max": 1}, {"codes": "X1", "min": 1, "max": 1}]
+Q1_TWO = [{"codes": "Q1", "min": 2, "max": 2}, {"codes": "X1", "min": 1, "max": 1}]
+
+def test_base_codes_follow_stage1_rules(shifts):
+    assert shift_solver.stage1_base_codes(None, *shifts) == ["Q1", "X1", "L1"]
+    assert shift_solver.stage1_base_codes(NO_L1, *shifts) == ["Q1", "X1"]
+    assert shift_solver.stage1_base_codes([{"codes": "@day", "min": 1, "stages": "2"}], *shifts) == []
+
+@pytest.mark.parametrize("rules", [NO_L1, Q1_TWO], ids=["no_l1", "q1_two"])
+def test_alternatives_differ_by_min_diff(staff_data, shifts, rules):
+    shifts_day, shifts_night = shifts
+    staff = staff_data + [dict(staff_data[1], name=f"S{i}") for i in range(8, 12)]   # 하루 야근 3명이어도 여유 있게
+    min_diff = 10
+    results, info = shift_solver.solve_stage1_alternatives(NUM_DAYS, YEAR, MONTH, {}, {}, staff, shifts_day,
+                                                           shifts_night, [], 2, min_diff, rules, params=PARAMS)
+    assert results is not None, info["status"]
+    headers = shift_solver.build_day_headers(YEAR, MONTH, NUM_DAYS)
+    base_codes = shift_solver.stage1_base_codes(rules, shifts_day, shifts_night)
+    assert shift_solver.base_assignment_diff(results[0][0], results[1][0], headers, base_codes) >= min_diff
+    assert info["params"]["max_time_in_seconds"] == PARAMS["max_time_in_seconds"]   # k안 합계 예산 그대로
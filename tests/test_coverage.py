@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+from ortools.sat.python import cp_model
+
+import shift_solver
+
+YEAR, MONTH, NUM_DAYS = 2026, 2, 28
+
+def shortage_cost(staff_data, shifts, rule):
+    """E1 스킬 1명뿐일 때 (1일만 걸린) soft 규칙의 최소 penalty"""
+    shifts_day, shifts_night = shifts
+    staff = [dict(s, skills="E1, 公") if i == 0 else dict(s, skills="H1, 公") for i, s in enumerate(staff_data)]
+    all_shifts = shifts_day + shifts_night + shift_solver.SPECIAL_CODES
+    model = cp_model.CpModel()
+    cells = shift_solver.make_cells(model, "", "onehot", staff, NUM_DAYS, all_shifts)
+    penalties = shift_solver.add_coverage_constraints(model, cells, [rule], 2, staff, all_shifts, shifts_day,
+                                                      shifts_night, NUM_DAYS, YEAR, MONTH, set())
+    model.Minimize(sum(penalties))
+    solver = cp_model.CpSolver()
+    assert solver.Solve(model) == cp_model.OPTIMAL
+    return solver.ObjectiveValue()
+
+def test_per_day_counts_days_not_persons(staff_data, shifts):
+    rule = {"codes": "E1", "min": 2, "weight": 50000, "stages": "2", "days": "1"}
+    assert shortage_cost(staff_data, shifts, rule) == 50000                       # 1명 부족
+    assert shortage_cost(staff_data, shifts, dict(rule, min=3)) == 100000          # 2명 부족
+    assert shortage_cost(staff_data, shifts, dict(rule, min=3, per_day=True)) == 50000
+
+def test_default_soft_rules_are_per_day(shifts):
+    rules = shift_solver.default_coverage_rules(*shifts)
+    assert all(r["per_day"] for r in rules if r["weight"] > 0)
+    assert not any(r["per_day"] for r in rules if r["weight"] == 0)
+
+def test_rule_text_errors_are_reported_not_raised():
+    ok = shift_solver.normalize_coverage_rules([{"codes": "Q1", "weekdays": "月〜金", "days": "1～5,25", "months": "12-2"}])
+    assert shift_solver.coverage_rule_error(ok[0]) is None
+    assert shift_solver.coverage_rule_days(ok[0], NUM_DAYS, YEAR, MONTH, set()) == [1, 2, 3, 4, 24]   # 2/2-2/5 + 2/25
+    for bad in ({"weekdays": "土曜"}, {"days": "1.5"}, {"days": "0-40"}, {"months": "13"}):
+        rule = shift_solver.normalize_coverage_rules([{"codes": "Q1", **bad}])[0]
+        assert list(bad)[0] in shift_solver.coverage_rule_error(rule)
+
+@pytest.mark.parametrize("encoding", shift_solver.ENCODINGS)
+def test_blank_skills_infeasible_in_both_encodings(staff_data, shifts, encoding):
+    shifts_day, shifts_night = shifts
+    staff = [dict(s) for s in staff_data]
+    staff[3]["skills"] = ""          # int 인코딩이면 빈 도메인 (MODEL_INVALID 가 아니라 INFEASIBLE 이어야 함)
+    headers = shift_solver.build_day_headers(YEAR, MONTH, NUM_DAYS)
+    table = pd.DataFrame({"Staff": [s["name"] for s in staff], **{h: "" for h in headers}})
+    _, _, info = shift_solver.solve_stage2(NUM_DAYS, YEAR, MONTH, {}, table, staff, shifts_day, shifts_night, [],
+                                           encoding=encoding, params={"num_workers": 1})
+    assert info["status"] == "INFEASIBLE"
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+import shift_solver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _bench_data_digest(hash_seed):
+    code = ("import hashlib, json, fairness_bench as fb, encoding_bench as eb\n"
+            "sd, sn = eb.synthetic_shifts(9); st = eb.synthetic_staff(40, sd, sn)\n"
+            "data = [fb.synthetic_history(st, sn, 3), eb.synthetic_requests(st, 31, sd)]\n"
+            "print(hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest())\n")
+    env = {**os.environ, "PYTHONHASHSEED": str(hash_seed)}
+    return subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True,
+                          check=True).stdout.strip()
+
+def test_synthetic_bench_data_ignores_hash_seed():
+    assert len({_bench_data_digest(h) for h in (1, 2, 3)}) == 1
+
+def test_fairness_groups_only_eligible(staff_data, shifts):
+    shifts_day, shifts_night = shifts
+    staff = [dict(s) for s in staff_data]
+    staff[0]["skills"] = "E1, H1, 日, 公"          # 야근 스킬 없음
+    staff[1]["skills"] = "E1, Q1, 日, -, 公"       # Q1 만
+    groups = {g[0]: g for g in shift_solver.fairness_groups({}, staff, shifts_night, 28, 2026, 2)}
+    assert set(groups) == {"Q1", "X1", "night", shift_solver.WEEKEND_KEY}
+    assert 0 not in groups["Q1"][3] and 1 in groups["Q1"][3]
+    assert 1 not in groups["X1"][3]
+    assert 0 not in groups["night"][3]
+    assert len(groups[shift_solver.WEEKEND_KEY][2]) == 8     # 2026/2 토일
+
+def test_fairness_solves_in_phases(staff_data, shifts):
+    shifts_day, shifts_night = shifts
+    fairness = {"weight": 10000, "history": {"S1": {"Q1": 2, shift_solver.WEEKEND_KEY: 1}}}
+    df, _, info = shift_solver.solve_stage1(28, 2026, 2, {}, {"S2": {5: "Q1"}}, staff_data, shifts_day,
+                                            shifts_night, [], fairness=fairness,
+                                            params={"max_time_in_seconds": 20})
+    assert df is not None and info["status"] == "OPTIMAL"
+    assert [p["name"] for p in info["phases"]] == ["main", "fairness", "tie_breaks"]
+    assert all(p["status"] == "OPTIMAL" for p in info["phases"])
+    assert info["objective"] == sum(p["objective"] for p in info["phases"])
+    headers = shift_solver.build_day_headers(2026, 2, 28)
+    assert df.set_index("Staff").loc["S2", headers[4]] == "Q1"
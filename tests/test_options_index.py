@@ -0,0 +1,58 @@
+import pandas as pd
+from ortools.sat.python import cp_model
+
+import shift_solver
+
+YEAR, MONTH, NUM_DAYS = 2026, 2, 28
+CLOSED_DAY = 5          # 1-based
+RULES = [
+    {"codes": "Q1", "min": 2, "max": 2},
+    {"codes": "H1", "max": 1},
+]
+
+def presolve_rejects(staff_data, shifts, cell, code, closed_days, rules):
+    """(s, d) 에 code 를 고정한 Stage2 모델을 presolve 만 -> 즉시 INFEASIBLE 인지"""
+    shifts_day, shifts_night = shifts
+    headers = shift_solver.build_day_headers(YEAR, MONTH, NUM_DAYS)
+    table = pd.DataFrame({"Staff": [s["name"] for s in staff_data], **{h: "" for h in headers}})
+    s, d = cell
+    table.loc[s, headers[d]] = code
+    model, _ = shift_solver.build_stage2_model(NUM_DAYS, YEAR, MONTH, {}, table, staff_data,
+                                               shifts_day, shifts_night, closed_days, rules)
+    solver = cp_model.CpSolver()
+    solver.parameters.stop_after_presolve = True
+    solver.parameters.num_workers = 1
+    return solver.Solve(model) == cp_model.INFEASIBLE
+
+def test_closed_day_options_match_model(staff_data, shifts):
+    shifts_day, shifts_night = shifts
+    index = shift_solver.FeasibleOptionsIndex(staff_data, {}, {}, NUM_DAYS, shifts_day, shifts_night,
+                                              [CLOSED_DAY], RULES)
+    d = CLOSED_DAY - 1
+    options = set(index.options_for(0, d))
+    assert "Q1" not in options and "L1" not in options
+    assert "H1" in options
+
+    for code in shifts_day + shifts_night + ["日", shift_solver.OFF_CODE]:
+        assert (code in options) != presolve_rejects(staff_data, shifts, (0, d), code, [CLOSED_DAY], RULES), code
+
+def test_closed_day_unique_rule_only_when_on_closed(staff_data, shifts):
+    shifts_day, shifts_night = shifts
+    d = CLOSED_DAY - 1
+    fixed = {(1, d): "H1"}
+    plain = shift_solver.FeasibleOptionsIndex(staff_data, {}, fixed, NUM_DAYS, shifts_day, shifts_night,
+                                              [CLOSED_DAY], RULES)
+    assert "H1" in plain.options_for(0, d)
+
+    on_closed = [dict(r, on_closed=True) for r in RULES]
+    closed = shift_solver.FeasibleOptionsIndex(staff_data, {}, fixed, NUM_DAYS, shifts_day, shifts_night,
+                                               [CLOSED_DAY], on_closed)
+    assert "H1" not in closed.options_for(0, d)
+
+def test_update_recomputes_same_day(staff_data, shifts):
+    shifts_day, shifts_night = shifts
+    index = shift_solver.FeasibleOptionsIndex(staff_data, {}, {}, NUM_DAYS, shifts_day, shifts_night, [], None)
+    assert "Q1" in index.options_for(1, 10)
+    index.update({(0, 10): "Q1"})
+    assert "Q1" not in index.options_for(1, 10)
+    assert index.options_for(0, 11) == [shift_solver.MYONG_CODE]
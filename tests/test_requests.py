@@ -0,0 +1,41 @@
+import pandas as pd
+
+import shift_solver
+
+YEAR, MONTH, NUM_DAYS = 2026, 2, 28
+PARAMS = {"num_workers": 1, "max_time_in_seconds": 3}     # 희망 거절 여부(1e6 급)는 첫 해 근처에서 정해짐
+
+# S1: 5일 Q1 -> 6일은 明 이어야 하는데 6일 公 희망 (서로 충돌) / S2: 5일 Q1 (Q1 은 하루 1명)
+REQUESTS = {"S1": {5: "Q1", 6: shift_solver.OFF_CODE}, "S2": {5: "Q1"}, "S3": {10: "E1"}}
+
+def solve(staff_data, shifts, request_rules):
+    shifts_day, shifts_night = shifts
+    return shift_solver.solve_stage1(NUM_DAYS, YEAR, MONTH, {}, REQUESTS, staff_data, shifts_day, shifts_night, [],
+                                     None, None, request_rules, params=PARAMS)
+
+def test_hard_requests_conflict_is_infeasible(staff_data, shifts):
+    df, _, info = solve(staff_data, shifts, None)
+    assert df is None and info["status"] == "INFEASIBLE"
+
+def test_soft_requests_report_lowest_priority_denials(staff_data, shifts):
+    df, _, info = solve(staff_data, shifts, shift_solver.default_request_rules())
+    assert info["status"] in ("OPTIMAL", "FEASIBLE")
+    denied = {(r["Staff"], r["希望"]): r for r in info["denied_requests"]}
+    # 公(1e7) > 야근(5e6): S1 은 Q1 을 포기, Q1 은 S2 가 받음. S3 의 주간 희망은 그대로
+    assert set(denied) == {("S1", "Q1")}
+    assert denied[("S1", "Q1")]["weight"] == 5_000_000
+    headers = shift_solver.build_day_headers(YEAR, MONTH, NUM_DAYS)
+    row = df.set_index("Staff")
+    assert row.loc["S2", headers[4]] == "Q1" and row.loc["S1", headers[5]] == shift_solver.OFF_CODE
+    assert row.loc["S3", headers[9]] == "E1"
+
+def test_stage2_denied_fixed_cells(staff_data, shifts):
+    shifts_day, shifts_night = shifts
+    headers = shift_solver.build_day_headers(YEAR, MONTH, NUM_DAYS)
+    table = pd.DataFrame({"Staff": [s["name"] for s in staff_data], **{h: "" for h in headers}})
+    table.loc[1, headers[4]] = "Q1"
+    table.loc[2, headers[4]] = "Q1"
+    _, _, info = shift_solver.solve_stage2(NUM_DAYS, YEAR, MONTH, {}, table, staff_data, shifts_day, shifts_night,
+                                           [], None, None, shift_solver.default_request_rules(), params=PARAMS)
+    assert info["status"] in ("OPTIMAL", "FEASIBLE")
+    assert [(r["日付"], r["希望"]) for r in info["denied_requests"]] == [(headers[4], "Q1")]
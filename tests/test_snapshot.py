@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+import shift_solver
+import snapshot
+
+YEAR, MONTH, NUM_DAYS = 2026, 2, 28
+
+@pytest.fixture
+def stage1_args(staff_data, shifts):
+    shifts_day, shifts_night = shifts
+    requests = {"S1": {3: shift_solver.OFF_CODE, 10: "E1"}, "S2": {5: "Q1"}}
+    fairness = {"weight": 10000, "history": {"S1": {"Q1": 2, shift_solver.WEEKEND_KEY: 1}}}
+    return (NUM_DAYS, YEAR, MONTH, {"S0": {"d-3": "E1", "d-2": "Q1", "d-1": shift_solver.MYONG_CODE}}, requests,
+            staff_data, shifts_day, shifts_night, [7], None, "onehot", None, fairness)
+
+def test_stage1_round_trip(stage1_args, tmp_path):
+    path = tmp_path / "s1.snap"
+    path.write_bytes(snapshot.save_snapshot("stage1", stage1_args, {"status": "OPTIMAL", "objective": 1.0}))
+    meta, args = snapshot.load_snapshot(str(path))
+    assert meta["stage"] == "stage1"
+    assert meta["run_info"]["objective"] == 1.0
+    assert args == stage1_args          # requests 의 day(int) 키 / fairness dict 까지 그대로
+
+def test_stage2_round_trip(stage1_args):
+    headers = shift_solver.build_day_headers(YEAR, MONTH, NUM_DAYS)
+    table = pd.DataFrame({"Staff": [s["name"] for s in stage1_args[5]], **{h: "" for h in headers}})
+    table.loc[0, headers[0]] = "Q1"
+    args = (*stage1_args[:4], table, *stage1_args[5:])
+    _, loaded = snapshot.load_snapshot(snapshot.save_snapshot("stage2", args))
+    pd.testing.assert_frame_equal(loaded[4], table)
+    assert loaded[:4] == args[:4] and loaded[5:] == args[5:]
+
+def test_old_snapshot_without_new_args_loads_as_none(stage1_args):
+    # coverage_rules 이후 인자가 없던 예전 스냅샷 = 기본값(None)
+    meta, args = snapshot.load_snapshot(snapshot.save_snapshot("stage1", stage1_args[:9]))
+    assert args[:9] == stage1_args[:9]
+    assert args[9:] == (None, None, None, None)
+
+def test_one_worker_run_replays_exactly(stage1_args, tmp_path):
+    _, _, info = shift_solver.solve_stage1(*stage1_args, params={"num_workers": 1, "max_time_in_seconds": 2})
+    assert info["objective"] is not None
+    (tmp_path / "a.snap").write_bytes(snapshot.save_snapshot("stage1", stage1_args, info))
+
+    meta, replayed = snapshot.replay_snapshot(str(tmp_path / "a.snap"))
+    assert replayed["replay"] == "exact"
+    assert replayed["objective"] == info["objective"]
+
+    _, df, _, exact = snapshot.reproduce_snapshot(str(tmp_path / "a.snap"))
+    assert exact["objective"] == info["objective"] and df is not None
+
+def test_bench_does_not_count_time_limited_runs(stage1_args, tmp_path):
+    # 저장 목적값을 도달 불가능하게 낮게 -> 다시 풀면 반드시 "악화"
+    base = {"objective": -1e12, "params": {"num_workers": 2, "max_time_in_seconds": 2}}
+    (tmp_path / "limited.snap").write_bytes(snapshot.save_snapshot(
+        "stage1", stage1_args, {**base, "status": "FEASIBLE", "hit_time_limit": True}))
+    (tmp_path / "optimal.snap").write_bytes(snapshot.save_snapshot(
+        "stage1", stage1_args, {**base, "status": "OPTIMAL", "hit_time_limit": False}))
+
+    df = snapshot.bench(str(tmp_path)).set_index("file")
+    assert df.loc["limited.snap", "check"] == "time-limited"
+    assert df.loc["limited.snap", "worse"] and not df.loc["limited.snap", "regressed"]
+    assert df.loc["optimal.snap", "check"] == "solve"
+    assert df.loc["optimal.snap", "regressed"]
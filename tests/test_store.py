@@ -0,0 +1,71 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import shift_solver
+import store
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "store.sqlite3")
+
+def schedule_df(year, month, names, code_of):
+    num_days = pd.Period(f"{year}-{month:02d}").days_in_month
+    headers = shift_solver.build_day_headers(year, month, num_days)
+    return pd.DataFrame({"Staff": names, **{h: [code_of(n, d + 1) for n in names] for d, h in enumerate(headers)}}), headers
+
+def test_publish_then_open_next_month(db_path, staff_data):
+    conn = store.connect(db_path)
+    store.save_staff(conn, staff_data)
+    store.save_requests(conn, 2026, 2, {"S1": {3: shift_solver.OFF_CODE, 10: "E1"}})
+    names = [s["name"] for s in staff_data]
+    # S0 은 1/29 Q1 -> 1/30 明, S1 은 1/31 빈칸 (기록 없으면 公)
+    codes = {("S0", 29): "Q1", ("S0", 30): shift_solver.MYONG_CODE, ("S1", 31): ""}
+    df, headers = schedule_df(2026, 1, names, lambda n, d: codes.get((n, d), "E1"))
+    n = store.publish_schedule(conn, 2026, 1, df, headers, {"status": "OPTIMAL"})
+    assert n == len(names) * 31 - 1
+
+    month = store.open_month(conn, 2026, 2)
+    assert [s["name"] for s in month["staff"]] == names
+    assert month["requests"] == {"S1": {3: shift_solver.OFF_CODE, 10: "E1"}}
+    assert month["prev_history"]["S0"] == {"d-3": "Q1", "d-2": shift_solver.MYONG_CODE, "d-1": "E1"}
+    assert month["prev_history"]["S1"] == {"d-3": "E1", "d-2": "E1", "d-1": shift_solver.OFF_CODE}
+    assert month["prev_history"] == store.load_prev_history(conn, 2026, 2)
+    assert [row[:3] for row in store.list_published(conn)] == [(store.DEFAULT_PROPERTY, 2026, 1)]
+
+def test_publish_replaces_month(db_path, staff_data):
+    conn = store.connect(db_path)
+    names = [s["name"] for s in staff_data]
+    df, headers = schedule_df(2026, 3, names, lambda n, d: "E1")
+    store.publish_schedule(conn, 2026, 3, df, headers)
+    df, headers = schedule_df(2026, 3, names[:2], lambda n, d: "H1")
+    store.publish_schedule(conn, 2026, 3, df, headers)
+    sched = store.load_schedule(conn, 2026, 3)
+    assert set(sched) == set(names[:2])
+    assert {c for mp in sched.values() for c in mp.values()} == {"H1"}
+
+def test_concurrent_request_saves_do_not_mix(db_path):
+    # 세션마다 연결 1개: DELETE+INSERT 교체가 서로 섞이지 않음 (결과는 어느 한쪽 그대로)
+    store.connect(db_path).close()
+    payloads = [{f"A{i}": {d: "E1" for d in range(1, 29)} for i in range(5)},
+                {f"B{i}": {d: "H1" for d in range(1, 29)} for i in range(7)}]
+    errors = []
+
+    def writer(payload):
+        conn = store.connect(db_path)
+        try:
+            for _ in range(30):
+                store.save_requests(conn, 2026, 2, payload)
+        except Exception as e:  # pragma: no cover - 실패 시 원인 표시용
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=writer, args=(p,)) for p in payloads]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert store.load_requests(store.connect(db_path), 2026, 2) in payloads